@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+"""
+Measure pdbox commands offline, against the in-memory pdbox.fake.FakeDropbox
+or a pdbox.backend.LocalBackend in a temporary folder, with simulated
+latency and bandwidth, on synthetic trees of each of the given numbers of
+entries.
+
+Results are printed and can be saved as JSON. Comparing against a saved
+run fails (with exit status 1) if any rate has dropped by more than the
+threshold, so a baseline can be kept to catch regressions locally:
+
+    bench/commands.py --save baseline.json
+    bench/commands.py --compare baseline.json
+
+usage: bench/commands.py [-h] [--backend {fake,local}] [--entries N[,N...]]
+                         [--latency MS] [--bandwidth MB/S] [--workers N]
+                         [--files N] [--file-kb KB] [--hash-mb MB]
+                         [--save PATH] [--compare PATH]
+                         [--threshold FRACTION]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdbox  # noqa
+import pdbox.backend  # noqa
+import pdbox.hashing as hashing  # noqa
+import pdbox.metadata  # noqa
+import pdbox.parsing  # noqa
+from pdbox.fake import FakeDropbox, Session  # noqa
+
+# Number of files in each folder of a synthetic tree.
+FOLDER_SIZE = 100
+# Most paths that the metadata-heavy commands are given.
+MAX_PATHS = 1000
+
+
+class Throttled(object):
+    """
+    Wrap a backend so that every API call takes latency seconds, plus the
+    time to send or receive its payload at bandwidth bytes per second.
+    Calls on different threads are slowed down independently, like requests
+    on separate connections. The number of calls is in calls.
+    """
+    def __init__(self, dbx, latency, bandwidth):
+        self.dbx = dbx
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.dbx, name)
+        if not name.startswith("files_"):
+            return attr
+
+        def call(*args, **kwargs):
+            with self.lock:
+                self.calls += 1
+            result = attr(*args, **kwargs)
+            nbytes = sum(len(a) for a in args if isinstance(a, bytes))
+            if isinstance(result, tuple):  # A download's response.
+                meta, _ = result
+                nbytes += meta.size
+            time.sleep(self.latency + nbytes / float(self.bandwidth))
+            return result
+        return call
+
+
+def seed(dbx, n, size=1024):
+    """
+    Fill the FakeDropbox or LocalBackend dbx with a tree of about n entries
+    under /bench, in folders of FOLDER_SIZE files of size bytes each.
+    Returns the paths of the files.
+    """
+    data = b"x" * size
+    session = Session()
+    session.append(0, data)
+    content_hash = session.hash()
+    local = isinstance(dbx, pdbox.backend.LocalBackend)
+    files = []
+    for i in range(max(n // (FOLDER_SIZE + 1), 1)):
+        folder = "/bench/d%05d" % i
+        if local:  # Straight onto disk, which is much quicker.
+            os.makedirs(dbx.root + folder)
+        else:
+            if not i:
+                dbx.add_folder("/bench")
+            dbx.add_folder(folder)
+        for j in range(FOLDER_SIZE):
+            path = "%s/f%07d" % (folder, len(files))  # Unique names.
+            if local:
+                with open(dbx.root + path, "wb") as f:
+                    f.write(data)
+            else:
+                dbx.add_file(path, size, content_hash)
+                dbx.data[path.lower()] = data
+            files.append(path)
+    return files
+
+
+def run(argv):
+    """
+    Run the pdbox command line argv as a fresh command, with its output
+    thrown away, and return how many seconds it took.
+    Raises: AssertionError if the command fails.
+    """
+    sys.argv = ["pdbox"] + argv
+    kwargs = vars(pdbox.parsing.parse_args())
+    pdbox._args = kwargs
+    pdbox.metadata.reset_memo()
+    stdout = sys.stdout
+    start = time.time()
+    try:
+        with open(os.devnull, "w") as sys.stdout:
+            success = kwargs["func"]()
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - start
+    assert success, "pdbox %s failed" % argv[0]
+    return elapsed
+
+
+def bench_tree(dbx, n, args, folder, results):
+    """Measure each command on a tree of n entries in the backend dbx."""
+    common = ["-q", "-w", str(args.workers)]
+    files = seed(dbx.dbx, n, args.file_kb * 1024)
+
+    def record(name, count, unit, seconds, calls):
+        key = "%s (%d entries)" % (name, n)
+        results[key] = {
+            "seconds": round(seconds, 4),
+            "rate": round(count / seconds, 2),
+            "unit": unit,
+            "requests": calls,
+        }
+        print("%-36s %10.2f %-10s %8.2fs %7d requests" % (
+            key, count / seconds, unit, seconds, calls,
+        ))
+
+    def measure(name, count, unit, argv):
+        calls = dbx.calls
+        seconds = run(argv)
+        record(name, count, unit, seconds, dbx.calls - calls)
+
+    measure("ls -r", len(files) + len(files) // FOLDER_SIZE, "entries/s", [
+        "ls", "-r", "dbx://bench",
+    ])
+
+    # Metadata-heavy commands on many paths at once.
+    step = max(len(files) // MAX_PATHS, 1) * 2
+    dbx.files_create_folder_v2("/moved")
+    moved = files[::step][:MAX_PATHS // 2]
+    measure("mv (paths)", len(moved), "paths/s", ["mv"] + common + [
+        "dbx:/%s" % path for path in moved
+    ] + ["dbx://moved"])
+    deleted = files[1::step][:MAX_PATHS // 2]
+    measure("rm (paths)", len(deleted), "paths/s", ["rm"] + common + [
+        "dbx:/%s" % path for path in deleted
+    ])
+
+    # Whole trees up and down.
+    nfiles = min(n, args.files)
+    local = os.path.join(folder, "up%d" % n)
+    os.mkdir(local)
+    data = os.urandom(args.file_kb * 1024)
+    for i in range(nfiles):
+        sub = os.path.join(local, "d%05d" % (i // FOLDER_SIZE))
+        if not os.path.isdir(sub):
+            os.mkdir(sub)
+        with open(os.path.join(sub, "f%03d" % (i % FOLDER_SIZE)), "wb") as f:
+            f.write(data)
+    measure("cp -r up", nfiles, "files/s", ["cp", "-r"] + common + [
+        local, "dbx://up%d" % n,
+    ])
+    down = os.path.join(folder, "down%d" % n)
+    measure("cp -r down", nfiles, "files/s", ["cp", "-r"] + common + [
+        "dbx://up%d" % n, down,
+    ])
+    shutil.rmtree(local)
+    shutil.rmtree(down)
+
+
+def bench_hashing(args, folder, results):
+    """Measure content hashing throughput."""
+    path = os.path.join(folder, "hash")
+    with open(path, "wb") as f:
+        block = os.urandom(hashing.BLOCK)
+        for _ in range(args.hash_mb * 1024 * 1024 // hashing.BLOCK):
+            f.write(block)
+    hashing.content_hashes([path])  # Warm the page cache.
+    start = time.time()
+    hashing.content_hashes([path], workers=args.workers)
+    seconds = time.time() - start
+    rate = args.hash_mb / 1024.0 / seconds
+    results["hashing (%d MB)" % args.hash_mb] = {
+        "seconds": round(seconds, 4),
+        "rate": round(rate, 2),
+        "unit": "GB/s",
+        "requests": 0,
+    }
+    print("%-36s %10.2f %-10s %8.2fs" % (
+        "hashing (%d MB)" % args.hash_mb, rate, "GB/s", seconds,
+    ))
+    os.remove(path)
+
+
+def compare(results, baseline, threshold):
+    """
+    Print every rate that dropped by more than threshold (a fraction) since
+    baseline, and return whether there were none.
+    """
+    ok = True
+    for key, result in sorted(results.items()):
+        before = baseline.get(key)
+        if not before:
+            continue
+        if result["rate"] < before["rate"] * (1 - threshold):
+            print("REGRESSION: %s: %.2f %s, down from %.2f" % (
+                key, result["rate"], result["unit"], before["rate"],
+            ))
+            ok = False
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure pdbox commands against a local Dropbox stand-in",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["fake", "local"],
+        default="fake",
+        help="keep the trees in memory, or in a folder on disk",
+    )
+    parser.add_argument(
+        "--entries",
+        default="1000,10000",
+        help="comma-separated sizes of the synthetic trees",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=5,
+        help="milliseconds that every request takes",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=50,
+        help="MB/s that each request sends or receives at",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=pdbox.DEFAULT_WORKERS,
+        help="number of files to transfer concurrently",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=1000,
+        help="most files to copy up and down for each tree",
+    )
+    parser.add_argument(
+        "--file-kb",
+        type=int,
+        default=4,
+        help="size of each file in KB",
+    )
+    parser.add_argument(
+        "--hash-mb",
+        type=int,
+        default=256,
+        help="size of the file to hash in MB",
+    )
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument(
+        "--compare",
+        help="fail if any rate dropped since the results in this JSON file",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fraction that a rate may drop by before --compare fails",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pdbox._logger.setLevel(logging.ERROR)
+    folder = tempfile.mkdtemp()
+    # Keep pdbox's state out of the real data directory.
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(folder, "tmp")
+    pdbox.HASH_CACHE_PATH = os.path.join(folder, "hashes.db")
+    pdbox.UPLOADS_PATH = os.path.join(folder, "uploads.db")
+    pdbox.CHUNKSIZE_PATH = os.path.join(folder, "chunksize")
+    argv = sys.argv
+    results = {}
+    try:
+        os.mkdir(pdbox.TMP_DOWNLOAD_DIR)
+        for n in [int(n) for n in args.entries.split(",")]:
+            if args.backend == "local":
+                root = os.path.join(folder, "dropbox%d" % n)
+                dbx = pdbox.backend.LocalBackend(root)
+            else:
+                dbx = FakeDropbox()
+                dbx.page = 2000  # Dropbox's listings are about this long.
+            pdbox.dbx = Throttled(
+                dbx,
+                args.latency / 1000.0,
+                args.bandwidth * 1024 * 1024,
+            )
+            bench_tree(pdbox.dbx, n, args, folder, results)
+        bench_hashing(args, folder, results)
+    finally:
+        sys.argv = argv
+        for db in [pdbox.hashes, pdbox.uploads]:
+            if db:
+                db.db.close()
+        shutil.rmtree(folder)
+
+    output = {
+        "python": platform.python_version(),
+        "latency": args.latency,
+        "bandwidth": args.bandwidth,
+        "workers": args.workers,
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Measure content hashing throughput in GB/s, comparing the parallel engine
+in pdbox.hashing against the original one-block-at-a-time implementation.
+
+usage: bench/hashing.py [size in MB] [number of small files]
+"""
+
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdbox.hashing as hashing  # noqa
+
+
+def sequential(path):
+    """The content hash as LocalFile.hash used to compute it."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(hashing.BLOCK)
+            if not chunk:
+                break
+            hasher.update(hashlib.sha256(chunk).digest())
+    return hasher.hexdigest()
+
+
+def measure(name, func, paths, nbytes):
+    """Run func on paths, print its throughput and return its result."""
+    start = time.time()
+    result = func(paths)
+    elapsed = time.time() - start
+    print("%-28s %6.2f GB/s" % (name, nbytes / elapsed / 1024 ** 3))
+    return result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    nsmall = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    folder = tempfile.mkdtemp()
+    try:
+        large = os.path.join(folder, "large")
+        with open(large, "wb") as f:
+            block = os.urandom(hashing.BLOCK)
+            for _ in range(size * 1024 * 1024 // hashing.BLOCK):
+                f.write(block)
+        small = []
+        for i in range(nsmall):
+            small.append(os.path.join(folder, "small%d" % i))
+            with open(small[-1], "wb") as f:
+                f.write(os.urandom(64 * 1024))
+
+        for paths, label in [([large], "%d MB file" % size),
+                             (small, "%d x 64 KB files" % nsmall)]:
+            nbytes = sum(os.path.getsize(p) for p in paths)
+            # Warm the page cache so that the disk isn't being measured.
+            for path in paths:
+                sequential(path)
+            print(label)
+            expected = measure(
+                "  sequential",
+                lambda paths: dict((p, sequential(p)) for p in paths),
+                paths,
+                nbytes,
+            )
+            for workers in sorted(set([1, 2, 4, multiprocessing.cpu_count()])):
+                result = measure(
+                    "  pdbox.hashing, %d worker(s)" % workers,
+                    lambda paths: hashing.content_hashes(paths, workers),
+                    paths,
+                    nbytes,
+                )
+                assert result == expected
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,7 @@
 import appdirs
-import dropbox
 import logging
 import os.path
 
-from . import auth
-
 _logger = logging.getLogger("pdbox")
 _handler = logging.StreamHandler()
 _formatter = logging.Formatter("%(levelname)s: %(message)s")
@@ -17,8 +14,33 @@ _logger.addHandler(_handler)
 TOKEN_PATH = os.path.join(appdirs.user_data_dir("pdbox"), "pdbox_token")
 # The directory in which to store downloads before moving them.
 TMP_DOWNLOAD_DIR = os.path.join(appdirs.user_data_dir("pdbox"), "tmp")
-# dropbox.Dropbox to be populated on login.
+# The path to the remote metadata cache.
+CACHE_PATH = os.path.join(appdirs.user_data_dir("pdbox"), "metadata.db")
+# The path to the local file hash cache.
+HASH_CACHE_PATH = os.path.join(appdirs.user_data_dir("pdbox"), "hashes.db")
+# The path to the journal of uploads in progress.
+UPLOADS_PATH = os.path.join(appdirs.user_data_dir("pdbox"), "uploads.db")
+# The path to the chunk size that --chunksize auto settled on last time.
+CHUNKSIZE_PATH = os.path.join(appdirs.user_data_dir("pdbox"), "chunksize")
+# Number of concurrent transfers when --workers isn't given.
+DEFAULT_WORKERS = 8
+# Number of times to retry a request that fails for a transient reason when
+# --retries isn't given.
+DEFAULT_RETRIES = 5
+# Backend to be populated on login: backend.DropboxBackend, or a
+# backend.LocalBackend for a local folder.
 dbx = None
+# requests.Session shared by everything that dbx does, created on login to
+# Dropbox.
+session = None
+# cache.MetadataCache to be populated on login if --cache is set.
+snapshot = None
+# cache.HashCache to be opened on first use.
+hashes = None
+# cache.UploadJournal to be opened on first use.
+uploads = None
+# metadata.MetadataMemo for the current command, created on first use.
+memo = None
 # Place to store the command-line arguments.
 _args = {}
 
@@ -26,12 +48,42 @@ _args = {}
 def init(**kwargs):
     """
     Log into Dropbox and set some global variables.
+    Nothing but what's needed to parse arguments is imported until now, so
+    that runs are quick to start.
     Raises: AssertionError
     """
-    global _args, dbx
+    from pdbox import backend
+
+    global _args, dbx, session, snapshot
     _args = kwargs
-    token = auth.get_token()
-    dbx = dropbox.Dropbox(token, timeout=None)
+    if not os.path.exists(TMP_DOWNLOAD_DIR):
+        os.makedirs(TMP_DOWNLOAD_DIR)  # This creates TOKEN_PATH's parent too.
+    if _args.get("local"):
+        dbx = backend.LocalBackend(_args["local"])
+        token = "local:%s" % dbx.root  # Keeps its metadata cache separate.
+    else:
+        from pdbox import auth, utils
+        token = auth.get_token()
+        session = utils.session()
+        # utils.execute does the retrying, so that it can be limited.
+        dbx = backend.DropboxBackend(
+            token,
+            timeout=None,
+            session=session,
+            max_retries_on_error=0,
+            max_retries_on_rate_limit=0,
+        )
+
+    if _args.get("cache"):
+        from pdbox import cache
+        snapshot = cache.MetadataCache(CACHE_PATH, token)
+        if not snapshot.ready() or _args.get("stale"):
+            # Build the snapshot or catch it up in the background. Until it's
+            # ready, metadata comes from Dropbox, and an unfinished build is
+            # picked up again by the next run.
+            cache.refresh_in_background(snapshot)
+        elif not cache.refresh(snapshot):
+            snapshot = None  # Don't serve out of date metadata.
 
 
 def debug(s):
@@ -56,13 +108,3 @@ def error(s):
     """Log an error message."""
     if not _args.get("quiet") and not _args.get("only_show_errors"):
         _logger.error(s)
-
-
-if not os.path.exists(TMP_DOWNLOAD_DIR):
-    os.makedirs(TMP_DOWNLOAD_DIR)  # This creates TOKEN_PATH's parent too.
-
-
-from . import parsing  # noqa
-from . import auth  # noqa
-from . import models  # noqa
-from . import cli  # noqa
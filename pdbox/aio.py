@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import os
+import pdbox
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor
+from dropbox.files import DeletedMetadata
+from pdbox.models import LocalFile, RemoteFolder, get_remote
+from pdbox.utils import DropboxError, dbx_uri, execute, normpath, workers
+
+
+class Engine(object):
+    """
+    Drive a backend from an asyncio event loop: every method is a coroutine,
+    and any number of them can be in flight at once. At most limit requests
+    or transfers run at a time, on the engine's own threads, and the rest
+    wait on the event loop without tying up a thread. Requests are retried
+    like everywhere else.
+    The backend is pdbox.dbx unless dbx is given. pdbox.init's HTTP session
+    keeps up to --workers connections alive, so init with workers=limit to
+    keep one for every request:
+
+        pdbox.init(workers=64)
+        async with pdbox.aio.Engine(limit=64) as engine:
+            remotes = await asyncio.gather(*map(engine.get_remote, paths))
+
+    Nothing is served from the metadata cache or remembered between calls.
+    This needs Python 3.5 or newer.
+    """
+    def __init__(self, dbx=None, limit=None):
+        self.dbx = dbx or pdbox.dbx
+        self.limit = max(limit or workers(), 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.limit)
+        self.semaphore = None  # Created on the event loop that uses it.
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop the engine's threads once they're done."""
+        self.executor.shutdown(wait=True)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Call the blocking func with args and kwargs on one of the engine's
+        threads once fewer than limit calls are running, and return what it
+        returns.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor,
+                functools.partial(func, *args, **kwargs),
+            )
+
+    async def request(self, name, *args, **kwargs):
+        """
+        Call the backend method name with args and kwargs, through execute.
+        Raises: DropboxError
+        """
+        return await self.run(
+            execute,
+            getattr(self.dbx, name),
+            *args,
+            **kwargs
+        )
+
+    async def get_remote(self, path):
+        """
+        Get a RemoteFile or RemoteFolder from path.
+        Raises: ValueError
+        """
+        path = normpath(path)
+        if path == "/":  # get_metadata on the root is not supported.
+            return RemoteFolder(path)
+        try:
+            meta = await self.request("files_get_metadata", path)
+        except DropboxError:
+            raise ValueError("%s could not be found" % dbx_uri(path))
+        return get_remote(None, meta=meta)
+
+    async def contents(self, path, recursive=False):
+        """
+        Get the RemoteFiles and RemoteFolders inside the folder at path, or
+        everything underneath it if recursive is set.
+        Raises: DropboxError
+        """
+        path = normpath(path)
+        # list_folder on "/" isn't supported for some reason.
+        result = await self.request(
+            "files_list_folder",
+            "" if path == "/" else path,
+            recursive=recursive,
+        )
+        metas = list(result.entries)
+        while result.has_more:
+            result = await self.request(
+                "files_list_folder_continue",
+                result.cursor,
+            )
+            metas.extend(result.entries)
+        # A recursive listing includes the folder itself.
+        return [
+            get_remote(None, meta=meta) for meta in metas
+            if not isinstance(meta, DeletedMetadata) and
+            meta.path_lower != path.lower()
+        ]
+
+    async def upload(self, src, dest, overwrite=False):
+        """
+        Upload the local file or folder src to dest, and return the
+        RemoteFile or RemoteFolder. The files in a folder are uploaded
+        concurrently. Anything at dest is replaced if overwrite is set.
+        Raises:
+        - ValueError
+        - DropboxError
+        """
+        dest = normpath(dest)
+        if not await self.run(os.path.isdir, src):
+            local = await self.run(LocalFile, src)
+            return await self.run(local.send, dest, overwrite, self.dbx)
+
+        uploads = []
+        for folder, folders, files in await self.run(walk, src):
+            rel = os.path.relpath(folder, src).replace(os.path.sep, "/")
+            prefix = dest if rel == "." else "%s/%s" % (dest, rel)
+            if not folders and not files:  # Dropbox makes folders for files.
+                uploads.append(self.mkdir(prefix))
+            for name in files:
+                uploads.append(self.upload(
+                    os.path.join(folder, name),
+                    "%s/%s" % (prefix, name),
+                    overwrite,
+                ))
+        await asyncio.gather(*uploads)
+        return await self.get_remote(dest)
+
+    async def mkdir(self, path):
+        """
+        Create a folder at path, unless there's already one there.
+        Raises: DropboxError
+        """
+        try:
+            result = await self.request("files_create_folder_v2", path)
+        except DropboxError as e:
+            error = e.args[0]
+            if not (
+                getattr(error, "is_path", lambda: False)() and
+                error.get_path().is_conflict() and
+                error.get_path().get_conflict().is_folder()
+            ):
+                raise
+            return await self.get_remote(path)
+        return get_remote(None, meta=result.metadata)
+
+    async def download(self, src, dest, overwrite=False):
+        """
+        Download the file or folder at src to dest locally. The files in a
+        folder are downloaded concurrently. Files at dest are replaced if
+        overwrite is set.
+        Raises:
+        - ValueError
+        - DropboxError
+        """
+        remote = await self.get_remote(src)
+        dest = os.path.abspath(dest)
+        if not isinstance(remote, RemoteFolder):
+            await self.fetch(remote, dest, overwrite)
+            return
+
+        entries = await self.contents(remote.path, recursive=True)
+        # Only the last component of path_display is guaranteed to have the
+        # right case, so local paths are built up from each entry's name.
+        folders = {remote.path.lower().rstrip("/"): dest}
+        for e in sorted(
+                filter(lambda e: isinstance(e, RemoteFolder), entries),
+                key=lambda e: e.path.count("/"),
+        ):
+            folders[e.path.lower()] = os.path.join(
+                folders[e.parent.lower()],
+                e.name,
+            )
+        await self.run(makedirs, *sorted(folders.values()))
+        await asyncio.gather(*[
+            self.fetch(
+                e,
+                os.path.join(folders[e.parent.lower()], e.name),
+                overwrite,
+            )
+            for e in entries if not isinstance(e, RemoteFolder)
+        ])
+
+    async def fetch(self, remote, dest, overwrite):
+        """
+        Download the RemoteFile remote to dest.
+        Raises:
+        - ValueError
+        - DropboxError
+        """
+        if not overwrite and await self.run(os.path.exists, dest):
+            raise ValueError("%s already exists" % dest)
+        staged = await self.run(remote.stage, self.dbx)
+        await self.run(makedirs, os.path.dirname(dest))
+        await self.run(shutil.move, staged, dest)
+        pdbox.info("Downloaded %s to %s" % (remote.uri, dest))
+
+    async def copy(self, src, dest):
+        """
+        Copy the file or folder at src to dest, and return the copy.
+        Raises: DropboxError
+        """
+        result = await self.request(
+            "files_copy_v2",
+            normpath(src),
+            normpath(dest),
+        )
+        pdbox.info("Copied %s to %s" % (dbx_uri(src), dbx_uri(dest)))
+        return get_remote(None, meta=result.metadata)
+
+    async def move(self, src, dest):
+        """
+        Move the file or folder at src to dest, and return it.
+        Raises: DropboxError
+        """
+        result = await self.request(
+            "files_move_v2",
+            normpath(src),
+            normpath(dest),
+        )
+        pdbox.info("Moved %s to %s" % (dbx_uri(src), dbx_uri(dest)))
+        return get_remote(None, meta=result.metadata)
+
+    async def delete(self, path):
+        """
+        Delete the file or folder at path.
+        Raises: DropboxError
+        """
+        await self.request("files_delete_v2", normpath(path))
+        pdbox.info("Deleted %s" % dbx_uri(path))
+
+
+def walk(top):
+    """Walk the folder top, all at once."""
+    return list(os.walk(top))
+
+
+def makedirs(*paths):
+    """Create the folders at paths, and their parents, unless they exist."""
+    for path in paths:
+        if not os.path.isdir(path):
+            os.makedirs(path)
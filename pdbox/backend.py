@@ -0,0 +1,732 @@
+import collections
+import datetime
+import dropbox
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import uuid
+
+from dropbox.async_ import PollError
+from dropbox.files import (
+    CreateFolderError,
+    CreateFolderResult,
+    DeleteBatchLaunch,
+    DeleteBatchResult,
+    DeleteBatchResultData,
+    DeleteBatchResultEntry,
+    DeletedMetadata,
+    DeleteError,
+    DeleteResult,
+    DownloadError,
+    FileMetadata,
+    FolderMetadata,
+    GetMetadataError,
+    ListFolderContinueError,
+    ListFolderError,
+    ListFolderResult,
+    LookupError,
+    MetadataV2,
+    RelocationBatchErrorEntry,
+    RelocationBatchResultEntry,
+    RelocationBatchV2Launch,
+    RelocationBatchV2Result,
+    RelocationError,
+    RelocationResult,
+    SearchError,
+    SearchMatchV2,
+    SearchOptions,
+    SearchV2Result,
+    UploadError,
+    UploadSessionFinishError,
+    UploadSessionLookupError,
+    UploadSessionOffsetError,
+    UploadSessionStartResult,
+    UploadWriteFailed,
+    WriteConflictError,
+    WriteError,
+    WriteMode,
+)
+
+# Name of the folder inside a LocalBackend's root where its own state is kept.
+# It's hidden from everything else.
+STATE = ".pdbox"
+# Number of entries in each page of a LocalBackend listing.
+PAGE_SIZE = 2000
+# Number of unfinished listings that a LocalBackend keeps the rest of.
+MAX_LISTINGS = 64
+
+
+class DropboxBackend(dropbox.Dropbox):
+    """
+    The real Dropbox, through the SDK.
+    A backend is anything with the dropbox.Dropbox methods that pdbox uses,
+    taking the same arguments and returning the same values or raising the
+    same dropbox.exceptions.ApiError errors:
+    - files_get_metadata
+    - files_list_folder, files_list_folder_continue
+    - files_search_v2, files_search_continue_v2
+    - files_create_folder_v2
+    - files_upload
+    - files_upload_session_start, files_upload_session_append_v2,
+      files_upload_session_finish
+    - files_download
+    - files_delete_v2, files_copy_v2, files_move_v2
+    - files_delete_batch, files_delete_batch_check
+    - files_copy_batch_v2, files_copy_batch_check_v2
+    - files_move_batch_v2, files_move_batch_check_v2
+    """
+    pass
+
+
+class LocalBackend(object):
+    """
+    A backend that keeps everything in a local folder, emulating Dropbox:
+    - Paths are case-insensitive, and names keep the case they were
+      created with.
+    - Files have content hashes, and revisions that change whenever they
+      do. Only the latest revision of a file can be downloaded.
+    - Cursors pick up every change made through a LocalBackend on the same
+      folder since they were handed out, including from other processes,
+      but not changes made to the folder behind its back.
+    - Upload sessions outlive the process that started them.
+    - Batch jobs finish before they're launched.
+    - Downloads honour Range headers.
+    - Searches only match names, and find a name when every word of the
+      query is in it.
+    The log of changes and the upload sessions are kept in STATE, inside
+    the folder.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.state = os.path.join(self.root, STATE)
+        self.log = os.path.join(self.state, "log")
+        self.sessions = os.path.join(self.state, "sessions")
+        for folder in [self.root, self.state, self.sessions]:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        self.lock = threading.RLock()
+        # The rest of each unfinished listing, keyed by its ID.
+        self.listings = collections.OrderedDict()
+
+    def resolve(self, path):
+        """
+        Find the local path of path, matching the names that exist whatever
+        their case. Returns the local path, the path with the case of the
+        names that exist, and whether it exists.
+        """
+        local, display = self.root, ""
+        names = [name for name in path.split("/") if name]
+        for i, name in enumerate(names):
+            if i == 0 and name.lower() == STATE:
+                return os.path.join(local, *names), path, False
+            if not os.path.exists(os.path.join(local, name)):
+                try:
+                    found = [
+                        n for n in os.listdir(local)
+                        if n.lower() == name.lower()
+                    ]
+                except OSError:  # local is a file, or doesn't exist.
+                    found = []
+                if not found:
+                    rest = names[i:]
+                    return (
+                        os.path.join(local, *rest),
+                        "/".join([display] + rest),
+                        False,
+                    )
+                name = found[0]
+            local = os.path.join(local, name)
+            display += "/" + name
+        return local, display or "/", True
+
+    def metadata(self, local, display, digest=None):
+        """
+        Get the metadata of what's at local, whose path is display. Files are
+        hashed unless their content hash digest is given.
+        """
+        st = os.stat(local)
+        name = display.rsplit("/", 1)[-1]
+        if stat.S_ISDIR(st.st_mode):
+            return FolderMetadata(
+                name=name,
+                id="id:%x" % st.st_ino,
+                path_lower=display.lower(),
+                path_display=display,
+            )
+        if digest is None:
+            digest = content_hashes([local])[local]
+        return FileMetadata(
+            name=name,
+            id="id:%x" % st.st_ino,
+            client_modified=utc(st.st_mtime),
+            server_modified=utc(st.st_ctime),
+            rev=rev(st),
+            size=st.st_size,
+            path_lower=display.lower(),
+            path_display=display,
+            content_hash=digest,
+        )
+
+    def metadatas(self, pairs):
+        """
+        Get the metadata of every (local path, display path) in pairs,
+        hashing all of the files at once. Anything that's gone is left out.
+        """
+        files = [local for local, _ in pairs if os.path.isfile(local)]
+        digests = content_hashes(files)
+        metas = []
+        for local, display in pairs:
+            try:
+                metas.append(self.metadata(
+                    local,
+                    display,
+                    digests.get(local),
+                ))
+            except OSError:  # Deleted since.
+                pass
+        return metas
+
+    def lookup(self, path, error):
+        """
+        Get the local path and path with its real case of what exists at
+        path, or raise the error built by error from LookupError.not_found.
+        Raises: dropbox.exceptions.ApiError
+        """
+        local, display, exists = self.resolve(path)
+        if not exists or display == "/":
+            raise api_error(error(LookupError.not_found))
+        return local, display
+
+    def changed(self, display):
+        """Log a change to the file or folder at display for cursors."""
+        with self.lock:
+            with open(self.log, "a") as f:
+                f.write(json.dumps({"path": display}) + "\n")
+
+    def position(self):
+        """Get the position of the end of the change log."""
+        try:
+            return os.path.getsize(self.log)
+        except OSError:
+            return 0
+
+    def changes(self, position):
+        """
+        Get the paths that changed since position in the change log, in the
+        order that they last changed, and the position of the end.
+        """
+        paths = collections.OrderedDict()
+        with self.lock:
+            with open(self.log, "a+") as f:
+                f.seek(position)
+                for line in f:
+                    path = json.loads(line)["path"]
+                    paths.pop(path.lower(), None)
+                    paths[path.lower()] = path
+                end = f.tell()
+        return list(paths.values()), end
+
+    def scan(self, local, display, recursive):
+        """
+        Get (local path, display path) for everything inside the folder
+        local, whose path is display, with folders before their contents.
+        A recursive scan includes the folder itself.
+        """
+        prefix = "" if display == "/" else display
+        if not recursive:
+            return [
+                (os.path.join(local, name), "%s/%s" % (prefix, name))
+                for name in sorted(os.listdir(local), key=lower)
+                if not (local == self.root and name.lower() == STATE)
+            ]
+        pairs = [] if display == "/" else [(local, display)]
+        for folder, folders, files in os.walk(local):
+            if folder == self.root:
+                folders[:] = [f for f in folders if f.lower() != STATE]
+            folders.sort(key=lower)
+            rel = os.path.relpath(folder, local).replace(os.path.sep, "/")
+            base = prefix if rel == "." else "%s/%s" % (prefix, rel)
+            for name in folders + sorted(files, key=lower):
+                pairs.append((
+                    os.path.join(folder, name),
+                    "%s/%s" % (base, name),
+                ))
+        return pairs
+
+    def page(self, path, recursive, position, pairs, start=0):
+        """
+        Get the page of pairs, a listing of path, that begins at start, with
+        a cursor that carries on with the rest and then with the changes
+        after position in the change log.
+        """
+        end = start + PAGE_SIZE
+        listing = None
+        with self.lock:
+            if len(pairs) > end:
+                listing = uuid.uuid4().hex
+                self.listings[listing] = pairs
+                while len(self.listings) > MAX_LISTINGS:
+                    self.listings.popitem(last=False)
+        cursor = json.dumps({
+            "path": path,
+            "recursive": recursive,
+            "position": position,
+            "listing": listing,
+            "start": end,
+        })
+        return ListFolderResult(
+            entries=self.metadatas(pairs[start:end]),
+            cursor=cursor,
+            has_more=listing is not None,
+        )
+
+    def files_get_metadata(self, path, **kwargs):
+        return self.metadata(*self.lookup(path, GetMetadataError.path))
+
+    def files_list_folder(self, path, recursive=False, **kwargs):
+        position = self.position()  # Changes from here on are picked up.
+        local, display, exists = self.resolve(path)
+        if not exists:
+            raise api_error(ListFolderError.path(LookupError.not_found))
+        if not os.path.isdir(local):
+            raise api_error(ListFolderError.path(LookupError.not_folder))
+        pairs = self.scan(local, display, recursive)
+        return self.page(display.lower(), recursive, position, pairs)
+
+    def files_list_folder_continue(self, cursor):
+        try:
+            state = json.loads(cursor)
+            path = state["path"]
+            recursive = state["recursive"]
+        except (ValueError, TypeError, KeyError):
+            raise api_error(ListFolderContinueError.reset)
+        if state["listing"] is not None:  # Carry on with the listing.
+            with self.lock:
+                pairs = self.listings.pop(state["listing"], None)
+            if pairs is None:  # Another process started it.
+                raise api_error(ListFolderContinueError.reset)
+            return self.page(
+                path,
+                recursive,
+                state["position"],
+                pairs,
+                state["start"],
+            )
+
+        # Send whatever changed since the listing, as it is now.
+        deleted, pairs = [], []
+        paths, position = self.changes(state["position"])
+        for display in sorted(paths, key=lambda p: p.lower()):
+            if not inside(display.lower(), path, recursive):
+                continue
+            local, display, exists = self.resolve(display)
+            if not exists:
+                deleted.append(DeletedMetadata(
+                    name=display.rsplit("/", 1)[-1],
+                    path_lower=display.lower(),
+                    path_display=display,
+                ))
+            elif recursive and os.path.isdir(local):
+                pairs.extend(self.scan(local, display, True))
+            else:
+                pairs.append((local, display))
+        result = self.page(path, recursive, position, pairs)
+        result.entries = deleted + result.entries
+        return result
+
+    def search(self, query, path, limit, start=0):
+        """
+        Get the page of results for query inside the folder path that begins
+        at start, with at most limit of them, and a cursor for the rest.
+        Everything is searched again for each page.
+        """
+        local, display, exists = self.resolve(path)
+        if not exists:
+            raise api_error(SearchError.path(LookupError.not_found))
+        if not os.path.isdir(local):
+            raise api_error(SearchError.path(LookupError.not_folder))
+        pairs = [
+            (local, display) for local, display in self.scan(
+                local,
+                display,
+                recursive=True,
+            )[0 if display == "/" else 1:]  # Leave out the folder itself.
+            if matches(query, display.rsplit("/", 1)[-1])
+        ]
+        end = start + limit
+        return SearchV2Result(
+            matches=[
+                SearchMatchV2(metadata=MetadataV2.metadata(meta))
+                for meta in self.metadatas(pairs[start:end])
+            ],
+            has_more=len(pairs) > end,
+            cursor=json.dumps({
+                "query": query,
+                "path": path,
+                "limit": limit,
+                "start": end,
+            }),
+        )
+
+    def files_search_v2(self, query, options=None, **kwargs):
+        options = options or SearchOptions()
+        return self.search(query, options.path or "/", options.max_results)
+
+    def files_search_continue_v2(self, cursor):
+        try:
+            state = json.loads(cursor)
+            args = state["query"], state["path"], state["limit"]
+            start = state["start"]
+        except (ValueError, TypeError, KeyError):
+            raise api_error(SearchError.invalid_argument("Bad cursor"))
+        return self.search(*args, start=start)
+
+    def files_create_folder_v2(self, path, autorename=False):
+        with self.lock:
+            local, display, exists = self.resolve(path)
+            if exists:
+                conflict = WriteConflictError.folder
+                if not os.path.isdir(local):
+                    conflict = WriteConflictError.file
+                error = WriteError.conflict(conflict)
+                raise api_error(CreateFolderError.path(error))
+            try:
+                self.makedirs(display)
+            except WriteErrorException as e:
+                raise api_error(CreateFolderError.path(e.args[0]))
+        return CreateFolderResult(metadata=self.metadata(local, display))
+
+    def makedirs(self, display):
+        """
+        Create the folder at display and whatever folders it's inside of,
+        like Dropbox does for uploads and new folders.
+        Raises: WriteErrorException
+        """
+        parts = display.split("/")
+        for i in range(2, len(parts) + 1):
+            local, folder, exists = self.resolve("/".join(parts[:i]))
+            if exists and not os.path.isdir(local):
+                conflict = WriteConflictError.file_ancestor
+                raise WriteErrorException(WriteError.conflict(conflict))
+            if not exists:
+                os.mkdir(local)
+                self.changed(folder)
+
+    def commit(self, source, path, mode, client_modified):
+        """
+        Move the local file source into place at path with the WriteMode
+        mode, and return its metadata.
+        Raises: WriteErrorException
+        """
+        mode = mode or WriteMode.add
+        with self.lock:
+            local, display, exists = self.resolve(path)
+            if exists and os.path.isdir(local):
+                conflict = WriteError.conflict(WriteConflictError.folder)
+                raise WriteErrorException(conflict)
+            if exists and mode.is_add():
+                conflict = WriteError.conflict(WriteConflictError.file)
+                raise WriteErrorException(conflict)
+            if exists and mode.is_update():
+                if rev(os.stat(local)) != mode.get_update():
+                    conflict = WriteError.conflict(WriteConflictError.file)
+                    raise WriteErrorException(conflict)
+            self.makedirs(display.rsplit("/", 1)[0])
+            if exists:
+                os.remove(local)  # os.rename can't replace on Windows.
+            shutil.move(source, local)
+            if client_modified is not None:
+                modified = timestamp(client_modified)
+                os.utime(local, (modified, modified))
+            self.changed(display)
+        return self.metadata(local, display)
+
+    def files_upload(self, f, path, mode=WriteMode.add, autorename=False,
+                     client_modified=None, **kwargs):
+        session = self.session_path(uuid.uuid4().hex)
+        with open(session, "wb") as sf:
+            sf.write(f)
+        try:
+            return self.commit(session, path, mode, client_modified)
+        except WriteErrorException as e:
+            failed = UploadWriteFailed(reason=e.args[0], upload_session_id="")
+            raise api_error(UploadError.path(failed))
+        finally:
+            if os.path.exists(session):
+                os.remove(session)
+
+    def session_path(self, session_id):
+        """Get the local path of the data of an upload session."""
+        return os.path.join(self.sessions, os.path.basename(session_id))
+
+    def append(self, f, cursor, error):
+        """
+        Add f to the upload session at cursor, or raise error built from
+        the UploadSessionLookupError or UploadSessionAppendError.
+        Raises: dropbox.exceptions.ApiError
+        """
+        path = self.session_path(cursor.session_id)
+        with self.lock:
+            if not os.path.exists(path):
+                raise api_error(error(UploadSessionLookupError.not_found))
+            size = os.path.getsize(path)
+            if cursor.offset != size:
+                offset = UploadSessionOffsetError(correct_offset=size)
+                raise api_error(error(
+                    UploadSessionLookupError.incorrect_offset(offset),
+                ))
+            with open(path, "ab") as sf:
+                sf.write(f)
+        return path
+
+    def files_upload_session_start(self, f, close=False, **kwargs):
+        session_id = uuid.uuid4().hex
+        with open(self.session_path(session_id), "wb") as sf:
+            sf.write(f)
+        return UploadSessionStartResult(session_id=session_id)
+
+    def files_upload_session_append_v2(self, f, cursor, close=False, **kw):
+        def error(lookup):
+            try:  # Older SDKs raise the lookup error for appends.
+                from dropbox.files import UploadSessionAppendError
+            except ImportError:
+                return lookup
+            if lookup.is_not_found():
+                return UploadSessionAppendError.not_found
+            return UploadSessionAppendError.incorrect_offset(
+                lookup.get_incorrect_offset(),
+            )
+        self.append(f, cursor, error)
+
+    def files_upload_session_finish(self, f, cursor, commit, **kwargs):
+        path = self.append(f, cursor, UploadSessionFinishError.lookup_failed)
+        try:
+            return self.commit(
+                path,
+                commit.path,
+                commit.mode,
+                commit.client_modified,
+            )
+        except WriteErrorException as e:
+            raise api_error(UploadSessionFinishError.path(e.args[0]))
+
+    def files_download(self, path, rev=None, extra_headers=None):
+        local, display = self.lookup(path, DownloadError.path)
+        if os.path.isdir(local):
+            raise api_error(DownloadError.path(LookupError.not_file))
+        meta = self.metadata(local, display)
+        if rev is not None and rev != meta.rev:  # It's not kept.
+            raise api_error(DownloadError.path(LookupError.not_found))
+        start, end, status = 0, None, 200
+        if extra_headers and "Range" in extra_headers:
+            first, last = extra_headers["Range"].split("=")[1].split("-")
+            start, status = int(first), 206
+            end = int(last) + 1 if last else None
+        return meta, FileResponse(local, start, end, status)
+
+    def files_delete_v2(self, path, parent_rev=None):
+        with self.lock:
+            local, display = self.lookup(path, DeleteError.path_lookup)
+            meta = self.metadata(local, display)
+            if os.path.isdir(local):
+                shutil.rmtree(local)
+            else:
+                os.remove(local)
+            self.changed(display)
+        return DeleteResult(metadata=meta)
+
+    def relocate(self, from_path, to_path, move):
+        """
+        Copy or move whatever is at from_path to to_path, and return its new
+        metadata.
+        Raises: RelocationErrorException
+        """
+        with self.lock:
+            src, src_display, exists = self.resolve(from_path)
+            if not exists or src_display == "/":
+                error = RelocationError.from_lookup(LookupError.not_found)
+                raise RelocationErrorException(error)
+            dest, display, exists = self.resolve(to_path)
+            renamed = move and dest == src  # Only the case changes.
+            if exists and not renamed:
+                conflict = WriteConflictError.file
+                if os.path.isdir(dest):
+                    conflict = WriteConflictError.folder
+                error = RelocationError.to(WriteError.conflict(conflict))
+                raise RelocationErrorException(error)
+            if display.lower().startswith(src_display.lower() + "/"):
+                if move:
+                    raise RelocationErrorException(
+                        RelocationError.cant_move_folder_into_itself,
+                    )
+                raise RelocationErrorException(
+                    RelocationError.duplicated_or_nested_paths,
+                )
+            if renamed:
+                display = to_path
+                dest = os.path.join(
+                    os.path.dirname(src),
+                    display.rsplit("/", 1)[-1],
+                )
+            try:
+                self.makedirs(display.rsplit("/", 1)[0])
+            except WriteErrorException as e:
+                raise RelocationErrorException(RelocationError.to(e.args[0]))
+            if move:
+                os.rename(src, dest)
+                self.changed(src_display)
+            elif os.path.isdir(src):
+                shutil.copytree(src, dest)
+            else:
+                shutil.copy2(src, dest)
+            self.changed(display)
+        return self.metadata(dest, display)
+
+    def files_copy_v2(self, from_path, to_path, **kwargs):
+        try:
+            meta = self.relocate(from_path, to_path, move=False)
+        except RelocationErrorException as e:
+            raise api_error(e.args[0])
+        return RelocationResult(metadata=meta)
+
+    def files_move_v2(self, from_path, to_path, **kwargs):
+        try:
+            meta = self.relocate(from_path, to_path, move=True)
+        except RelocationErrorException as e:
+            raise api_error(e.args[0])
+        return RelocationResult(metadata=meta)
+
+    def files_delete_batch(self, entries):
+        results = []
+        for arg in entries:
+            try:
+                meta = self.files_delete_v2(arg.path).metadata
+            except dropbox.exceptions.ApiError as e:
+                results.append(DeleteBatchResultEntry.failure(e.error))
+            else:
+                data = DeleteBatchResultData(metadata=meta)
+                results.append(DeleteBatchResultEntry.success(data))
+        return DeleteBatchLaunch.complete(DeleteBatchResult(entries=results))
+
+    def relocate_batch(self, entries, move):
+        """Copy or move each RelocationPath in entries."""
+        results = []
+        for arg in entries:
+            try:
+                meta = self.relocate(arg.from_path, arg.to_path, move)
+            except RelocationErrorException as e:
+                error = RelocationBatchErrorEntry.relocation_error(e.args[0])
+                results.append(RelocationBatchResultEntry.failure(error))
+            else:
+                results.append(RelocationBatchResultEntry.success(meta))
+        return RelocationBatchV2Launch.complete(
+            RelocationBatchV2Result(entries=results),
+        )
+
+    def files_copy_batch_v2(self, entries, autorename=False):
+        return self.relocate_batch(entries, move=False)
+
+    def files_move_batch_v2(self, entries, autorename=False, **kwargs):
+        return self.relocate_batch(entries, move=True)
+
+    def check(self, async_job_id):
+        """Batch jobs are done when they're launched, so there are no IDs."""
+        raise api_error(PollError.invalid_async_job_id)
+
+    files_delete_batch_check = check
+    files_copy_batch_check_v2 = check
+    files_move_batch_check_v2 = check
+
+
+class FileResponse(object):
+    """
+    The body of a LocalBackend download, like the requests.Response from
+    dropbox.Dropbox.files_download.
+    """
+    def __init__(self, path, start=0, end=None, status_code=200):
+        self.f = open(path, "rb")
+        self.f.seek(start)
+        self.remaining = None if end is None else max(end - start, 0)
+        self.status_code = status_code
+
+    def iter_content(self, chunk_size=1):
+        while self.remaining is None or self.remaining > 0:
+            n = chunk_size
+            if self.remaining is not None:
+                n = min(n, self.remaining)
+                self.remaining -= n
+            data = self.f.read(n)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        self.f.close()
+
+
+class WriteErrorException(Exception):
+    """A dropbox.files.WriteError for a LocalBackend to wrap."""
+    pass
+
+
+class RelocationErrorException(Exception):
+    """A dropbox.files.RelocationError for a LocalBackend to wrap."""
+    pass
+
+
+def api_error(error):
+    """Build the dropbox.exceptions.ApiError that Dropbox raises for error."""
+    return dropbox.exceptions.ApiError("local", error, None, None)
+
+
+def content_hashes(paths):
+    """Get the content hashes of the local files at paths."""
+    from pdbox.hashing import hash_files
+    return hash_files(paths) if paths else {}
+
+
+def inside(path, folder, recursive):
+    """Determine whether path is listed by list_folder on folder."""
+    if folder in ["", "/"]:
+        return recursive or path.count("/") == 1
+    if recursive and path == folder:
+        return True  # Recursive listings include the folder itself.
+    if not path.startswith(folder + "/"):
+        return False
+    return recursive or "/" not in path[len(folder) + 1:]
+
+
+def matches(query, name):
+    """
+    Determine whether name matches the search query, when every word of
+    query is in it, whatever the case.
+    """
+    name = lower(name)
+    return all(word in name for word in lower(query).split())
+
+
+def rev(st):
+    """Get a revision for the file with os.stat_result st."""
+    # Python 2 doesn't have st_mtime_ns or st_ctime_ns.
+    mtime = getattr(st, "st_mtime_ns", int(st.st_mtime * 1e9))
+    ctime = getattr(st, "st_ctime_ns", int(st.st_ctime * 1e9))
+    key = "%d:%d:%d:%d" % (st.st_ino, st.st_size, mtime, ctime)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def utc(t):
+    """Get the datetime of t seconds since the epoch, to the second."""
+    return datetime.datetime.utcfromtimestamp(int(t))
+
+
+def timestamp(dt):
+    """Get the number of seconds since the epoch of a UTC datetime."""
+    return (dt - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+def lower(name):
+    """Sort key for names, which sort regardless of case."""
+    return name.lower()
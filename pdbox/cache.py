@@ -0,0 +1,453 @@
+import datetime
+import dropbox
+import hashlib
+import json
+import pdbox
+import sqlite3
+import threading
+import time
+
+from pdbox.utils import DropboxError, execute
+
+# Format for timestamps stored in the cache.
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# Maximum number of entries in the hash cache.
+MAX_HASHES = 1000000
+# Seconds between updates of a hash's last use, to keep hits read-only.
+HASH_TOUCH_INTERVAL = 24 * 60 * 60
+# Seconds that Dropbox keeps an upload session open for.
+SESSION_LIFETIME = 7 * 24 * 60 * 60
+
+
+class MetadataCache(object):
+    """
+    A snapshot of the whole Dropbox tree on disk.
+    The snapshot is built from one recursive list_folder on the root folder,
+    and kept up to date with list_folder_continue on the stored cursor.
+    Paths are stored in lowercase, since Dropbox is case-insensitive.
+    """
+    def __init__(self, path, token):
+        """Open the cache at path, for the account that owns token."""
+        self.lock = threading.RLock()  # Guards the database connection.
+        self.refreshing = threading.RLock()  # Held while refreshing.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.dirty = False  # Set when our own writes need a refresh.
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(path TEXT PRIMARY KEY, parent TEXT, meta TEXT)",
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_parent "
+                "ON entries (parent)",
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS state "
+                "(key TEXT PRIMARY KEY, value TEXT)",
+            )
+
+        # Don't serve one account's files to another.
+        account = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        if self.state("account") != account:
+            self.clear()
+            self.set_state("account", account)
+
+    def state(self, key):
+        """Get a stored value, or None if it isn't set."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM state WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        """Store a value, removing it if value is None."""
+        with self.lock, self.db:
+            if value is None:
+                self.db.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO state VALUES (?, ?)",
+                    (key, value),
+                )
+
+    def clear(self):
+        """Throw away the snapshot and its cursor."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute(
+                "DELETE FROM state WHERE key IN ('cursor', 'complete')",
+            )
+
+    def ready(self):
+        """Determine whether the snapshot covers the whole tree."""
+        return self.state("complete") is not None
+
+    def refresh(self):
+        """
+        Bring the snapshot up to date.
+        Every page is committed along with its cursor, so an interrupted
+        listing is picked up where it left off next time. Reads aren't
+        blocked while pages are being fetched.
+        Raises: DropboxError
+        """
+        with self.refreshing:
+            self.dirty = False
+            cursor = self.state("cursor")
+            try:
+                if cursor is None:
+                    pdbox.debug("Building metadata snapshot")
+                    result = execute(
+                        pdbox.dbx.files_list_folder,
+                        "",
+                        recursive=True,
+                    )
+                else:
+                    pdbox.debug("Updating metadata snapshot")
+                    result = execute(
+                        pdbox.dbx.files_list_folder_continue,
+                        cursor,
+                    )
+            except DropboxError as e:
+                if cursor is None or not is_reset(e.args[0]):
+                    raise
+                pdbox.debug("Snapshot cursor was reset, starting over")
+                self.clear()
+                return self.refresh()
+
+            while True:
+                with self.lock, self.db:  # One transaction per page.
+                    for meta in result.entries:
+                        self.apply(meta)
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO state VALUES ('cursor', ?)",
+                        (result.cursor,),
+                    )
+                    if not result.has_more:
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO state "
+                            "VALUES ('complete', '1')",
+                        )
+                if not result.has_more:
+                    return
+                result = execute(
+                    pdbox.dbx.files_list_folder_continue,
+                    result.cursor,
+                )
+
+    def apply(self, meta):
+        """
+        Apply one entry of a listing to the snapshot.
+        Like put and remove, this doesn't commit: callers hold the lock and
+        the transaction.
+        """
+        path = meta.path_lower
+        if isinstance(meta, dropbox.files.DeletedMetadata):
+            self.remove(path)
+        elif isinstance(meta, dropbox.files.FolderMetadata):
+            self.put(path, meta)  # Replaces a file at path too.
+        else:
+            self.remove(path)  # Could have been a folder before.
+            self.put(path, meta)
+
+    def put(self, path, meta):
+        """Store meta at path."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+            (path, path.rsplit("/", 1)[0], dump(meta)),
+        )
+
+    def remove(self, path):
+        """Remove path and everything underneath it."""
+        self.db.execute(
+            "DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)",
+            (path, path + "/", path + "0"),  # "0" is the character after "/".
+        )
+
+    def get(self, path):
+        """Get the metadata at path, or None if nothing is there."""
+        if self.dirty:
+            refresh(self)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT meta FROM entries WHERE path = ?",
+                (path.lower(),),
+            ).fetchone()
+        return load(row[0]) if row else None
+
+    def children(self, path, recursive=False):
+        """Get the metadata of everything inside the folder at path."""
+        if self.dirty:
+            refresh(self)
+        path = "" if path == "/" else path.lower()
+        with self.lock:
+            if recursive:
+                rows = self.db.execute(
+                    "SELECT meta FROM entries WHERE path >= ? AND path < ? "
+                    "ORDER BY path",
+                    (path + "/", path + "0"),
+                )
+            else:
+                rows = self.db.execute(
+                    "SELECT meta FROM entries WHERE parent = ? ORDER BY path",
+                    (path,),
+                )
+            return [load(row[0]) for row in rows]
+
+    def written(self, path, meta=None, complete=True):
+        """
+        Record a change that we made at path, where meta is its new metadata
+        or None if it was deleted.
+        complete is False when we don't know what's inside a new folder (after
+        a copy or move), in which case the next read waits for a refresh.
+        """
+        with self.lock, self.db:
+            if meta is None:
+                self.remove(path.lower())
+            else:
+                self.apply(meta)
+            self.dirty |= not complete
+
+
+class HashCache(object):
+    """
+    Content hashes of local files on disk.
+    Entries are keyed by device, inode, size, modification time and change
+    time, so any change to a file invalidates its entry. The change time
+    catches rewrites whose modification time was put back afterwards.
+    When there are more than max_entries, the least recently used are
+    evicted.
+    """
+    def __init__(self, path, max_entries=MAX_HASHES):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.inserts = 0  # Number of new entries since the last eviction.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            # This is only a cache, so trade durability for fast commits.
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.execute("PRAGMA synchronous = NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, "
+                "ctime INTEGER, hash TEXT, used REAL, "
+                "PRIMARY KEY (dev, ino, size, mtime, ctime))",
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used)",
+            )
+
+    def get(self, st):
+        """Get the hash of the file with os.stat_result st, or None."""
+        key = stat_key(st)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT hash, used FROM hashes WHERE "
+                "dev = ? AND ino = ? AND size = ? AND mtime = ? AND ctime = ?",
+                key,
+            ).fetchone()
+            if not row:
+                return None
+            now = time.time()
+            if now - row[1] > HASH_TOUCH_INTERVAL:
+                with self.db:
+                    self.db.execute(
+                        "UPDATE hashes SET used = ? WHERE dev = ? AND "
+                        "ino = ? AND size = ? AND mtime = ? AND ctime = ?",
+                        (now,) + key,
+                    )
+        return row[0]
+
+    def put(self, st, digest):
+        """Store the hash of the file with os.stat_result st."""
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                stat_key(st) + (digest, time.time()),
+            )
+            self.inserts += 1
+            # Counting every time would make each insert O(n).
+            if self.inserts * 100 > self.max_entries:
+                self.inserts = 0
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries over the limit."""
+        n = self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        if n > self.max_entries:
+            pdbox.debug("Evicting %d hashes" % (n - self.max_entries))
+            self.db.execute(
+                "DELETE FROM hashes WHERE rowid IN "
+                "(SELECT rowid FROM hashes ORDER BY used LIMIT ?)",
+                (n - self.max_entries,),
+            )
+
+
+class UploadJournal(object):
+    """
+    Upload sessions in progress on disk, keyed by source file and
+    destination, so that an interrupted upload can be resumed.
+    Each session is stored with the source file's identity, so a file that
+    changes starts a new upload. The journal is only an optimization, so
+    database errors are logged rather than raised.
+    """
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "source TEXT, dest TEXT, dev INTEGER, ino INTEGER, "
+                "size INTEGER, mtime INTEGER, ctime INTEGER, session TEXT, "
+                "offset INTEGER, updated REAL, PRIMARY KEY (source, dest))",
+            )
+            self.db.execute(
+                "DELETE FROM uploads WHERE updated < ?",
+                (time.time() - SESSION_LIFETIME,),
+            )
+
+    def get(self, source, dest, st):
+        """
+        Get the session ID and offset of an upload of the file at source with
+        os.stat_result st to dest, or None if there isn't one.
+        """
+        try:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT dev, ino, size, mtime, ctime, session, offset, "
+                    "updated FROM uploads WHERE source = ? AND dest = ?",
+                    (source, dest.lower()),
+                ).fetchone()
+        except sqlite3.Error as e:
+            pdbox.debug(e)
+            return None
+        if not row or tuple(row[:5]) != stat_key(st):
+            return None
+        if time.time() - row[7] > SESSION_LIFETIME:
+            return None
+        return row[5], row[6]
+
+    def put(self, source, dest, st, session, offset):
+        """Record that session has received offset bytes of source."""
+        try:
+            with self.lock, self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO uploads "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (source, dest.lower()) + stat_key(st) +
+                    (session, offset, time.time()),
+                )
+        except sqlite3.Error as e:
+            pdbox.debug(e)
+
+    def remove(self, source, dest):
+        """Forget the upload of source to dest."""
+        try:
+            with self.lock, self.db:
+                self.db.execute(
+                    "DELETE FROM uploads WHERE source = ? AND dest = ?",
+                    (source, dest.lower()),
+                )
+        except sqlite3.Error as e:
+            pdbox.debug(e)
+
+
+_hash_cache_lock = threading.Lock()
+
+
+def hash_cache():
+    """
+    Get the hash cache, opening it on first use.
+    Returns None if it can't be opened.
+    """
+    with _hash_cache_lock:
+        if pdbox.hashes is None:
+            try:
+                pdbox.hashes = HashCache(pdbox.HASH_CACHE_PATH)
+            except sqlite3.Error as e:
+                pdbox.debug(e)
+                pdbox.hashes = False  # Don't try again.
+    return pdbox.hashes or None
+
+
+def stat_key(st):
+    """Get the hash cache key for an os.stat_result."""
+    # Python 2 doesn't have st_mtime_ns or st_ctime_ns.
+    mtime = getattr(st, "st_mtime_ns", int(st.st_mtime * 1e9))
+    ctime = getattr(st, "st_ctime_ns", int(st.st_ctime * 1e9))
+    return (st.st_dev, st.st_ino, st.st_size, mtime, ctime)
+
+
+def refresh(snapshot):
+    """
+    Refresh snapshot, logging rather than raising errors.
+    Returns whether the refresh succeeded.
+    """
+    try:
+        snapshot.refresh()
+    except DropboxError as e:
+        pdbox.debug(e)
+        pdbox.warn("The metadata cache could not be updated")
+        return False
+    return True
+
+
+def refresh_in_background(snapshot):
+    """Refresh snapshot on a daemon thread, and return the thread."""
+    thread = threading.Thread(target=refresh, args=(snapshot,))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+_upload_journal_lock = threading.Lock()
+
+
+def upload_journal():
+    """
+    Get the upload journal, opening it on first use.
+    Returns None if it can't be opened.
+    """
+    with _upload_journal_lock:
+        if pdbox.uploads is None:
+            try:
+                pdbox.uploads = UploadJournal(pdbox.UPLOADS_PATH)
+            except sqlite3.Error as e:
+                pdbox.debug(e)
+                pdbox.uploads = False  # Don't try again.
+    return pdbox.uploads or None
+
+
+def is_reset(error):
+    """Determine whether a list_folder_continue error means to start over."""
+    return getattr(error, "is_reset", lambda: False)()
+
+
+def dump(meta):
+    """Serialize file or folder metadata into a string."""
+    fields = {
+        "name": meta.name,
+        "id": meta.id,
+        "path_lower": meta.path_lower,
+        "path_display": meta.path_display,
+    }
+    if isinstance(meta, dropbox.files.FileMetadata):
+        fields.update({
+            "size": meta.size,
+            "rev": meta.rev,
+            "content_hash": meta.content_hash,
+            "client_modified": meta.client_modified.strftime(TIME_FORMAT),
+            "server_modified": meta.server_modified.strftime(TIME_FORMAT),
+        })
+    return json.dumps(fields)
+
+
+def load(s):
+    """Deserialize the output of dump."""
+    fields = json.loads(s)
+    if "size" not in fields:
+        return dropbox.files.FolderMetadata(**fields)
+    for key in ["client_modified", "server_modified"]:
+        fields[key] = datetime.datetime.strptime(fields[key], TIME_FORMAT)
+    return dropbox.files.FileMetadata(**fields)
@@ -1,29 +0,0 @@
-from pdbox.models import LocalFolder, RemoteFolder
-
-
-def validate_src_dest(src, dest):
-    """Check that at least one argument is a Dropbox URI."""
-    return src.startswith("dbx://") or dest.startswith("dbx://")
-
-
-def assert_is_folder(path):
-    """Check that a given path points to a folder."""
-    if path.startswith("dbx://"):
-        try:
-            RemoteFolder(path)
-        except ValueError:
-            return False
-    else:
-        try:
-            LocalFolder(path)
-        except ValueError:
-            return False
-    return True
-
-
-from .cp import cp  # noqa
-from .ls import ls  # noqa
-from .rm import rm  # noqa
-from .mv import mv  # noqa
-from .mkdir import mkdir  # noqa
-from .rmdir import rmdir  # noqa
@@ -0,0 +1,110 @@
+import pdbox
+
+from pdbox.models import (
+    LocalFolder,
+    RemoteFile,
+    RemoteFolder,
+    delete_batch,
+    get_remotes,
+    relocate_batch,
+)
+from pdbox.utils import DropboxError, dbx_uri, overwrite
+
+
+def validate_src_dest(src, dest):
+    """Check that at least one argument is a Dropbox URI."""
+    return src.startswith("dbx://") or dest.startswith("dbx://")
+
+
+def assert_is_folder(path):
+    """Check that a given path points to a folder."""
+    if path.startswith("dbx://"):
+        try:
+            RemoteFolder(path)
+        except ValueError:
+            return False
+    else:
+        try:
+            LocalFolder(path)
+        except ValueError:
+            return False
+    return True
+
+
+def relocate_inside(srcs, dest, nest, move=False):
+    """
+    Copy or move several files or folders into the folder dest inside
+    Dropbox. The sources are found together and relocated in batch jobs,
+    after deleting any files that they replace. A source that would replace
+    a folder goes into it instead, one at a time with nest, which is
+    cp_inside or mv_inside.
+    Returns whether every source was copied or moved.
+    """
+    verb = "moved" if move else "copied"
+    success = True
+    try:
+        folder = RemoteFolder(dest)
+    except ValueError as e:
+        pdbox.debug(e)
+        pdbox.error("%s is not a folder" % dbx_uri(dest))
+        return False
+
+    sources = []
+    for src, remote in zip(srcs, get_remotes(srcs)):
+        if remote is None:
+            pdbox.error("%s could not be found" % dbx_uri(src))
+            success = False
+        elif (isinstance(remote, RemoteFolder) and
+                not pdbox._args["recursive"]):
+            pdbox.error(
+                "%s is a folder and --recursive is not set" % remote.uri,
+            )
+            success = False
+        else:
+            sources.append(remote)
+
+    paths = ["%s/%s" % (folder.path.rstrip("/"), r.name) for r in sources]
+    pairs = []
+    replaced = []  # Indices of pairs whose destination is a file.
+    for remote, path, other in zip(sources, paths, get_remotes(paths)):
+        if isinstance(other, RemoteFolder):
+            success &= nest(remote.uri, other.uri)
+            continue
+        if other is not None:
+            if (not move and isinstance(remote, RemoteFile) and
+                    remote.hash == other.hash):
+                pdbox.info("%s and %s are identical" % (remote.uri, other.uri))
+                continue
+            if not overwrite(other.uri):
+                pdbox.error("Cancelled")
+                success = False
+                continue
+            replaced.append(len(pairs))
+        pairs.append((remote.path, path))
+
+    try:
+        # There's no way to relocate and overwrite at the same time,
+        # so delete the existing files first.
+        failed = set(
+            i for i, error in
+            zip(replaced, delete_batch([pairs[i][1] for i in replaced]))
+            if error is not None
+        )
+        for i in sorted(failed):
+            pdbox.error("%s could not be replaced" % dbx_uri(pairs[i][1]))
+            success = False
+        pairs = [pair for i, pair in enumerate(pairs) if i not in failed]
+        errors = relocate_batch(pairs, move=move)
+    except DropboxError as e:
+        pdbox.debug(e)
+        errors = [e] * len(pairs)
+
+    for (src, path), error in zip(pairs, errors):
+        if error is not None:
+            pdbox.debug(error)
+            pdbox.error(
+                "%s could not be %s to %s" %
+                (dbx_uri(src), verb, dbx_uri(path)),
+            )
+            success = False
+    return success
@@ -1,6 +1,11 @@
 import os.path
 import pdbox
 
+from pdbox.cli.common import (
+    assert_is_folder,
+    relocate_inside,
+    validate_src_dest,
+)
 from pdbox.models import get_local, get_remote, RemoteFile, LocalFolder
 from pdbox.utils import DropboxError, dbx_uri, overwrite
 
@@ -16,10 +21,11 @@ def cp():
     - quiet (bool)
     - follow_symlinks (bool)
     - only_show_errors (bool)
-    - chunksize (float)
+    - chunksize (float or "auto")
+    - workers (int)
     """
     args = pdbox._args
-    if len(args["src"]) > 1 and not pdbox.cli.assert_is_folder(args["dst"]):
+    if len(args["src"]) > 1 and not assert_is_folder(args["dst"]):
         pdbox.error(
             "%s is not a folder; can't move multiple items here" %
             args["dst"],
@@ -29,8 +35,16 @@ def cp():
     dest = args["dst"]
     success = True
 
+    # Several sources inside Dropbox are relocated together.
+    inside = [
+        src for src in args["src"]
+        if src.startswith("dbx://") and dest.startswith("dbx://")
+    ]
+    if len(inside) > 1:
+        success &= relocate_inside(inside, dest, cp_inside)
+
     for src in args["src"]:
-        if not pdbox.cli.validate_src_dest(src, dest):
+        if not validate_src_dest(src, dest):
             pdbox.error(
                 "At least one of <source> or <destination> must be a Dropbox "
                 "path with the prefix 'dbx://'",
@@ -39,6 +53,8 @@ def cp():
             continue
 
         if src.startswith("dbx://") and dest.startswith("dbx://"):
+            if len(inside) > 1:
+                continue
             func = cp_inside
         elif src.startswith("dbx://"):
             func = cp_from
@@ -2,7 +2,6 @@ import pdbox
 
 from pdbox.models import get_remote, RemoteFolder
 from pdbox.utils import DropboxError, isize, dbx_uri
-from tabulate import tabulate
 
 
 def ls():
@@ -29,8 +28,13 @@ def ls():
             success = False
             continue
 
+        # Everything underneath the folder comes from a single listing, and
+        # --maxdepth is applied as the tables are printed.
+        maxdepth = pdbox._args["maxdepth"]
+        recursive = pdbox._args["recursive"] and (
+            maxdepth == -1 or maxdepth > 1)
         try:
-            entries = folder.contents()
+            entries = folder.contents(recursive=recursive)
         except DropboxError:
             pdbox.error("%s could not be displayed" % folder.uri)
             success = False
@@ -38,13 +42,22 @@ def ls():
             if not entries:
                 print("%s: no files or folders" % folder.uri)
             else:
-                success &= display(folder, entries)
+                tree = {}  # Entries grouped by their parent folder.
+                for e in entries:
+                    tree.setdefault(e.parent.lower(), []).append(e)
+                success &= display(folder, tree)
 
     return success
 
 
-def display(folder, entries, depth=1):
-    """Given a list of folders and files, print them as a table."""
+def display(folder, tree, depth=1):
+    """
+    Given folders and files grouped by their parent folder, print the
+    contents of folder as a table, followed by its subfolders if necessary.
+    """
+    from tabulate import tabulate  # Only ls needs it, so don't load it early.
+
+    entries = tree.get(folder.path.lower().rstrip("/"), [])
     if not entries:
         print("%s: no files or folders\n" % folder.uri)
         return True
@@ -80,12 +93,6 @@ def display(folder, entries, depth=1):
     if pdbox._args["recursive"] and (
             pdbox._args["maxdepth"] == -1 or depth < pdbox._args["maxdepth"]):
         for e in filter(lambda e: isinstance(e, RemoteFolder), entries):
-            try:
-                contents = e.contents()
-            except DropboxError:
-                pdbox.warn("%s could not be displayed" % e.uri)
-                success = False
-            else:
-                success &= display(e, contents, depth=depth + 1)
+            success &= display(e, tree, depth=depth + 1)
 
     return success
@@ -1,6 +1,11 @@
 import os
 import pdbox
 
+from pdbox.cli.common import (
+    assert_is_folder,
+    relocate_inside,
+    validate_src_dest,
+)
 from pdbox.models import get_local, get_remote, RemoteFolder, LocalFolder
 from pdbox.utils import DropboxError, dbx_uri, overwrite
 
@@ -17,10 +22,11 @@ def mv():
     - follow_symlinks (bool)
     - only_show_errors (bool)
     - recursive (bool)
-    - chunksize (float)
+    - chunksize (float or "auto")
+    - workers (int)
     """
     src_list, dest = pdbox._args["src"], pdbox._args["dst"]
-    if len(src_list) > 1 and not pdbox.cli.assert_is_folder(dest):
+    if len(src_list) > 1 and not assert_is_folder(dest):
         pdbox.error(
             "%s is not a folder; can't move multiple items here" % dest,
         )
@@ -28,8 +34,21 @@ def mv():
 
     success = True
 
+    # Several sources inside Dropbox are relocated together.
+    inside = [
+        src for src in src_list
+        if src.startswith("dbx://") and dest.startswith("dbx://")
+    ]
+    if len(inside) > 1:
+        success &= relocate_inside(
+            inside,
+            dest,
+            mv_inside,
+            move=True,
+        )
+
     for src in src_list:
-        if not pdbox.cli.validate_src_dest(src, dest):
+        if not validate_src_dest(src, dest):
             pdbox.error(
                 "At least one of <source> or <destination> must be a Dropbox "
                 "path with the prefix 'dbx://'",
@@ -38,6 +57,8 @@ def mv():
             continue
 
         if src.startswith("dbx://") and dest.startswith("dbx://"):
+            if len(inside) > 1:
+                continue
             func = mv_inside
         elif src.startswith("dbx://"):
             func = mv_from
@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+
+from pdbox.utils import isize
+
+# Minimum number of seconds between redraws of the status line.
+REDRAW_INTERVAL = 0.5
+
+
+def mbps(n, seconds):
+    """Get a throughput in MB/s from n bytes transferred over seconds."""
+    return n / 1024.0 ** 2 / max(seconds, 0.001)
+
+
+def eta(seconds):
+    """Format a number of seconds as H:MM:SS."""
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Progress(object):
+    """
+    Render transfer events from pdbox.models: a line for each file as it
+    finishes or fails with its throughput, and on a terminal, a status line
+    for everything in flight with the overall throughput and ETA, and the
+    slowest file's throughput and ETA.
+    Subscribe an instance with pdbox.models.subscribe.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.lock = threading.Lock()
+        # (Start time, bytes done at start, latest event) keyed by name.
+        self.active = {}
+        self.moved = 0  # Bytes transferred by transfers that are over.
+        self.began = None  # When the first transfer started.
+        self.drawn = 0  # Length of the status line on screen.
+        self.last = 0  # When the status line was last drawn.
+
+    def __call__(self, event):
+        with self.lock:
+            if event.kind == "start":
+                if self.began is None:
+                    self.began = event.time
+                self.active[event.name] = (event.time, event.done, event)
+                return
+            start, base, _ = self.active.get(
+                event.name,
+                (event.time, event.done, event),
+            )
+            if event.kind == "progress":
+                self.active[event.name] = (start, base, event)
+                if self.tty and event.time - self.last >= REDRAW_INTERVAL:
+                    self.draw(event.time)
+                return
+
+            self.active.pop(event.name, None)
+            moved = max(event.done - base, 0)
+            self.moved += moved
+            elapsed = event.time - start
+            if event.kind == "finish":
+                line = "%s: %s in %.1fs (%.2f MB/s)" % (
+                    event.name,
+                    isize(event.total),
+                    elapsed,
+                    mbps(moved, elapsed),
+                )
+            else:
+                line = "%s: failed after %s of %s (%.2f MB/s)" % (
+                    event.name,
+                    isize(event.done),
+                    isize(event.total),
+                    mbps(moved, elapsed),
+                )
+            self.clear()
+            self.stream.write(line + "\n")
+            if self.tty and self.active:
+                self.draw(event.time)
+            self.stream.flush()
+
+    def draw(self, now):
+        """Redraw the status line."""
+        moved = self.moved
+        remaining = 0
+        slowest = None  # (Rate, event) of the slowest transfer.
+        for start, base, event in self.active.values():
+            moved += max(event.done - base, 0)
+            remaining += max(event.total - event.done, 0)
+            rate = mbps(max(event.done - base, 0), now - start)
+            if slowest is None or rate < slowest[0]:
+                slowest = (rate, event)
+
+        rate = mbps(moved, now - self.began)
+        line = "%d in flight, %.2f MB/s" % (len(self.active), rate)
+        if rate:
+            line += ", ETA %s" % eta(remaining / 1024.0 ** 2 / rate)
+        if slowest and len(self.active) > 1:
+            rate, event = slowest
+            line += " | slowest: %s, %.2f MB/s" % (
+                os.path.basename(event.name),
+                rate,
+            )
+            if rate:
+                left = max(event.total - event.done, 0)
+                line += ", ETA %s" % eta(left / 1024.0 ** 2 / rate)
+
+        self.clear()
+        self.stream.write(line)
+        self.stream.flush()
+        self.drawn = len(line)
+        self.last = now
+
+    def clear(self):
+        """Erase the status line."""
+        if self.drawn:
+            self.stream.write("\r%s\r" % (" " * self.drawn))
+            self.drawn = 0
+
+    def close(self):
+        """Erase the status line for good."""
+        with self.lock:
+            self.clear()
+            self.stream.flush()
@@ -1,12 +1,13 @@
 import pdbox
 
-from pdbox.models import get_remote, RemoteFile
-from pdbox.utils import DropboxError, dbx_uri
+from pdbox.models import delete_batch, get_remotes, RemoteFile
+from pdbox.utils import DropboxError, dbx_uri, normpath
 
 
 def rm():
     """
     Delete one or more files or directories inside Dropbox.
+    Everything is deleted in batch jobs rather than one request at a time.
 
     pdbox._args:
     - path(list[string])
@@ -14,28 +15,46 @@ def rm():
     - quiet (bool)
     - recursive (bool)
     - only_show_errors (bool)
+    - workers (int)
     """
     success = True
 
-    for path in pdbox._args["path"]:
-        try:
-            remote = get_remote(path)
-        except ValueError:
-            pdbox.error("%s could not be found" % dbx_uri(path))
-            success = False
-            continue
-
-        if not isinstance(remote, RemoteFile) and not pdbox._args["recursive"]:
-            pdbox.error(
-                "%s is a folder and --recursive is not set" % remote.uri,
-            )
-            success = False
+    if pdbox._args["recursive"] and not pdbox._args.get("dryrun"):
+        # Files and folders can both be deleted, so there's no need to look
+        # anything up first: missing paths are reported by the batch job.
+        paths = [normpath(path) for path in pdbox._args["path"]]
+    else:
+        paths = []
+        remotes = get_remotes(pdbox._args["path"])
+        for path, remote in zip(pdbox._args["path"], remotes):
+            if remote is None:
+                pdbox.error("%s could not be found" % dbx_uri(path))
+                success = False
+            elif (not isinstance(remote, RemoteFile) and
+                    not pdbox._args["recursive"]):
+                pdbox.error(
+                    "%s is a folder and --recursive is not set" % remote.uri,
+                )
+                success = False
+            else:
+                paths.append(remote.path)
+
+    try:
+        errors = delete_batch(paths)
+    except DropboxError as e:
+        pdbox.debug(e)
+        for path in paths:
+            pdbox.error("%s could not be deleted" % dbx_uri(path))
+        return False
+
+    for path, error in zip(paths, errors):
+        if error is None:
             continue
-
-        try:
-            remote.delete()
-        except DropboxError:
-            pdbox.error("%s could not be deleted" % remote.uri)
-            success = False
+        pdbox.debug("Error deleting %s: %s" % (dbx_uri(path), error))
+        if error.is_path_lookup() and error.get_path_lookup().is_not_found():
+            pdbox.error("%s could not be found" % dbx_uri(path))
+        else:
+            pdbox.error("%s could not be deleted" % dbx_uri(path))
+        success = False
 
     return success
@@ -1,5 +1,9 @@
 import pdbox
 
+from pdbox.cli.common import validate_src_dest
+from pdbox.models import get_local, get_remote, LocalFolder, RemoteFolder
+from pdbox.utils import DropboxError, dbx_uri
+
 
 def sync():
     """
@@ -13,9 +17,12 @@ def sync():
     - follow_symlinks (bool)
     - only_show_errors (bool)
     - delete (bool)
+    - trust_mtime (bool)
+    - chunksize (float or "auto")
+    - workers (int)
     """
     src, dest = pdbox._args["src"], pdbox._args["dst"]
-    if not pdbox.cli.validate_src_dest(src, dest):
+    if not validate_src_dest(src, dest):
         pdbox.error(
             "At least one of <source> or <destination> must be a Dropbox path "
             "with the prefix 'dbx://'",
@@ -32,14 +39,65 @@ def sync():
 
 def sync_inside(src, dest):
     """Synchronize directories inside Dropbox."""
-    return False  # TODO
+    try:
+        remote = get_remote(src)
+    except ValueError:
+        pdbox.error("%s could not be found" % dbx_uri(src))
+        return False
+    if not isinstance(remote, RemoteFolder):
+        pdbox.error("%s is not a folder" % remote.uri)
+        return False
+
+    try:
+        return remote.sync_remote(dest, delete=pdbox._args["delete"])
+    except ValueError as e:  # The destination is a file.
+        pdbox.debug(e)
+        pdbox.error("%s is not a folder" % dbx_uri(dest))
+        return False
+    except DropboxError:
+        pdbox.error("%s could not be synchronized" % dbx_uri(dest))
+        return False
 
 
 def sync_from(src, dest):
     """Synchronize a directory from Dropbox."""
-    return False  # TODO
+    try:
+        remote = get_remote(src)
+    except ValueError:
+        pdbox.error("%s could not be found" % dbx_uri(src))
+        return False
+    if not isinstance(remote, RemoteFolder):
+        pdbox.error("%s is not a folder" % remote.uri)
+        return False
+
+    try:
+        return remote.sync_local(dest, delete=pdbox._args["delete"])
+    except ValueError as e:  # The destination is a file.
+        pdbox.debug(e)
+        pdbox.error("%s is not a folder" % dest)
+        return False
+    except DropboxError:
+        pdbox.error("%s could not be synchronized" % dest)
+        return False
 
 
 def sync_to(src, dest):
     """Synchronize a directory to Dropbox."""
-    return False  # TODO
+    try:
+        local = get_local(src)
+    except ValueError:
+        pdbox.error("%s does not exist" % src)
+        return False
+    if not isinstance(local, LocalFolder):
+        pdbox.error("%s is not a folder" % local.path)
+        return False
+
+    try:
+        return local.sync(dest, delete=pdbox._args["delete"])
+    except ValueError as e:  # The destination is a file.
+        pdbox.debug(e)
+        pdbox.error("%s is not a folder" % dbx_uri(dest))
+        return False
+    except DropboxError:
+        pdbox.error("%s could not be synchronized" % dbx_uri(dest))
+        return False
@@ -0,0 +1,392 @@
+import datetime
+import dropbox
+import hashlib
+import threading
+
+from dropbox.files import (
+    CreateFolderResult,
+    DeleteBatchJobStatus,
+    DeleteBatchLaunch,
+    DeleteBatchResult,
+    DeleteBatchResultData,
+    DeleteBatchResultEntry,
+    DeletedMetadata,
+    DeleteError,
+    DeleteResult,
+    FileMetadata,
+    FolderMetadata,
+    GetMetadataError,
+    ListFolderResult,
+    LookupError,
+    RelocationBatchErrorEntry,
+    RelocationBatchResultEntry,
+    RelocationBatchV2JobStatus,
+    RelocationBatchV2Launch,
+    RelocationBatchV2Result,
+    RelocationError,
+    RelocationResult,
+    UploadSessionFinishError,
+    UploadSessionLookupError,
+    UploadSessionOffsetError,
+    UploadSessionStartResult,
+    WriteConflictError,
+    WriteError,
+)
+
+
+def not_found():
+    """Build the ApiError that Dropbox raises for a missing path."""
+    error = GetMetadataError.path(LookupError.not_found)
+    return dropbox.exceptions.ApiError("fake", error, None, None)
+
+
+def inside(path, folder, recursive):
+    """Determine whether path is listed by list_folder on folder."""
+    if recursive and path == folder:
+        return True  # Recursive listings include the folder itself.
+    if not path.startswith(folder + "/"):
+        return False
+    return recursive or "/" not in path[len(folder) + 1:]
+
+
+class FakeDropbox(object):
+    """
+    An in-memory stand-in for dropbox.Dropbox, for the tests and benchmarks.
+    Only the methods that pdbox uses are implemented, and uploaded data is
+    hashed and measured rather than stored.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # Metadata keyed by lowercase path.
+        self.log = []  # Every change, for list_folder_continue.
+        self.data = {}  # Contents of files uploaded in one go.
+        self.sessions = {}  # Upload sessions keyed by session ID.
+        self.cursors = {}  # Remaining listings keyed by cursor.
+        self.calls = []  # Names of the methods that were called, in order.
+        self.largest = 0  # Size in bytes of the largest payload received.
+        self.page = 2  # Number of entries per list_folder page.
+        self.jobs = {}  # Results of batch jobs, keyed by async job ID.
+        self.busy = set()  # Paths to turn away from the next batch job.
+
+    def call(self, name, data=b""):
+        with self.lock:
+            self.calls.append(name)
+            self.largest = max(self.largest, len(data))
+
+    def add_folder(self, path):
+        meta = FolderMetadata(
+            name=path.split("/")[-1],
+            id="id:%s" % path,
+            path_lower=path.lower(),
+            path_display=path,
+        )
+        with self.lock:
+            self.entries[path.lower()] = meta
+            self.log.append(meta)
+        return meta
+
+    def add_file(self, path, size, content_hash, client_modified=None):
+        now = datetime.datetime(2017, 1, 1)
+        meta = FileMetadata(
+            name=path.split("/")[-1],
+            id="id:%s" % path,
+            client_modified=client_modified or now,
+            server_modified=now,
+            rev="0123456789",
+            size=size,
+            path_lower=path.lower(),
+            path_display=path,
+            content_hash=content_hash,
+        )
+        parent = "/".join(path.split("/")[:-1])
+        with self.lock:
+            if parent and parent.lower() not in self.entries:
+                raise not_found()  # Dropbox would create it, but we don't.
+            self.entries[path.lower()] = meta
+            self.log.append(meta)
+        return meta
+
+    def files_get_metadata(self, path):
+        self.call("files_get_metadata")
+        return self.lookup(path)
+
+    def lookup(self, path):
+        with self.lock:
+            try:
+                return self.entries[path.lower()]
+            except KeyError:
+                raise not_found()
+
+    def files_create_folder_v2(self, path, autorename=False):
+        self.call("files_create_folder_v2")
+        parent = "/".join(path.split("/")[:-1])
+        if parent and parent.lower() not in self.entries:
+            raise not_found()
+        return CreateFolderResult(metadata=self.add_folder(path))
+
+    def files_upload(self, f, path, mode=None, client_modified=None, **kw):
+        self.call("files_upload", f)
+        session = Session()
+        session.append(0, f)
+        meta = self.add_file(path, len(f), session.hash(), client_modified)
+        self.data[path.lower()] = f
+        return meta
+
+    def files_download(self, path, rev=None, extra_headers=None):
+        self.call("files_download")
+        meta = self.lookup(path)
+        data = self.data.get(path.lower(), b"")
+        status = 200
+        if extra_headers and "Range" in extra_headers:
+            start = int(extra_headers["Range"].split("=")[1].rstrip("-"))
+            data, status = data[start:], 206
+        return meta, Response(data, status)
+
+    def files_list_folder(self, path, recursive=False, **kwargs):
+        self.call("files_list_folder")
+        if path and isinstance(self.lookup(path), FileMetadata):
+            raise not_found()
+        with self.lock:
+            entries = [
+                self.entries[k] for k in sorted(self.entries)
+                if inside(k, path.lower(), recursive)
+            ]
+            position = len(self.log)
+        return self.list_page(path.lower(), recursive, entries, position)
+
+    def files_list_folder_continue(self, cursor):
+        self.call("files_list_folder_continue")
+        with self.lock:
+            path, recursive, entries, start, position = self.cursors[cursor]
+            if start >= len(entries):  # The listing is done, so send changes.
+                entries = [
+                    meta for meta in self.log[position:]
+                    if inside(meta.path_lower, path, recursive)
+                ]
+                start = 0
+                position = len(self.log)
+        return self.list_page(path, recursive, entries, position, start)
+
+    def list_page(self, path, recursive, entries, position, start=0):
+        """
+        Get the page of a listing that begins at start, remembering where the
+        rest begins and the position in the change log by its cursor.
+        """
+        end = start + self.page
+        with self.lock:
+            cursor = "cursor%d" % len(self.cursors)
+            self.cursors[cursor] = (path, recursive, entries, end, position)
+        return ListFolderResult(
+            entries=entries[start:end],
+            cursor=cursor,
+            has_more=len(entries) > end,
+        )
+
+    def files_delete_v2(self, path):
+        self.call("files_delete_v2")
+        meta = self.lookup(path)
+        with self.lock:
+            for k in self.subtree(path):
+                del self.entries[k]
+            self.log.append(DeletedMetadata(
+                name=meta.name,
+                path_lower=meta.path_lower,
+                path_display=meta.path_display,
+            ))
+        return DeleteResult(metadata=meta)
+
+    def files_delete_batch(self, entries):
+        self.call("files_delete_batch")
+        results = []
+        for arg in entries:
+            if arg.path.lower() in self.busy:
+                self.busy.discard(arg.path.lower())
+                error = DeleteError.too_many_write_operations
+                results.append(DeleteBatchResultEntry.failure(error))
+                continue
+            try:
+                meta = self.files_delete_v2(arg.path).metadata
+            except dropbox.exceptions.ApiError:
+                error = DeleteError.path_lookup(LookupError.not_found)
+                results.append(DeleteBatchResultEntry.failure(error))
+            else:
+                data = DeleteBatchResultData(metadata=meta)
+                results.append(DeleteBatchResultEntry.success(data))
+        result = DeleteBatchResult(entries=results)
+        return DeleteBatchLaunch.async_job_id(
+            self.job(DeleteBatchJobStatus, result),
+        )
+
+    def files_delete_batch_check(self, async_job_id):
+        self.call("files_delete_batch_check")
+        return self.check(async_job_id)
+
+    def files_copy_v2(self, from_path, to_path, **kwargs):
+        self.call("files_copy_v2")
+        try:
+            meta = self.relocate(from_path, to_path, move=False)
+        except ValueError:
+            raise not_found()
+        return RelocationResult(metadata=meta)
+
+    def files_copy_batch_v2(self, entries, autorename=False):
+        self.call("files_copy_batch_v2")
+        return self.relocate_batch(entries, move=False)
+
+    def files_copy_batch_check_v2(self, async_job_id):
+        self.call("files_copy_batch_check_v2")
+        return self.check(async_job_id)
+
+    def files_move_batch_v2(self, entries, autorename=False, **kwargs):
+        self.call("files_move_batch_v2")
+        return self.relocate_batch(entries, move=True)
+
+    def files_move_batch_check_v2(self, async_job_id):
+        self.call("files_move_batch_check_v2")
+        return self.check(async_job_id)
+
+    def relocate_batch(self, entries, move):
+        results = []
+        for arg in entries:
+            try:
+                meta = self.relocate(arg.from_path, arg.to_path, move)
+            except ValueError as e:
+                error = RelocationBatchErrorEntry.relocation_error(e.args[0])
+                results.append(RelocationBatchResultEntry.failure(error))
+            else:
+                results.append(RelocationBatchResultEntry.success(meta))
+        result = RelocationBatchV2Result(entries=results)
+        return RelocationBatchV2Launch.async_job_id(
+            self.job(RelocationBatchV2JobStatus, result),
+        )
+
+    def relocate(self, src, dest, move):
+        """Copy or move whatever is at src to dest."""
+        if src.lower() not in self.entries:
+            missing = RelocationError.from_lookup(LookupError.not_found)
+            raise ValueError(missing)
+        if dest.lower() in self.entries:
+            conflict = WriteError.conflict(WriteConflictError.file)
+            raise ValueError(RelocationError.to(conflict))
+        for k in self.subtree(src):
+            meta = self.entries[k]
+            path = dest + meta.path_display[len(src):]
+            if isinstance(meta, FolderMetadata):
+                self.add_folder(path)
+            else:
+                self.add_file(
+                    path,
+                    meta.size,
+                    meta.content_hash,
+                    meta.client_modified,
+                )
+                if k in self.data:
+                    self.data[path.lower()] = self.data[k]
+        if move:
+            self.files_delete_v2(src)
+        return self.entries[dest.lower()]
+
+    def subtree(self, path):
+        """
+        Get the keys of path and everything under it, folders before their
+        contents. Only folders need a scan, so big trees stay quick to change.
+        """
+        if not isinstance(self.entries[path.lower()], FolderMetadata):
+            return [path.lower()]
+        return sorted(
+            k for k in self.entries
+            if k == path.lower() or k.startswith(path.lower() + "/")
+        )
+
+    def job(self, status, result):
+        """Start an asynchronous job that finishes with result."""
+        job = "job%d" % len(self.jobs)
+        # Jobs report that they're in progress the first time they're checked.
+        self.jobs[job] = [status.in_progress, status.complete(result)]
+        return job
+
+    def check(self, async_job_id):
+        statuses = self.jobs[async_job_id]
+        return statuses.pop(0) if len(statuses) > 1 else statuses[0]
+
+    def files_upload_session_start(self, f, close=False, **kwargs):
+        self.call("files_upload_session_start", f)
+        with self.lock:
+            session = "session%d" % len(self.sessions)
+            self.sessions[session] = Session()
+        self.sessions[session].append(0, f)
+        return UploadSessionStartResult(session_id=session)
+
+    def files_upload_session_append_v2(self, f, cursor, close=False, **kw):
+        self.call("files_upload_session_append_v2", f)
+        self.session(cursor.session_id).append(cursor.offset, f)
+
+    def files_upload_session_finish(self, f, cursor, commit, **kwargs):
+        self.call("files_upload_session_finish", f)
+        try:
+            session = self.session(cursor.session_id)
+            session.append(cursor.offset, f)
+        except dropbox.exceptions.ApiError as e:
+            error = UploadSessionFinishError.lookup_failed(e.error)
+            raise dropbox.exceptions.ApiError("fake", error, None, None)
+        del self.sessions[cursor.session_id]
+        return self.add_file(
+            commit.path,
+            session.size,
+            session.hash(),
+            commit.client_modified,
+        )
+
+    def session(self, session_id):
+        try:
+            return self.sessions[session_id]
+        except KeyError:
+            error = UploadSessionLookupError.not_found
+            raise dropbox.exceptions.ApiError("fake", error, None, None)
+
+
+class Response(object):
+    """The streamed body of a download."""
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class Session(object):
+    """An upload session that hashes its data as it arrives."""
+    block = 1024 * 1024 * 4  # 4 MB.
+
+    def __init__(self):
+        self.size = 0
+        self.hasher = hashlib.sha256()  # Hashes the block digests.
+        self.current = hashlib.sha256()  # Hashes the block being filled.
+
+    def append(self, offset, f):
+        if offset != self.size:
+            error = UploadSessionLookupError.incorrect_offset(
+                UploadSessionOffsetError(correct_offset=self.size),
+            )
+            raise dropbox.exceptions.ApiError("fake", error, None, None)
+        f = memoryview(f)
+        while len(f):
+            n = self.block - self.size % self.block
+            self.current.update(f[:n])
+            self.size += len(f[:n])
+            f = f[n:]
+            if not self.size % self.block:
+                self.hasher.update(self.current.digest())
+                self.current = hashlib.sha256()
+
+    def hash(self):
+        if self.size % self.block:
+            self.hasher.update(self.current.digest())
+            self.current = hashlib.sha256()
+        return self.hasher.hexdigest()
@@ -0,0 +1,125 @@
+import collections
+import hashlib
+import os
+import pdbox
+
+from pdbox.utils import workers as default_workers
+
+# Dropbox hashes files in blocks of this many bytes.
+BLOCK = 1024 * 1024 * 4  # 4 MB.
+
+
+def hash_files(paths, workers=None):
+    """
+    Get the Dropbox content hashes of the files at paths as a dict keyed by
+    path, using the hash cache where possible.
+    https://www.dropbox.com/developers/reference/content-hash
+    """
+    # Downloads only need ContentHasher, so the cache is loaded on demand.
+    import sqlite3
+    from pdbox.cache import hash_cache, stat_key
+
+    hashes = hash_cache()
+    digests = {}
+    stats = {}  # Stats of the files that need hashing, from beforehand.
+    for path in paths:
+        st = os.stat(path)
+        digest = None
+        if hashes:
+            try:
+                digest = hashes.get(st)
+            except sqlite3.Error as e:  # Another process could have it locked.
+                pdbox.debug(e)
+        if digest:
+            digests[path] = digest
+        else:
+            stats[path] = st
+
+    for path, digest in content_hashes(list(stats), workers=workers).items():
+        pdbox.debug("Hash for %s: %s" % (path, digest))
+        digests[path] = digest
+        # Don't cache a hash of a file that changed while it was being read.
+        st = os.stat(path)
+        if hashes and stat_key(st) == stat_key(stats[path]):
+            try:
+                hashes.put(st, digest)
+            except sqlite3.Error as e:
+                pdbox.debug(e)
+
+    return digests
+
+
+def content_hashes(paths, workers=None):
+    """
+    Get the Dropbox content hashes of the files at paths as a dict keyed by
+    path, without the hash cache.
+    Every 4 MB block of every file is hashed on one pool of threads: hashlib
+    releases the GIL, so both a single large file and many small ones keep
+    all of the workers busy. At most two blocks per worker are in memory.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = workers or default_workers()
+    blocks = dict((path, []) for path in paths)  # Block digests, in order.
+    pending = collections.deque()
+
+    def collect():
+        path, future = pending.popleft()
+        digest = future.result()
+        if digest is not None:
+            blocks[path].append(digest)
+
+    with ThreadPoolExecutor(max_workers=workers) as p:
+        for path in paths:
+            nblocks = (os.path.getsize(path) + BLOCK - 1) // BLOCK
+            for i in range(nblocks):
+                pending.append((path, p.submit(hash_block, path, i)))
+                if len(pending) >= 2 * workers:
+                    collect()
+        while pending:
+            collect()
+
+    return dict(
+        (path, hashlib.sha256(b"".join(digests)).hexdigest())
+        for path, digests in blocks.items()
+    )
+
+
+def hash_block(path, i):
+    """
+    Get the SHA-256 digest of the ith block of the file at path, or None if
+    the file has shrunk since it was measured.
+    """
+    with open(path, "rb") as f:
+        f.seek(i * BLOCK)
+        data = f.read(BLOCK)
+    return hashlib.sha256(data).digest() if data else None
+
+
+class ContentHasher(object):
+    """
+    Compute a Dropbox content hash from data that arrives in pieces of any
+    size, such as a download as it streams in.
+    """
+    def __init__(self):
+        self.hasher = hashlib.sha256()  # Hashes the block digests.
+        self.block = hashlib.sha256()  # Hashes the block being filled.
+        self.filled = 0  # Bytes in the block being filled.
+
+    def update(self, data):
+        data = memoryview(data)
+        while len(data):
+            n = BLOCK - self.filled
+            self.block.update(data[:n])
+            self.filled += len(data[:n])
+            data = data[n:]
+            if self.filled == BLOCK:
+                self.hasher.update(self.block.digest())
+                self.block = hashlib.sha256()
+                self.filled = 0
+
+    def hexdigest(self):
+        hasher = self.hasher.copy()
+        if self.filled:
+            hasher.update(self.block.digest())
+        return hasher.hexdigest()
@@ -0,0 +1,120 @@
+import dropbox
+import pdbox
+import threading
+
+
+class MetadataMemo(object):
+    """
+    Metadata seen in Dropbox during one command, keyed by lowercase path,
+    where None means that nothing is there. Entries come from lookups and
+    listings, and our own writes update them rather than invalidating them.
+    Concurrent lookups of the same path share a single request.
+    Nothing expires, so long-lived processes start a new memo for each
+    command with reset_memo.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        # Folders whose whole contents are in entries, so that anything else
+        # inside them doesn't exist. The root folder is "".
+        self.complete = set()
+        self.pending = {}  # Events for lookups in progress, keyed by path.
+        self.writes = 0  # Number of writes, to discard lookups they overtake.
+
+    def get(self, path, lookup):
+        """
+        Get the metadata at path, calling lookup(path) if it isn't known.
+        Exceptions from lookup are raised and not remembered.
+        """
+        key = path.lower()
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+            if key.rsplit("/", 1)[0] in self.complete:
+                return None
+            event = self.pending.get(key)
+            if event is None:
+                event = self.pending[key] = threading.Event()
+                writes = self.writes
+                owner = True
+            else:
+                owner = False
+
+        if not owner:  # Someone else is looking it up.
+            event.wait()
+            return self.get(path, lookup)
+
+        try:
+            meta = lookup(path)
+            with self.lock:
+                if self.writes == writes:
+                    self.entries[key] = meta
+            return meta
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+
+    def listed(self, metas, folder=None, recursive=False):
+        """
+        Record the metadata from a listing. If folder is given, the listing
+        covered all of that folder's contents, and with recursive set, all
+        of its subfolders' contents too.
+        """
+        with self.lock:
+            for meta in metas:
+                if isinstance(meta, dropbox.files.DeletedMetadata):
+                    continue
+                self.entries[meta.path_lower] = meta
+                folder_meta = isinstance(meta, dropbox.files.FolderMetadata)
+                if recursive and folder_meta:
+                    self.complete.add(meta.path_lower)
+            if folder is not None:
+                self.complete.add("" if folder == "/" else folder.lower())
+
+    def written(self, path, meta=None, complete=True):
+        """
+        Record a change that we made at path, where meta is its new metadata
+        or None if it was deleted.
+        complete is False when we don't know what's inside a new folder.
+        """
+        key = path.lower()
+        with self.lock:
+            self.writes += 1
+            if meta is None or not complete:
+                # Anything that was underneath path has changed.
+                for k in list(self.entries):
+                    if k.startswith(key + "/"):
+                        del self.entries[k]
+                self.complete = set(
+                    k for k in self.complete
+                    if k != key and not k.startswith(key + "/")
+                )
+            self.entries[key] = meta
+            if isinstance(meta, dropbox.files.FolderMetadata) and complete:
+                self.complete.add(key)  # A new folder is empty.
+            # Writing inside a folder means that it and its parents exist,
+            # which the memo might not know yet.
+            parent = key.rsplit("/", 1)[0]
+            while self.entries.get(parent) is None and parent:
+                self.entries.pop(parent, None)
+                grandparent = parent.rsplit("/", 1)[0]
+                self.complete.discard(grandparent)
+                parent = grandparent
+
+
+_memo_lock = threading.Lock()
+
+
+def metadata_memo():
+    """Get the metadata memo for the current command, creating it if needed."""
+    with _memo_lock:
+        if pdbox.memo is None:
+            pdbox.memo = MetadataMemo()
+    return pdbox.memo
+
+
+def reset_memo():
+    """Forget everything in the metadata memo, before a new command."""
+    with _memo_lock:
+        pdbox.memo = None
@@ -1,11 +1,178 @@
+import collections
+import datetime
 import dropbox
+import glob
 import hashlib
-import math
 import os
 import pdbox
 import shutil
+import time
+
+from pdbox.hashing import ContentHasher, hash_files
+from pdbox.metadata import metadata_memo
+from pdbox.utils import (
+    POLL_INTERVAL,
+    DropboxError,
+    dbx_uri,
+    execute,
+    isize,
+    normpath,
+    poll,
+    pool,
+)
+
+# Maximum number of entries in one batch job.
+BATCH_SIZE = 1000
+# Number of times to try a batch job that fails because of too many writes.
+BATCH_ATTEMPTS = 4
+# Number of paths inside one folder that make one page of a listing of the
+# folder worth fetching in get_remotes, instead of looking them up.
+LIST_MIN = 8
+# Number of bytes to write at a time as a download streams in.
+STREAM_CHUNK = 1024 * 1024  # 1 MB.
+# Minimum number of seconds between progress events for one transfer.
+PROGRESS_INTERVAL = 0.2
+# Limits in bytes on the chunks of an upload session with --chunksize auto,
+# which are always a multiple of CHUNK_MIN. Dropbox takes up to 150 MB.
+CHUNK_MIN = 4 * 1024 * 1024  # 4 MB.
+CHUNK_MAX = 148 * 1024 * 1024  # 148 MB.
+# Chunk size in bytes to start with when there's nothing to go on.
+CHUNK_START = 16 * 1024 * 1024  # 16 MB.
+# Number of seconds that an adaptive chunk should take to upload: long
+# enough that the round trip is a small part of it, and short enough that
+# not much is lost when it fails.
+CHUNK_SECONDS = 5.0
+
+# Something that happened to an upload or download:
+# - kind: "start", "progress", "finish" or "fail"
+# - name: The file's local path for uploads, or URI for downloads
+# - done: Number of bytes that Dropbox has received or that have been saved
+# - total: The file's size in bytes
+# - time: When it happened, in seconds since the epoch
+# - error: The exception that a failed transfer raised, or None
+TransferEvent = collections.namedtuple(
+    "TransferEvent",
+    ["kind", "name", "done", "total", "time", "error"],
+)
+_subscribers = []  # Callbacks that receive every TransferEvent.
+
+
+def subscribe(callback):
+    """
+    Call callback with a TransferEvent whenever a transfer starts, makes
+    progress, finishes or fails. Callbacks can be called from any thread.
+    """
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    """Stop sending transfer events to callback."""
+    _subscribers.remove(callback)
+
+
+class ChunkSizer(object):
+    """
+    The size of the next chunk of an upload session. A fixed size never
+    changes. An adaptive size is adjusted after each chunk, towards the size
+    that would take CHUNK_SECONDS at the throughput that the chunk got, by
+    at most a factor of two at a time and within CHUNK_MIN and CHUNK_MAX.
+    """
+    def __init__(self, size, adaptive=False):
+        self.size = size
+        self.adaptive = adaptive
 
-from pdbox.utils import DropboxError, dbx_uri, execute, normpath
+    @staticmethod
+    def tuned():
+        """
+        Get an adaptive ChunkSizer that starts from the size that the last
+        one settled on, or CHUNK_START.
+        """
+        try:
+            with open(pdbox.CHUNKSIZE_PATH) as f:
+                size = int(f.read())
+        except (IOError, OSError, ValueError):
+            size = CHUNK_START
+        sizer = ChunkSizer(CHUNK_START, adaptive=True)
+        sizer.resize(size)
+        return sizer
+
+    def measure(self, n, seconds):
+        """Adapt the size to a chunk of n bytes that took seconds to send."""
+        if not self.adaptive or n < self.size:  # The last chunk is short.
+            return
+        ideal = n / max(seconds, 0.001) * CHUNK_SECONDS
+        self.resize(min(max(ideal, self.size // 2), self.size * 2))
+        pdbox.debug(
+            "Sent %s in %.2fs, next chunk is %s" %
+            (isize(n), seconds, isize(self.size)),
+        )
+
+    def resize(self, size):
+        """Set the size, rounded down to the limits of an adaptive size."""
+        size = int(size) // CHUNK_MIN * CHUNK_MIN
+        self.size = min(max(size, CHUNK_MIN), CHUNK_MAX)
+
+    def save(self):
+        """Keep an adaptive size for the next adaptive ChunkSizer."""
+        if not self.adaptive:
+            return
+        try:
+            with open(pdbox.CHUNKSIZE_PATH, "w") as f:
+                f.write(str(self.size))
+        except (IOError, OSError) as e:
+            pdbox.debug(e)
+
+
+class Transfer(object):
+    """
+    The progress of one upload or download, reported to the subscribers of
+    transfer events. Progress events are sent at most every
+    PROGRESS_INTERVAL seconds, so progress can be reported as often as is
+    convenient. Exiting with an exception sends a failure event.
+    """
+    def __init__(self, name, total):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.started = False
+        self.last = 0  # Time of the last event.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if value is not None:
+            self.send("fail", value)
+        elif self.started:
+            self.send("finish")
+
+    def start(self, done=0):
+        """Start the transfer with done bytes already transferred."""
+        self.done = done
+        if not self.started:
+            self.started = True
+            self.send("start")
+
+    def progress(self, done):
+        """Note that done bytes have been transferred altogether."""
+        self.done = done
+        if _subscribers and time.time() - self.last >= PROGRESS_INTERVAL:
+            self.send("progress")
+
+    def send(self, kind, error=None):
+        if not _subscribers:  # Don't bother on the hot path.
+            return
+        self.last = time.time()
+        event = TransferEvent(
+            kind,
+            self.name,
+            self.done,
+            self.total,
+            self.last,
+            error,
+        )
+        for callback in list(_subscribers):
+            callback(event)
 
 
 def get_remote(path, meta=None):
@@ -23,13 +190,7 @@ def get_remote(path, meta=None):
     path = normpath(path)
     if path == "/":  # get_metadata on the root is not supported.
         return RemoteFolder(path)
-    try:
-        meta = execute(pdbox.dbx.files_get_metadata, path)
-    except DropboxError:
-        raise ValueError("%s could not be found" % dbx_uri(path))
-    if isinstance(meta, dropbox.files.DeletedMetadata):
-        pdbox.debug("%s was recently deleted" % dbx_uri(path))
-        raise ValueError("%s could not be found" % dbx_uri(path))
+    meta = get_metadata(path)
     if isinstance(meta, dropbox.files.FolderMetadata):
         return RemoteFolder(None, meta=meta)
     else:
@@ -38,6 +199,117 @@ def get_remote(path, meta=None):
         return RemoteFile(None, meta=meta)
 
 
+def get_remotes(paths):
+    """
+    Get a RemoteFile or RemoteFolder for each of paths, or None where nothing
+    exists. Paths that share a parent folder are found by listing that
+    folder rather than looking up each of them, but only for as many pages
+    as would be worth it; anything left over is looked up concurrently.
+    """
+    paths = [normpath(path) for path in paths]
+    keys = [path.lower() for path in paths]
+    parents = [key.rsplit("/", 1)[0] or "/" for key in keys]
+    found = {}  # Remote objects, or None, keyed by lowercase path.
+    if not get_snapshot():  # Lookups are free with the snapshot.
+        for parent, n in collections.Counter(parents).items():
+            if n >= LIST_MIN:
+                wanted = set(k for k, p in zip(keys, parents) if p == parent)
+                found.update(list_paths(parent, wanted, n // LIST_MIN))
+
+    def lookup(path):
+        try:
+            return get_remote(path)
+        except ValueError:
+            return None
+
+    missing = [path for path in paths if path.lower() not in found]
+    with pool() as p:
+        for path, remote in zip(missing, p.map(lookup, missing)):
+            found[path.lower()] = remote
+    return [found[key] for key in keys]
+
+
+def list_paths(parent, wanted, max_pages):
+    """
+    Find the lowercase paths in wanted inside the folder parent by listing
+    it, stopping after max_pages pages or once they're all found.
+    Returns a dict of what was found, including None for paths that are
+    known not to exist.
+    """
+    found = {}
+    try:
+        result = execute(
+            pdbox.dbx.files_list_folder,
+            "" if parent == "/" else parent,
+        )
+        pages = 1
+        while True:
+            for meta in result.entries:
+                if meta.path_lower in wanted:
+                    found[meta.path_lower] = get_remote(None, meta=meta)
+            if not result.has_more:  # Everything else doesn't exist.
+                found.update((k, None) for k in wanted if k not in found)
+                metadata_memo().listed(result.entries, folder=parent)
+                break
+            metadata_memo().listed(result.entries)
+            if len(found) == len(wanted) or pages >= max_pages:
+                break
+            result = execute(
+                pdbox.dbx.files_list_folder_continue,
+                result.cursor,
+            )
+            pages += 1
+    except DropboxError as e:
+        pdbox.debug(e)
+    return found
+
+
+def get_metadata(path):
+    """
+    Get the metadata of the file or folder at path, from the metadata cache
+    if it's in use, and otherwise looking up each path at most once per run.
+    Raises: ValueError
+    """
+    path = normpath(path)
+    snapshot = get_snapshot()
+    if snapshot:
+        meta = snapshot.get(path)
+    else:
+        meta = metadata_memo().get(path, lookup_metadata)
+    if meta is None:
+        raise ValueError("%s could not be found" % dbx_uri(path))
+    if isinstance(meta, dropbox.files.DeletedMetadata):
+        pdbox.debug("%s was recently deleted" % dbx_uri(path))
+        raise ValueError("%s could not be found" % dbx_uri(path))
+    return meta
+
+
+def lookup_metadata(path):
+    """Look up the metadata at path in Dropbox, or None if it's not there."""
+    try:
+        return execute(pdbox.dbx.files_get_metadata, path)
+    except DropboxError:
+        return None
+
+
+def get_snapshot():
+    """Get the metadata cache if it can answer lookups, otherwise None."""
+    if pdbox.snapshot and pdbox.snapshot.ready():
+        return pdbox.snapshot
+    return None
+
+
+def written(path, meta=None, complete=True):
+    """
+    Record a change that we made at path in Dropbox, so that the metadata
+    cache stays correct. meta is the new metadata at path, or None if it
+    was deleted. complete is False for copied or moved folders.
+    """
+    metadata_memo().written(path, meta, complete=complete)
+    if pdbox.snapshot:
+        pdbox.snapshot.written(path, meta, complete=complete)
+
+
 def get_local(path):
     """
     Get a LocalFile or LocalFolder from path.
@@ -76,6 +348,167 @@ def local_assert_empty(path):
     raise ValueError("Something exists at %s" % local.path)
 
 
+def delete_batch(paths):
+    """
+    Delete many files or folders inside Dropbox in as few requests as
+    possible. Returns a list with an entry for each path: None if it was
+    deleted, or else the dropbox.files.DeleteError.
+    Raises: DropboxError
+    """
+    paths = [normpath(path) for path in paths]
+    if pdbox._args.get("dryrun"):
+        for path in paths:
+            pdbox.info("Deleted %s" % dbx_uri(path))
+        return [None] * len(paths)
+
+    errors = []
+    for i in range(0, len(paths), BATCH_SIZE):
+        batch = paths[i:i + BATCH_SIZE]
+        results = run_batch(
+            pdbox.dbx.files_delete_batch,
+            pdbox.dbx.files_delete_batch_check,
+            [dropbox.files.DeleteArg(path) for path in batch],
+        )
+        for path, result in zip(batch, results):
+            if result.is_success():
+                pdbox.debug(
+                    "Metadata response: %s" % result.get_success().metadata,
+                )
+                written(path)
+                pdbox.info("Deleted %s" % dbx_uri(path))
+                errors.append(None)
+            else:
+                errors.append(result.get_failure())
+    return errors
+
+
+def relocate_batch(pairs, move=False):
+    """
+    Copy or move many files or folders inside Dropbox in as few requests as
+    possible, where pairs is a list of (source path, destination path).
+    Nothing may exist at any of the destinations.
+    Returns a list with an entry for each pair: None if it was relocated, or
+    else the dropbox.files.RelocationBatchErrorEntry.
+    Raises: DropboxError
+    """
+    pairs = [(normpath(src), normpath(dest)) for src, dest in pairs]
+    verb = "Moved" if move else "Copied"
+    if pdbox._args.get("dryrun"):
+        for src, dest in pairs:
+            pdbox.info("%s %s to %s" % (verb, dbx_uri(src), dbx_uri(dest)))
+        return [None] * len(pairs)
+
+    if move:
+        launch = pdbox.dbx.files_move_batch_v2
+        check = pdbox.dbx.files_move_batch_check_v2
+    else:
+        launch = pdbox.dbx.files_copy_batch_v2
+        check = pdbox.dbx.files_copy_batch_check_v2
+
+    errors = []
+    for i in range(0, len(pairs), BATCH_SIZE):
+        batch = pairs[i:i + BATCH_SIZE]
+        results = run_batch(
+            launch,
+            check,
+            [dropbox.files.RelocationPath(src, dest) for src, dest in batch],
+        )
+        for (src, dest), result in zip(batch, results):
+            if result.is_success():
+                meta = result.get_success()
+                pdbox.debug("Metadata response: %s" % meta)
+                if move:
+                    written(src)
+                written(
+                    dest,
+                    meta,
+                    complete=isinstance(meta, dropbox.files.FileMetadata),
+                )
+                pdbox.info("%s %s to %s" % (verb, dbx_uri(src), dbx_uri(dest)))
+                errors.append(None)
+            elif result.is_failure():
+                errors.append(result.get_failure())
+            else:
+                raise DropboxError(result)
+    return errors
+
+
+def session_error(e):
+    """
+    Get the dropbox.files.UploadSessionLookupError (or the append error,
+    which has the same cases) inside a DropboxError from an upload session,
+    or None if it isn't one.
+    """
+    error = e.args[0]
+    if getattr(error, "is_lookup_failed", lambda: False)():
+        error = error.get_lookup_failed()
+    return error if hasattr(error, "is_incorrect_offset") else None
+
+
+def run_batch(launch, check, entries):
+    """
+    Run a batch job with the dropbox.Dropbox methods launch and check, and
+    return its result entries, which are in the same order as entries.
+    When Dropbox says that there are too many writes, either the whole job
+    or just the entries that were turned away are tried again.
+    Raises: DropboxError
+    """
+    results = [None] * len(entries)
+    pending = list(range(len(entries)))  # Indices of entries to run.
+    delay = POLL_INTERVAL
+    for attempt in range(BATCH_ATTEMPTS):
+        done, error = run_job(launch, check, [entries[i] for i in pending])
+        if done is None:  # The whole job was turned away.
+            retry = pending
+        else:
+            for i, result in zip(pending, done):
+                results[i] = result
+            retry = [i for i, result in zip(pending, done) if is_busy(result)]
+        if not retry or attempt == BATCH_ATTEMPTS - 1:
+            break
+        pdbox.debug(
+            "Too many write operations, retrying %d batch entries" %
+            len(retry),
+        )
+        time.sleep(delay)
+        delay *= 2
+        pending = retry
+
+    if None in results:
+        raise DropboxError(error)
+    return results
+
+
+def run_job(launch, check, entries):
+    """
+    Run one batch job, and return its result entries and None, or None and
+    its error if it failed because there were too many writes.
+    Raises: DropboxError
+    """
+    status = execute(launch, entries)
+    if status.is_async_job_id():
+        status = poll(check, status.get_async_job_id())
+    if status.is_complete():
+        return status.get_complete().entries, None
+
+    failed = getattr(status, "is_failed", lambda: False)()
+    error = status.get_failed() if failed else status
+    if not getattr(error, "is_too_many_write_operations", lambda: False)():
+        raise DropboxError(error)
+    return None, error
+
+
+def is_busy(result):
+    """
+    Determine whether a batch result entry failed because there were too
+    many writes.
+    """
+    if not result.is_failure():
+        return False
+    error = result.get_failure()
+    return getattr(error, "is_too_many_write_operations", lambda: False)()
+
+
 class RemoteObject(object):
     """A file or folder inside Dropbox."""
     def delete(self):
@@ -86,6 +519,7 @@ class RemoteObject(object):
         if not pdbox._args.get("dryrun"):
             result = execute(pdbox.dbx.files_delete_v2, self.path)
             pdbox.debug("Metadata response: %s" % result.metadata)
+            written(self.path)
         pdbox.info("Deleted %s" % self.uri)
 
     def copy(self, dest, overwrite=False):
@@ -120,6 +554,11 @@ class RemoteObject(object):
 
             result = execute(pdbox.dbx.files_copy_v2, self.path, dest)
             pdbox.debug("Metadata respones: %s" % result.metadata)
+            written(
+                dest,
+                result.metadata,
+                complete=isinstance(self, RemoteFile),
+            )
 
         pdbox.info("Copied %s to %s" % (self.uri, dbx_uri(dest)))
         if not pdbox._args.get("dryrun"):  # Return the newly created object.
@@ -150,6 +589,12 @@ class RemoteObject(object):
         if not pdbox._args.get("dryrun"):
             result = execute(pdbox.dbx.files_move_v2, self.path, dest)
             pdbox.debug("Metadata response: %s" % result.metadata)
+            written(self.path)
+            written(
+                dest,
+                result.metadata,
+                complete=isinstance(self, RemoteFile),
+            )
 
         pdbox.info("Moved %s to %s" % (self.path, dbx_uri(dest)))
         if not pdbox._args.get("dryrun"):  # Return the newly created object.
@@ -164,15 +609,9 @@ class RemoteFile(RemoteObject):
             path = normpath(path)
             if path == "/":  # get_metadata on the root is not supported.
                 raise ValueError("The root folder is not a file")
-            try:
-                meta = execute(pdbox.dbx.files_get_metadata, path)
-            except DropboxError:
-                raise ValueError("%s could not be found" % dbx_uri(path))
+            meta = get_metadata(path)
             if isinstance(meta, dropbox.files.FolderMetadata):
                 raise ValueError("%s is a folder" % dbx_uri(meta.path_display))
-            if isinstance(meta, dropbox.files.DeletedMetadata):
-                pdbox.debug("%s was recently deleted" % dbx_uri(path))
-                raise ValueError("%s could not be found" % dbx_uri(path))
 
         self.id = meta.id  # File ID, not sure how this can be used.
         self.size = meta.size  # Size in bytes.
@@ -180,6 +619,8 @@ class RemoteFile(RemoteObject):
         self.parent = "/".join(self.path.split("/")[:-1])  # Parent folder.
         self.name = meta.name  # File name with extension.
         self.modified = meta.server_modified  # Last modified time.
+        # Last modified time on the client that uploaded the file.
+        self.client_modified = meta.client_modified
         self.rev = meta.rev  # Revision, not sure how this can be used.
         self.hash = meta.content_hash  # Hash for comparing the contents.
         self.uri = dbx_uri(self.path)  # Convenience field for display.
@@ -204,37 +645,127 @@ class RemoteFile(RemoteObject):
             if not overwrite:
                 raise ValueError("%s already exists" % local.path)
 
-        # To avoid any weird overwriting behaviour in the case of errors, we'll
-        # download to a different location first, then move to dest afterwards.
-        tmp_dest = os.path.join(
-            pdbox.TMP_DOWNLOAD_DIR,
-            os.path.basename(dest),
-        )
-        while os.path.exists(tmp_dest):  # Make sure the temp name is unique.
-            tmp_dest += "_"
-
         if pdbox._args.get("dryrun"):
             pdbox.info("Downloaded %s to %s" % (self.uri, dest))
             return None
 
-        # TODO: Progress bars.
-        meta = execute(pdbox.dbx.files_download_to_file, tmp_dest, self.path)
-        pdbox.debug("Metadata response: %s" % meta)
+        # To avoid any weird overwriting behaviour in the case of errors, we'll
+        # download to a different location first, then move to dest afterwards.
+        staged = self.stage()
 
         if not os.path.isdir(os.path.dirname(dest)):
             # Create the parent directories of dest.
             os.makedirs(os.path.dirname(dest))
 
-        if not pdbox._args.get("dryrun"):
-            # os.rename overwrites files just fine, but not directories.
-            if local and isinstance(local, LocalFolder):
-                shutil.rmtree(local.path)
-            # Move the file from the temp location to dest.
-            os.rename(tmp_dest, dest)
+        # shutil.move overwrites files just fine, but not directories.
+        if local and isinstance(local, LocalFolder):
+            shutil.rmtree(local.path)
+        # Move the file from the temp location to dest.
+        shutil.move(staged, dest)
 
         pdbox.info("Downloaded %s to %s" % (self.uri, dest))
         return LocalFile(dest)  # Return the newly created file.
 
+    def fetch(self, dest):
+        """
+        Download this file's contents straight to dest, without checking what's
+        already there.
+        Raises: DropboxError
+        """
+        shutil.move(self.stage(), dest)
+
+    def partial(self):
+        """
+        Get the path in the download folder that this revision of this file is
+        downloaded to, which stays the same from one attempt to the next.
+        Partial downloads of other revisions of the file are discarded.
+        """
+        folder = os.path.join(pdbox.TMP_DOWNLOAD_DIR, "partial")
+        try:
+            os.makedirs(folder)
+        except OSError:  # It exists, maybe made by a concurrent download.
+            if not os.path.isdir(folder):
+                raise
+        key = hashlib.sha1(self.path.lower().encode("utf-8")).hexdigest()
+        partial = os.path.join(folder, "%s.%s" % (key, self.rev))
+        for path in glob.glob(os.path.join(folder, "%s.*" % key)):
+            if path != partial:
+                os.remove(path)
+        return partial
+
+    def stage(self, dbx=None):
+        """
+        Download this file's contents to its partial download, carrying on
+        from wherever an interrupted attempt left off, and return its path once
+        the contents match the file's content hash. The download comes from
+        the backend dbx, or pdbox.dbx if it's not given.
+        Raises: DropboxError
+        """
+        partial = self.partial()
+        hasher = ContentHasher()
+        offset = 0
+        if os.path.exists(partial):
+            with open(partial, "rb") as f:  # Hash what's already here.
+                for data in iter(lambda: f.read(STREAM_CHUNK), b""):
+                    hasher.update(data)
+                    offset += len(data)
+            if offset > self.size:  # Not a prefix of this file, start over.
+                hasher, offset = ContentHasher(), 0
+            else:
+                pdbox.debug("Resuming download of %s from byte %d" %
+                            (self.uri, offset))
+
+        if offset < self.size or not os.path.exists(partial):
+            with Transfer(self.uri, self.size) as transfer:
+                transfer.start(offset)
+                hasher = self.stream(
+                    partial,
+                    offset,
+                    hasher,
+                    transfer,
+                    dbx or pdbox.dbx,
+                )
+
+        if hasher.hexdigest() != self.hash:
+            os.remove(partial)
+            raise DropboxError(
+                "Downloaded contents of %s don't match its content hash" %
+                self.uri,
+            )
+        return partial
+
+    def stream(self, partial, offset, hasher, transfer, dbx):
+        """
+        Download this file's contents from offset onwards from the backend dbx
+        to the end of partial, feeding them to the ContentHasher hasher and
+        reporting them to the Transfer transfer. Returns the hasher, which is a
+        new one if the whole file had to be downloaded again.
+        Raises: DropboxError
+        """
+        # The revision is pinned so that a range is of the same contents.
+        headers = {"Range": "bytes=%d-" % offset} if offset else None
+        meta, response = execute(
+            dbx.files_download,
+            self.path,
+            rev=self.rev,
+            extra_headers=headers,
+        )
+        pdbox.debug("Metadata response: %s" % meta)
+        try:
+            if offset and response.status_code != 206:
+                # The range was ignored and the whole file is coming.
+                hasher, offset = ContentHasher(), 0
+                transfer.progress(offset)
+            with open(partial, "ab" if offset else "wb") as f:
+                for data in response.iter_content(STREAM_CHUNK):
+                    f.write(data)
+                    hasher.update(data)
+                    offset += len(data)
+                    transfer.progress(offset)
+        finally:
+            response.close()
+        return hasher
+
 
 class RemoteFolder(RemoteObject):
     """A folder in Dropbox."""
@@ -250,15 +781,9 @@ class RemoteFolder(RemoteObject):
                 self.name = "/"
                 self.uri = "dbx://"
                 return
-            try:
-                meta = execute(pdbox.dbx.files_get_metadata, path)
-            except DropboxError:
-                raise ValueError("%s could not be found" % dbx_uri(path))
+            meta = get_metadata(path)
             if isinstance(meta, dropbox.files.FileMetadata):
                 raise ValueError("%s is a file" % dbx_uri(meta.path_display))
-            if isinstance(meta, dropbox.files.DeletedMetadata):
-                pdbox.debug("%s was recently deleted" % dbx_uri(path))
-                raise ValueError("%s does not exist" % dbx_uri(path))
 
         self.id = meta.id  # Folder ID, not sure how this can be used.
         self.path = meta.path_display  # Path to the folder, including name.
@@ -289,31 +814,90 @@ class RemoteFolder(RemoteObject):
         if not pdbox._args.get("dryrun"):
             result = execute(pdbox.dbx.files_create_folder_v2, path)
             pdbox.debug("Metadata response: %s" % result.metadata)
+            written(path, result.metadata)
 
         pdbox.info("Created new folder %s" % dbx_uri(path))
 
         if not pdbox._args.get("dryrun"):  # Return the newly created folder.
             return RemoteFolder(None, meta=result.metadata)
 
-    def contents(self):
-        """Get this folder's contents in Dropbox."""
+    def contents(self, recursive=False):
+        """
+        Get this folder's contents in Dropbox.
+        If recursive is set, everything underneath the folder is listed.
+        """
+        return [entry for page in self.pages(recursive) for entry in page]
+
+    def pages(self, recursive=False):
+        """
+        Get this folder's contents in Dropbox a page at a time, as each page
+        of the listing arrives.
+        If recursive is set, everything underneath the folder is listed.
+        Raises: DropboxError
+        """
+        snapshot = get_snapshot()
+        if snapshot:
+            yield [
+                get_remote(None, meta=e)
+                for e in snapshot.children(self.path, recursive=recursive)
+            ]
+            return
+
         # list_folder on "/" isn't supported for some reason.
         path = "" if self.path == "/" else self.path
-        result = execute(pdbox.dbx.files_list_folder, path)
-        entries = [get_remote(None, meta=e) for e in result.entries]
-
-        # TODO: Verify that this works.
-        while result.has_more:
-            # As long as there are more pages to look through,
-            # add their contents to the list of entries.
-            more = execute(pdbox.dbx.files_list_folder_continue, result.cursor)
-            entries.extend(get_remote(None, meta=e) for e in more)
+        result = execute(
+            pdbox.dbx.files_list_folder,
+            path,
+            recursive=recursive,
+        )
+        metas = []
+        while True:
+            metas.extend(result.entries)
+            # A recursive listing includes the folder itself.
+            yield [
+                get_remote(None, meta=e) for e in result.entries
+                if e.path_lower != self.path.lower()
+            ]
+            if not result.has_more:
+                break
+            # As long as there are more pages to look through, get them.
+            result = execute(
+                pdbox.dbx.files_list_folder_continue,
+                result.cursor,
+            )
+        metadata_memo().listed(metas, folder=self.path, recursive=recursive)
 
-        return entries
+    def search(self, query):
+        """
+        Search Dropbox for files and folders inside this folder that match
+        query, a page of results at a time, as each page arrives.
+        Raises: DropboxError
+        """
+        options = dropbox.files.SearchOptions(
+            path=None if self.path == "/" else self.path,
+        )
+        result = execute(pdbox.dbx.files_search_v2, query, options=options)
+        while True:
+            yield [
+                get_remote(None, meta=match.metadata.get_metadata())
+                for match in result.matches
+                if match.metadata.is_metadata() and not isinstance(
+                    match.metadata.get_metadata(),
+                    dropbox.files.DeletedMetadata,
+                )
+            ]
+            if not result.has_more:
+                break
+            result = execute(
+                pdbox.dbx.files_search_continue_v2,
+                result.cursor,
+            )
 
     def download(self, dest, overwrite=False):
         """
         Download this folder to dest locally.
+        Every file underneath the folder is downloaded concurrently by a pool
+        of worker threads.
         Raises:
         - ValueError
         - DropboxError
@@ -327,6 +911,10 @@ class RemoteFolder(RemoteObject):
             if not overwrite:
                 raise ValueError("%s already exists" % local.path)
 
+        if pdbox._args.get("dryrun"):
+            pdbox.info("Downloaded %s to %s" % (self.uri, dest))
+            return None
+
         # To avoid any weird overwriting behaviour in the case of errors, we'll
         # download to a different location first, then move to dest afterwards.
         tmp_dest = os.path.join(
@@ -334,49 +922,104 @@ class RemoteFolder(RemoteObject):
             os.path.basename(dest),
         )
         while os.path.exists(tmp_dest):
-            dest += "_"  # Make sure the temp name is unique.
-
-        LocalFolder.create(tmp_dest, overwrite=overwrite)
-
-        for entry in self.contents():
-            try:
-                entry.download(os.path.join(tmp_dest, entry.name))
-            except Exception:
-                pdbox.error("%s could not be downloaded" % self.uri)
+            tmp_dest += "_"  # Make sure the temp name is unique.
+
+        entries = self.contents(recursive=True)
+
+        # Recreate the folder structure first, parents before children.
+        # Only the last component of path_display is guaranteed to have the
+        # right case, so local paths are built up from each entry's name.
+        folders = {self.path.lower().rstrip("/"): tmp_dest}
+        os.makedirs(tmp_dest)
+        for e in sorted(
+                filter(lambda e: isinstance(e, RemoteFolder), entries),
+                key=lambda e: e.path.count("/"),
+        ):
+            path = os.path.join(folders[e.parent.lower()], e.name)
+            os.mkdir(path)
+            folders[e.path.lower()] = path
+
+        from concurrent.futures import as_completed
+        failures = []
+        with pool() as p:
+            futures = {}
+            for e in filter(lambda e: isinstance(e, RemoteFile), entries):
+                path = os.path.join(folders[e.parent.lower()], e.name)
+                futures[p.submit(e.fetch, path)] = e
+            for future in as_completed(futures):
+                e = future.exception()
+                if e is not None:
+                    pdbox.debug(e)
+                    failures.append(futures[future].uri)
+
+        if failures:
+            for uri in sorted(failures):
+                pdbox.error("%s could not be downloaded" % uri)
+            raise DropboxError(
+                "%d file(s) in %s could not be downloaded, check %s" %
+                (len(failures), self.uri, tmp_dest),
+            )
 
-        if not pdbox._args.get("dryrun"):
-            # os.rename overwrites files just fine, but not directories.
-            if local and isinstance(local, LocalFolder):
-                shutil.rmtree(local.path)
-            # Move the folder from the temp location to dest.
-            shutil.move(tmp_dest, dest)
+        # os.rename overwrites files just fine, but not directories.
+        if local and isinstance(local, LocalFolder):
+            shutil.rmtree(local.path)
+        elif local:
+            os.remove(local.path)
+        # Move the folder from the temp location to dest.
+        shutil.move(tmp_dest, dest)
 
         pdbox.info("Downloaded %s to %s" % (self.uri, dest))
+        return LocalFolder(dest)  # Return the newly created folder.
 
-    def sync(self, other):
+    def sync(self, other, delete=False):
         """
         Synchronize this folder to other.
         If dest is a LocalFolder or string, it is synchronized locally.
         If dest is a RemoteFolder, it is synchronized to that remote folder.
+        If delete is set, anything in other that isn't in this folder is
+        deleted. Returns whether every operation succeeded.
         """
         if isinstance(other, str) or isinstance(other, LocalFolder):
-            return self.sync_local(other)
+            return self.sync_local(other, delete=delete)
         else:
-            return self.sync_remote(other)
+            return self.sync_remote(other, delete=delete)
 
-    def sync_local(self, other):
+    def sync_local(self, other, delete=False):
         """
         Synchronize this folder to other locally.
         dest is either a string or a LocalFoler.
+        Raises: ValueError
         """
-        pass  # TODO
-
-    def sync_remote(self, other):
+        if not isinstance(other, LocalFolder):
+            try:
+                other = LocalFolder(other)
+            except ValueError:  # Nothing exists at other, so create it.
+                local_assert_empty(other)
+                other = LocalFolder.create(other)
+                if not other:  # Dry run.
+                    return True
+        import pdbox.sync
+        return pdbox.sync.sync(self, other, delete=delete)
+
+    def sync_remote(self, other, delete=False):
         """
         Synchronize this folder to other inside Dropbox.
-        dest is a RemoteFolder.
+        other is either a RemoteFolder or a string (in which case it is
+        converted to a RemoteFolder, which is created if necessary).
+        Raises:
+        - ValueError
+        - DropboxError
         """
-        pass  # TODO
+        if not isinstance(other, RemoteFolder):
+            try:
+                other = RemoteFolder(other)
+            except ValueError:  # Nothing exists at other, so create it.
+                remote_assert_empty(other)
+                other = RemoteFolder.create(other)
+                if not other:  # Dry run.
+                    return True
+        import pdbox.sync
+        return pdbox.sync.sync(self, other, delete=delete)
 
 
 class LocalFile(object):
@@ -397,21 +1040,10 @@ class LocalFile(object):
     def hash(self):
         """
         Get this file's hash according to Dropbox's algorithm.
+        Hashes are cached until the file changes.
         https://www.dropbox.com/developers/reference/content-hash
         """
-        block = 1024 * 1024 * 4  # 4 MB.
-        hasher = hashlib.sha256()
-
-        with open(self.path, "rb") as f:
-            while True:
-                chunk = f.read(block)
-                if not chunk:
-                    break
-                hasher.update(hashlib.sha256(chunk).digest())
-
-        digest = hasher.hexdigest()
-        pdbox.debug("Hash for %s: %s" % (self.path, digest))
-        return digest
+        return hash_files([self.path])[self.path]
 
     def upload(self, dest, overwrite=False):
         """
@@ -433,11 +1065,27 @@ class LocalFile(object):
             if not overwrite:
                 raise ValueError("%s exists" % remote.uri)
 
+        return self.send(dest, overwrite=overwrite)
+
+    def send(self, dest, overwrite=False, dbx=None):
+        """
+        Upload this file to dest in the backend dbx, or pdbox.dbx if it's not
+        given, without any checks.
+        The file's modification time is kept as the upload's client_modified.
+        Raises: DropboxError
+        """
+        dbx = dbx or pdbox.dbx
+        dest = normpath(dest)
         # Uploading can either happen all at once (with a 150 MB limit),
         # or in chunks. If the file is smaller than the selected chunk size,
         # then try to upload in one go.
-        chunksize = min(pdbox._args.get("chunksize", 149.0), 149.0)
-        pdbox.debug("Chunk size: %.2f MB" % chunksize)
+        chunksize = pdbox._args.get("chunksize") or 149.0
+        if chunksize == "auto":
+            sizer = ChunkSizer.tuned()
+        else:
+            chunksize = min(chunksize, 149.0)
+            sizer = ChunkSizer(max(int(chunksize * 1024 * 1024), 1))
+        pdbox.debug("Chunk size: %.2f MB" % (sizer.size / 1024.0 ** 2))
         if pdbox._args.get("dryrun"):
             pdbox.info("Uploaded %s to %s" % (self.path, dbx_uri(dest)))
             return None
@@ -448,43 +1096,144 @@ class LocalFile(object):
         else:
             mode = dropbox.files.WriteMode.add
 
-        chunk = int(chunksize * 1024 * 1024)  # Convert B to MB.
-
         with open(self.path, "rb") as f:
-            data = f.read()
-        sz = len(data)
-
-        # TODO: Progress bars.
-        if sz < chunk:  # One-shot upload.
-            meta = execute(pdbox.dbx.files_upload, data, dest, mode)
-        else:  # Multipart upload.
-            nchunks = math.ceil(sz / chunk)
-            # Initiate the upload with just the first byte.
-            start = execute(pdbox.dbx.files_upload_session_start, f[0])
-            cursor = dropbox.files.UploadSessionCursor(start.session_id, 1)
-
-            # Now just add each chunk.
-            while sz - cursor.offset > chunk:
-                pdbox.debug(
-                    "Uploading chunk %d/%d" % (cursor.offset % chunk, nchunks),
-                )
-                execute(
-                    pdbox.dbx.files_upload_session_append_v2,
-                    data[cursor.offset:cursor.offset + chunk],
-                    cursor,
-                )
-                cursor.offset += chunk
-
-            # Upload the remaining to finish the transaction.
-            meta = execute(
-                pdbox.dbx.files_upload_session_finish,
-                data[cursor.offset:],
-                dropbox.files.CommitInfo(dest, mode),
-            )
+            # Only ever hold one chunk in memory, whatever the file's size.
+            st = os.fstat(f.fileno())
+            sz = st.st_size
+            # Dropbox only keeps whole seconds.
+            modified = datetime.datetime.utcfromtimestamp(int(st.st_mtime))
+            with Transfer(self.path, sz) as transfer:
+                if sz < sizer.size:  # One-shot upload.
+                    transfer.start()
+                    meta = execute(
+                        dbx.files_upload,
+                        f.read(),
+                        dest,
+                        mode,
+                        client_modified=modified,
+                    )
+                    transfer.progress(sz)
+                else:  # Multipart upload.
+                    commit = dropbox.files.CommitInfo(
+                        dest,
+                        mode,
+                        client_modified=modified,
+                    )
+                    meta = self.send_chunks(
+                        f,
+                        st,
+                        sizer,
+                        commit,
+                        transfer,
+                        dbx,
+                    )
 
+        written(dest, meta)
         pdbox.info("Uploaded %s to %s" % (self.path, dbx_uri(dest)))
         return RemoteFile(None, meta=meta)
 
+    def send_chunks(self, f, st, sizer, commit, transfer, dbx):
+        """
+        Upload the open file f with os.stat_result st through an upload
+        session of the backend dbx, in chunks whose sizes come from the
+        ChunkSizer sizer, and commit it with commit, reporting progress to the
+        Transfer transfer.
+        The session is journaled after every chunk, so that uploading the
+        same unchanged file to the same place again picks up where an
+        interrupted upload left off.
+        Raises: DropboxError
+        """
+        sz = st.st_size
+        from pdbox.cache import upload_journal
+        journal = upload_journal()
+        resumed = journal and journal.get(self.path, commit.path, st)
+        if resumed:
+            cursor = dropbox.files.UploadSessionCursor(*resumed)
+            pdbox.info(
+                "Resuming upload of %s at %s" %
+                (self.path, isize(cursor.offset)),
+            )
+            transfer.start(cursor.offset)
+        else:
+            # Initiate the upload with the first chunk.
+            transfer.start()
+            data = f.read(sizer.size)
+            pdbox.debug("Uploading %s of %s" % (isize(len(data)), isize(sz)))
+            began = time.time()
+            start = execute(dbx.files_upload_session_start, data)
+            sizer.measure(len(data), time.time() - began)
+            cursor = dropbox.files.UploadSessionCursor(
+                start.session_id,
+                len(data),
+            )
+            transfer.progress(cursor.offset)
+            journal and journal.put(
+                self.path,
+                commit.path,
+                st,
+                cursor.session_id,
+                cursor.offset,
+            )
+
+        while True:
+            f.seek(cursor.offset)
+            data = f.read(min(sizer.size, sz - cursor.offset))
+            pdbox.debug(
+                "Uploading %s of %s at %s" %
+                (isize(len(data)), isize(sz), isize(cursor.offset)),
+            )
+            began = time.time()
+            try:
+                if cursor.offset + len(data) < sz:  # Add the next chunk.
+                    execute(
+                        dbx.files_upload_session_append_v2,
+                        data,
+                        cursor,
+                    )
+                else:  # Upload the rest to finish the transaction.
+                    meta = execute(
+                        dbx.files_upload_session_finish,
+                        data,
+                        cursor,
+                        commit,
+                    )
+                    transfer.progress(sz)
+                    sizer.measure(len(data), time.time() - began)
+                    break
+            except DropboxError as e:
+                error = session_error(e)
+                if error is not None and error.is_incorrect_offset():
+                    # Dropbox has more or less than the journal said.
+                    offset = error.get_incorrect_offset().correct_offset
+                    pdbox.debug("Upload session is at offset %d" % offset)
+                    if offset > sz:
+                        raise
+                    cursor.offset = offset
+                    transfer.progress(offset)
+                    continue
+                if not resumed or error is None:
+                    raise
+                # The session expired or was closed, so start over.
+                pdbox.debug("Upload session %s is gone" % cursor.session_id)
+                journal.remove(self.path, commit.path)
+                f.seek(0)
+                return self.send_chunks(f, st, sizer, commit, transfer, dbx)
+
+            sizer.measure(len(data), time.time() - began)
+            cursor.offset += len(data)
+            transfer.progress(cursor.offset)
+            journal and journal.put(
+                self.path,
+                commit.path,
+                st,
+                cursor.session_id,
+                cursor.offset,
+            )
+
+        journal and journal.remove(self.path, commit.path)
+        sizer.save()
+        return meta
+
     def delete(self):
         """Delete this file locally."""
         pdbox._args.get("dryrun") or os.remove(self.path)
@@ -530,6 +1279,13 @@ class LocalFolder(object):
         pdbox.info("Created new folder %s" % path)
         return None if pdbox._args.get("dryrun") else LocalFolder(path)
 
+    def pages(self):
+        """
+        Get this folder's contents locally, in one page, like
+        RemoteFolder.pages.
+        """
+        yield self.contents()
+
     def contents(self):
         """Get this folder's contents locally."""
         entries = []
@@ -541,18 +1297,62 @@ class LocalFolder(object):
     def upload(self, dest, overwrite=False):
         """
         Upload this folder to dest in Dropbox.
+        Folders are created in order as the tree is walked, and the files
+        inside them are uploaded concurrently by a pool of worker threads.
         Raises:
         - ValueError
         - DropboxError
-        TODO: Parallel batch upload.
         https://www.dropbox.com/developers/reference/data-ingress-guide
         """
         dest = normpath(dest)
         remote_assert_empty(dest)
 
+        from concurrent.futures import as_completed
         remote = RemoteFolder.create(dest)
-        for entry in self.contents():
-            entry.upload("/".join([remote.path, entry.name]))
+        failures = []
+        futures = {}
+        follow = pdbox._args.get("follow_symlinks", True)
+
+        with pool() as p:
+            # Each folder's remote path, keyed by its local path.
+            folders = {self.path: dest}
+            for root, dirs, files in os.walk(self.path, followlinks=follow):
+                parent = folders[root]
+                # Create subfolders before walking into them, so that every
+                # folder exists before any of its files are uploaded.
+                for d in list(dirs):
+                    path = "/".join([parent, d])
+                    try:
+                        RemoteFolder.create(path)
+                    except (ValueError, DropboxError) as e:
+                        pdbox.debug(e)
+                        failures.append(os.path.join(root, d))
+                        dirs.remove(d)  # Don't walk into it.
+                    else:
+                        folders[os.path.join(root, d)] = path
+                for f in files:
+                    try:
+                        local = LocalFile(os.path.join(root, f))
+                    except ValueError as e:  # A broken link, or it's gone.
+                        pdbox.debug(e)
+                        failures.append(os.path.join(root, f))
+                        continue
+                    future = p.submit(local.upload, "/".join([parent, f]))
+                    futures[future] = local.path
+
+            for future in as_completed(futures):
+                e = future.exception()
+                if e is not None:
+                    pdbox.debug(e)
+                    failures.append(futures[future])
+
+        if failures:
+            for path in sorted(failures):
+                pdbox.error("%s could not be uploaded" % path)
+            raise DropboxError(
+                "%d item(s) in %s could not be uploaded" %
+                (len(failures), self.path),
+            )
         return remote
 
     def delete(self):
@@ -560,10 +1360,24 @@ class LocalFolder(object):
         pdbox._args.get("dryrun") or shutil.rmtree(self.path)
         pdbox.info("Deleted %s/" % self.path)
 
-    def sync(self, other):
+    def sync(self, other, delete=False):
         """
         Synchronize this folder to other.
         other is either a RemoteFolder or a string (in which case it is
-        converted to a RemoteFolder).
+        converted to a RemoteFolder, which is created if necessary).
+        If delete is set, anything in other that isn't in this folder is
+        deleted. Returns whether every operation succeeded.
+        Raises:
+        - ValueError
+        - DropboxError
         """
-        pass  # TODO
+        if not isinstance(other, RemoteFolder):
+            try:
+                other = RemoteFolder(other)
+            except ValueError:  # Nothing exists at other, so create it.
+                remote_assert_empty(other)
+                other = RemoteFolder.create(other)
+                if not other:  # Dry run.
+                    return True
+        import pdbox.sync
+        return pdbox.sync.sync(self, other, delete=delete)
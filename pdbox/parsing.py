@@ -1,8 +1,7 @@
 import argparse
+import importlib
 import logging
 import pdbox
-import pdbox.cli as cli
-import pdbox.tui as tui
 
 
 def parse_args():
@@ -14,6 +13,36 @@ def parse_args():
         action="store_true",
         help="show debug messages",
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="serve metadata from a local snapshot of your Dropbox, which is "
+        "built in the background over the first runs",
+    )
+    parser.add_argument(
+        "--stale",
+        action="store_true",
+        help="with --cache, update the snapshot in the background",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="show the progress and throughput of uploads and downloads",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=pdbox.DEFAULT_RETRIES,
+        help="number of times to retry a request that fails because of rate "
+        "limiting, a server error or a dropped connection (default %d)" %
+        pdbox.DEFAULT_RETRIES,
+    )
+    parser.add_argument(
+        "--local",
+        metavar="DIR",
+        help="use the folder DIR in place of your Dropbox, to try things out "
+        "or measure them offline",
+    )
     subparsers = parser.add_subparsers(dest="cmd")
     subparsers.required = True
     parse_ls(subparsers)
@@ -22,6 +51,7 @@ def parse_args():
     parse_mkdir(subparsers)
     parse_rm(subparsers)
     parse_rmdir(subparsers)
+    parse_sync(subparsers)
     parse_tui(subparsers)
     args = parser.parse_args()
     if args.debug:
@@ -29,13 +59,37 @@ def parse_args():
     return args
 
 
+def command(module, name):
+    """
+    Get a function that runs the function name from module, which is only
+    imported when it's called. Only the command that runs is loaded, along
+    with the dependencies that it needs.
+    """
+    def run():
+        return getattr(importlib.import_module(module), name)()
+    return run
+
+
+def chunksize(s):
+    """
+    Parse a --chunksize argument, which is a number of MB or "auto".
+    Raises: argparse.ArgumentTypeError
+    """
+    if s == "auto":
+        return s
+    try:
+        return float(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is not a number or auto" % s)
+
+
 def parse_cp(subparsers):
     """Add arguments for the cp command."""
     cp = subparsers.add_parser(
         "cp",
         help="copy files",
     )
-    cp.set_defaults(func=cli.cp, follow_symlinks=True)
+    cp.set_defaults(func=command("pdbox.cli.cp", "cp"), follow_symlinks=True)
     cp.add_argument(
         "src",
         metavar="<source ...>",
@@ -87,10 +141,18 @@ def parse_cp(subparsers):
     cp.add_argument(
         "-c",
         "--chunksize",
-        type=float,
+        type=chunksize,
         nargs="?",
         default=149,  # Dropbox maximum is 150 MB.
-        help="chunk size in MB for splitting large uploads",
+        help="chunk size in MB for splitting large uploads, or auto to adapt "
+        "it to the connection's throughput",
+    )
+    cp.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=pdbox.DEFAULT_WORKERS,
+        help="number of files to transfer concurrently",
     )
 
 
@@ -100,7 +162,7 @@ def parse_ls(subparsers):
         "ls",
         help="list folders",
     )
-    ls.set_defaults(func=cli.ls)
+    ls.set_defaults(func=command("pdbox.cli.ls", "ls"))
     ls.add_argument(
         "path",
         metavar="<path ...>",
@@ -139,7 +201,7 @@ def parse_mkdir(subparsers):
         "mkdir",
         help="create folders",
     )
-    mkdir.set_defaults(func=cli.mkdir)
+    mkdir.set_defaults(func=command("pdbox.cli.mkdir", "mkdir"))
     mkdir.add_argument(
         "path",
         metavar="<path ...>",
@@ -159,7 +221,7 @@ def parse_mv(subparsers):
         "mv",
         help="move files or folders",
     )
-    mv.set_defaults(func=cli.mv)
+    mv.set_defaults(func=command("pdbox.cli.mv", "mv"))
     mv.add_argument(
         "src",
         metavar="<source ...>",
@@ -211,10 +273,18 @@ def parse_mv(subparsers):
     mv.add_argument(
         "-c",
         "--chunksize",
-        type=float,
+        type=chunksize,
         nargs="?",
         default=149,  # Dropbox maximum is 150 MB.
-        help="chunk size in MB for splitting large uploads",
+        help="chunk size in MB for splitting large uploads, or auto to adapt "
+        "it to the connection's throughput",
+    )
+    mv.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=pdbox.DEFAULT_WORKERS,
+        help="number of files to transfer concurrently",
     )
 
 
@@ -224,7 +294,7 @@ def parse_rmdir(subparsers):
         "rmdir",
         help="delete folders",
     )
-    rmdir.set_defaults(func=cli.rmdir)
+    rmdir.set_defaults(func=command("pdbox.cli.rmdir", "rmdir"))
     rmdir.add_argument(
         "path",
         metavar="<folder ...>",
@@ -251,7 +321,7 @@ def parse_rm(subparsers):
         "rm",
         help="delete files or folders",
     )
-    rm.set_defaults(func=cli.rm)
+    rm.set_defaults(func=command("pdbox.cli.rm", "rm"))
     rm.add_argument(
         "path",
         metavar="<path ...>",
@@ -282,6 +352,91 @@ def parse_rm(subparsers):
         action="store_true",
         help="only display errors and warnings",
     )
+    rm.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=pdbox.DEFAULT_WORKERS,
+        help="number of paths to look up concurrently",
+    )
+
+
+def parse_sync(subparsers):
+    """Add arguments for the sync command."""
+    sync = subparsers.add_parser(
+        "sync",
+        help="synchronize folders",
+    )
+    sync.set_defaults(
+        func=command("pdbox.cli.sync", "sync"),
+        follow_symlinks=True,
+    )
+    sync.add_argument(
+        "src",
+        metavar="<source>",
+        help="folder to synchronize from",
+    )
+    sync.add_argument(
+        "dst",
+        metavar="<destination>",
+        help="folder to synchronize to",
+    )
+    sync.add_argument(
+        "--dryrun",
+        action="store_true",
+        help="display operations without performing them",
+    )
+    sync.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="don't display operations",
+    )
+    sync.add_argument(
+        "--delete",
+        action="store_true",
+        help="delete files in the destination that aren't in the source",
+    )
+    sync.add_argument(
+        "--trust-mtime",
+        action="store_true",
+        help="don't compare the contents of files with the same size and "
+        "modification time",
+    )
+    symlinks = sync.add_mutually_exclusive_group()
+    symlinks.add_argument(
+        "--follow-symlinks",
+        dest="follow_symlinks",
+        action="store_true",
+        help="follow symbolic links on the local filesystem",
+    )
+    symlinks.add_argument(
+        "--no-follow-symlinks",
+        dest="follow_symlinks",
+        action="store_false",
+        help="don't follow symbolic links on the local filesystem",
+    )
+    sync.add_argument(
+        "--only-show-errors",
+        action="store_true",
+        help="only display errors and warnings",
+    )
+    sync.add_argument(
+        "-c",
+        "--chunksize",
+        type=chunksize,
+        nargs="?",
+        default=149,  # Dropbox maximum is 150 MB.
+        help="chunk size in MB for splitting large uploads, or auto to adapt "
+        "it to the connection's throughput",
+    )
+    sync.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=pdbox.DEFAULT_WORKERS,
+        help="number of files to transfer concurrently",
+    )
 
 
 def parse_tui(subparsers):
@@ -290,4 +445,4 @@ def parse_tui(subparsers):
         "tui",
         help="run pdbox in an interactive TUI",
     )
-    ui.set_defaults(func=tui.run)
+    ui.set_defaults(func=command("pdbox.tui", "run"))
@@ -0,0 +1,272 @@
+import calendar
+import os
+import pdbox
+import shutil
+import sys
+import unicodedata
+
+from concurrent.futures import as_completed
+from pdbox.hashing import hash_files
+from pdbox.models import LocalFile, LocalFolder, RemoteFolder
+from pdbox.utils import DropboxError, pool
+
+
+class Plan(object):
+    """The operations that make one folder match another."""
+    def __init__(self, src, dest):
+        self.src = src  # LocalFolder or RemoteFolder to copy from.
+        self.dest = dest  # LocalFolder or RemoteFolder to copy to.
+        self.mkdirs = []  # Relative paths of folders to create, in order.
+        self.transfers = []  # (relative path, source file) to copy over.
+        self.deletes = []  # Files or folders to delete from dest.
+        self.conflicts = []  # Relative paths of file/folder mismatches.
+
+    def __len__(self):
+        return len(self.mkdirs) + len(self.transfers) + len(self.deletes)
+
+
+def sync(src, dest, delete=False):
+    """
+    Make the folder dest match the folder src.
+    Each of them is a LocalFolder or a RemoteFolder, but they can't both be
+    local. If delete is set, anything in dest that isn't in src is deleted.
+    Returns whether every operation succeeded.
+    """
+    plan = diff(src, dest, delete=delete)
+    pdbox.debug(
+        "Sync plan: %d folder(s) to create, %d file(s) to copy, "
+        "%d item(s) to delete" %
+        (len(plan.mkdirs), len(plan.transfers), len(plan.deletes)),
+    )
+    if not plan:
+        pdbox.info("%s is up to date" % display(dest))
+    return run(plan) and not plan.conflicts
+
+
+def diff(src, dest, delete=False):
+    """
+    Compare the folders src and dest and plan the operations that make dest
+    match src. Both sides are listed once and merge-joined by their
+    normalized relative paths. Files of the same size are compared by their
+    content hashes: remote hashes come with the listing, and local files
+    are hashed concurrently. With --trust-mtime, files that also have the
+    same modification time aren't hashed.
+    """
+    plan = Plan(src, dest)
+    src_entries = sorted(entries(src))
+    dest_entries = sorted(entries(dest))
+    # Keys of paths that can't be synchronized, along with their contents.
+    skipped = collisions(src_entries, plan) | collisions(dest_entries, plan)
+    deleted = None  # The last folder planned for deletion.
+    suspects = []  # Files with the same size, to compare by hash.
+    i = j = 0
+
+    while i < len(src_entries) or j < len(dest_entries):
+        if j == len(dest_entries) or (
+                i < len(src_entries) and
+                src_entries[i][0] < dest_entries[j][0]):
+            # Only in src.
+            k, rel, entry = src_entries[i]
+            if not is_skipped(k, skipped):
+                if is_folder(entry):
+                    plan.mkdirs.append(rel)
+                else:
+                    plan.transfers.append((rel, entry))
+            i += 1
+        elif i == len(src_entries) or src_entries[i][0] > dest_entries[j][0]:
+            # Only in dest.
+            k, _, entry = dest_entries[j]
+            # Deleting a folder deletes everything inside it.
+            if (delete and not is_skipped(k, skipped) and
+                    not (deleted and k[:len(deleted)] == deleted)):
+                plan.deletes.append(entry)
+                if is_folder(entry):
+                    deleted = k
+            j += 1
+        else:  # In both.
+            k, rel, entry = src_entries[i]
+            other = dest_entries[j][2]
+            if is_skipped(k, skipped):
+                pass
+            elif is_folder(entry) != is_folder(other):
+                pdbox.error(
+                    "%s and %s are not both files or both folders" %
+                    (display(entry), display(other)),
+                )
+                plan.conflicts.append(rel)
+                skipped.add(k)  # Leave whichever side is a folder alone.
+            elif not is_folder(entry):
+                if entry.size != other.size:
+                    plan.transfers.append((rel, entry))
+                elif not (pdbox._args.get("trust_mtime") and
+                          mtime(entry) == mtime(other)):
+                    suspects.append((rel, entry, other))
+            i += 1
+            j += 1
+
+    # Local files that might have changed are all hashed together at the end.
+    digests = hash_files([
+        f.path for _, entry, other in suspects for f in [entry, other]
+        if isinstance(f, LocalFile)
+    ])
+    for rel, entry, other in suspects:
+        if content_hash(entry, digests) != content_hash(other, digests):
+            plan.transfers.append((rel, entry))
+
+    return plan
+
+
+def collisions(entries, plan):
+    """
+    Find the paths in sorted entries that only differ from each other in
+    case or Unicode normalization, which Dropbox can't tell apart. They're
+    reported as conflicts, and their keys are returned.
+    """
+    keys = set()
+    for (k, rel, entry), (other_k, _, other) in zip(entries, entries[1:]):
+        if k == other_k:
+            pdbox.error(
+                "%s and %s can't both be synchronized" %
+                (display(entry), display(other)),
+            )
+            if k not in keys:
+                plan.conflicts.append(rel)
+            keys.add(k)
+    return keys
+
+
+def is_skipped(k, skipped):
+    """Determine whether the key k or any of its parents is in skipped."""
+    return any(k[:n] in skipped for n in range(1, len(k) + 1))
+
+
+def run(plan):
+    """
+    Carry out a plan: folders are created in order, then files are copied
+    and deleted concurrently by the worker pool.
+    Returns whether every operation succeeded.
+    """
+    failures = []
+
+    for rel in plan.mkdirs:
+        try:
+            if isinstance(plan.dest, RemoteFolder):
+                RemoteFolder.create(join(plan.dest, rel))
+            else:
+                LocalFolder.create(join(plan.dest, rel))
+        except (ValueError, DropboxError) as e:
+            pdbox.debug(e)
+            failures.append(join(plan.dest, rel))
+
+    with pool() as p:
+        futures = {}
+        for rel, entry in plan.transfers:
+            path = join(plan.dest, rel)
+            futures[p.submit(transfer, entry, plan.dest, path)] = path
+        for entry in plan.deletes:
+            futures[p.submit(entry.delete)] = display(entry)
+        for future in as_completed(futures):
+            e = future.exception()
+            if e is not None:
+                pdbox.debug(e)
+                failures.append(futures[future])
+
+    for path in sorted(failures):
+        pdbox.error("%s could not be synchronized" % path)
+    return not failures
+
+
+def transfer(entry, folder, path):
+    """
+    Copy the file entry to path inside folder, replacing whatever is there.
+    """
+    if isinstance(entry, LocalFile):
+        entry.send(path, overwrite=True)
+    elif isinstance(folder, RemoteFolder):  # Both files are in Dropbox.
+        entry.copy(path, overwrite=True)
+    else:
+        download(entry, path)
+
+
+def download(remote, path):
+    """
+    Download the RemoteFile remote to path by way of the download folder,
+    keeping its modification time so that it compares equal next time.
+    """
+    if pdbox._args.get("dryrun"):
+        pdbox.info("Downloaded %s to %s" % (remote.uri, path))
+        return
+    staged = remote.stage()
+    modified = calendar.timegm(remote.client_modified.utctimetuple())
+    os.utime(staged, (modified, modified))
+    shutil.move(staged, path)
+    pdbox.info("Downloaded %s to %s" % (remote.uri, path))
+
+
+def entries(folder):
+    """
+    List everything underneath folder as (key, relative path, entry) tuples,
+    where the key is the relative path normalized for comparison.
+    Sorting by key puts everything inside a folder straight after it.
+    """
+    if isinstance(folder, LocalFolder):
+        follow = pdbox._args.get("follow_symlinks", True)
+        for root, dirs, files in os.walk(folder.path, followlinks=follow):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, folder.path).replace(os.sep, "/")
+                if name in dirs:
+                    yield key(rel), rel, LocalFolder(path)
+                else:
+                    yield key(rel), rel, LocalFile(path)
+    else:
+        # Only the last component of path_display is guaranteed to have the
+        # right case, so relative paths are built up from each entry's name.
+        rels = {folder.path.lower().rstrip("/"): ""}
+        for e in sorted(
+                folder.contents(recursive=True),
+                key=lambda e: e.path.count("/"),
+        ):
+            rel = "/".join(filter(None, [rels[e.parent.lower()], e.name]))
+            if isinstance(e, RemoteFolder):
+                rels[e.path.lower()] = rel
+            yield key(rel), rel, e
+
+
+def mtime(f):
+    """Get a file's modification time in whole seconds."""
+    if isinstance(f, LocalFile):
+        return int(os.path.getmtime(f.path))
+    return calendar.timegm(f.client_modified.utctimetuple())
+
+
+def content_hash(f, digests):
+    """Get a file's Dropbox content hash, given the hashes of local files."""
+    return digests[f.path] if isinstance(f, LocalFile) else f.hash
+
+
+def key(rel):
+    """
+    Normalize a relative path for comparison the way Dropbox does, and split
+    it into its components.
+    """
+    if isinstance(rel, bytes):  # From os.walk on Python 2.
+        rel = rel.decode(sys.getfilesystemencoding())
+    return tuple(unicodedata.normalize("NFC", rel).lower().split("/"))
+
+
+def join(folder, rel):
+    """Get the path of rel inside folder."""
+    if isinstance(folder, LocalFolder):
+        return os.path.join(folder.path, *rel.split("/"))
+    return "/".join([folder.path.rstrip("/"), rel])
+
+
+def is_folder(entry):
+    """Determine whether entry is a folder."""
+    return isinstance(entry, (LocalFolder, RemoteFolder))
+
+
+def display(entry):
+    """Get a displayable path for a file or folder."""
+    return getattr(entry, "uri", entry.path)
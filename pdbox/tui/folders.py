@@ -0,0 +1,70 @@
+import collections
+import time
+
+# Seconds that a folder's contents are shown without listing it again.
+FOLDER_TTL = 120
+# Number of folders whose contents are kept for each working directory.
+FOLDER_CACHE_SIZE = 100
+
+
+class FolderCache(object):
+    """
+    The contents of folders listed recently, so that going back to one
+    shows it straight away. Folders are keyed by whatever identifies them,
+    such as their path, and contents are only used within ttl seconds of
+    being listed. Past size folders, the least recently used is forgotten.
+    It's only used from the UI thread, so there's no locking.
+    """
+    def __init__(self, ttl=FOLDER_TTL, size=FOLDER_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = collections.OrderedDict()  # (contents, listed time).
+
+    def get(self, key):
+        """Get a copy of the contents of the folder key, or None."""
+        try:
+            contents, listed = self.entries.pop(key)
+        except KeyError:
+            return None
+        if time.time() - listed > self.ttl:
+            return None  # Out of date, so it stays forgotten.
+        self.entries[key] = contents, listed  # Now the most recently used.
+        return list(contents)
+
+    def put(self, key, contents):
+        """Remember contents, a list of entries, for the folder key."""
+        self.entries.pop(key, None)
+        self.entries[key] = list(contents), time.time()
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        """Determine whether the folder key's contents are up to date."""
+        entry = self.entries.get(key)
+        return entry is not None and time.time() - entry[1] <= self.ttl
+
+    def clear(self):
+        """Forget every folder."""
+        self.entries.clear()
+
+
+class Search(object):
+    """
+    What Dropbox finds for query inside folder, a RemoteFolder, which a
+    working directory shows in place of a folder's contents. Its path is
+    only what the results are cached as, and can't be a real path, and its
+    parent is the folder that's searched.
+    """
+    def __init__(self, query, folder):
+        self.query = query
+        self.folder = folder
+        self.path = "search:%s:%s" % (folder.path, query)
+        self.parent = folder.path
+        self.uri = '%s, search "%s"' % (folder.uri, query)
+
+    def pages(self):
+        """
+        Get the results a page at a time, as each page arrives.
+        Raises: DropboxError
+        """
+        return self.folder.search(self.query)
@@ -0,0 +1,84 @@
+import pdbox
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2.
+    import Queue as queue
+
+
+class Job(object):
+    """A listing being fetched in the background by a Loader."""
+    def __init__(self, name, pages):
+        self.name = name  # What the job is for, such as a pane.
+        self.pages = pages  # Iterable of lists of entries.
+        self.cancelled = threading.Event()
+        self.done = False  # Whether the last page has been received.
+
+
+class Loader(object):
+    """
+    Fetch listings on background threads and hand their pages to the UI
+    thread, which polls for them, so that the UI never waits for Dropbox.
+    There's at most one job with each name: starting another cancels the
+    first, and nothing more is received from it.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()  # (Job, page or None, error or None).
+        self.jobs = {}  # Current jobs keyed by name.
+
+    def start(self, name, pages):
+        """
+        Start iterating pages, an iterable of lists of entries, on a
+        background thread as the job name, and return the Job.
+        """
+        self.cancel(name)
+        job = self.jobs[name] = Job(name, pages)
+        # A daemon thread, so that quitting doesn't wait for a slow listing.
+        thread = threading.Thread(target=self.run, args=(job,))
+        thread.daemon = True
+        thread.start()
+        return job
+
+    def run(self, job):
+        """Fetch the pages of job, until it's finished or cancelled."""
+        error = None
+        try:
+            for page in job.pages:
+                if job.cancelled.is_set():
+                    return
+                self.queue.put((job, page, None))
+        except Exception as e:
+            pdbox.debug(e)
+            error = e
+        if not job.cancelled.is_set():
+            self.queue.put((job, None, error))
+
+    def cancel(self, name):
+        """Stop the job name from fetching any more pages."""
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job.cancelled.set()
+
+    def busy(self, name):
+        """Determine whether the job name is still fetching."""
+        return name in self.jobs
+
+    def poll(self):
+        """
+        Get what's arrived from current jobs since the last poll, without
+        waiting, as a list of (Job, page, error). The page is None once a
+        job is over, and then error is what went wrong, if anything.
+        """
+        received = []
+        while True:
+            try:
+                job, page, error = self.queue.get_nowait()
+            except queue.Empty:
+                return received
+            if self.jobs.get(job.name) is not job:
+                continue  # It's been cancelled or replaced.
+            if page is None:
+                del self.jobs[job.name]
+                job.done = True
+            received.append((job, page, error))
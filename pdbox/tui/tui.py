@@ -3,6 +3,15 @@ import curses.textpad
 import math
 import os
 import pdbox
+import pdbox.cache
+import pdbox.metadata
+import pdbox.models
+
+from pdbox.tui.folders import FolderCache, Search
+from pdbox.tui.loader import Loader
+
+# Milliseconds to wait for a keypress before checking on background listings.
+POLL_INTERVAL = 100
 
 KEY_UP = [curses.KEY_UP]
 KEY_DOWN = [curses.KEY_DOWN]
@@ -34,15 +43,24 @@ class TUI:
             math.ceil(curses.COLS / 2),
         )
         remotewin.keypad(1)
+        for win in [localwin, remotewin]:
+            win.idlok(True)  # Let the terminal scroll lines itself.
+
+        # Folder listings are fetched in the background.
+        self.loader = Loader()
 
         # Working directories.
         self.local = WorkingDirectory(
             pdbox.models.get_local(os.curdir),
             localwin,
+            self.loader,
+            "local",
         )
         self.remote = WorkingDirectory(
             pdbox.models.get_remote("/"),
             remotewin,
+            self.loader,
+            "remote",
         )
 
         self.status = curses.newwin(1, curses.COLS, 0, 0)  # Status bar.
@@ -51,25 +69,55 @@ class TUI:
         self.selected = None  # Currently selected item(s).
         self.active = self.local  # Currently focused window.
         self.inactive = self.remote  # The other window.
+        self.local.focus(True)
 
         curses.curs_set(0)
         curses.wrapper(self.run)
 
     def run(self, _):
         """Run the TUI."""
+        # Stop waiting for keys every so often to show what's been loaded.
+        self.status.timeout(POLL_INTERVAL)
         self.reload()
+        changed = True
         while True:
-            self.display()
-            if not self.keypress():
+            if self.receive() or self.loading():
+                changed = True
+            if changed:
+                self.display()
+            changed = self.keypress()
+            if changed is None:
                 break
+            if not changed:  # Look ahead while nothing's going on.
+                self.active.prefetch()
+
+    def receive(self):
+        """
+        Add the pages of folder listings that have arrived to the working
+        directories, and return whether there were any.
+        """
+        received = self.loader.poll()
+        for job, page, error in received:
+            for wd in [self.local, self.remote]:
+                wd.receive(job, page, error)
+        return bool(received)
+
+    def loading(self):
+        """Determine whether either working directory is being listed."""
+        return self.local.loading or self.remote.loading
 
     def keypress(self):
-        """Parse a keypress into a command."""
+        """
+        Parse a keypress into a command. Returns None to quit, or whether
+        there was a keypress.
+        """
         try:
             c = self.status.getch()
         except KeyboardInterrupt:
             return None
 
+        if c == -1:  # No key was pressed in time.
+            return False
         if c in KEY_Q:
             return None
         if c in KEY_UP:
@@ -77,15 +125,11 @@ class TUI:
         elif c in KEY_DOWN:
             self.active.movedown()
         elif c in KEY_LEFT:
-            self.active = self.local
-            self.inactive = self.remote
-            self.remote.win.erase()
+            self.switch(self.local, self.remote)
         elif c in KEY_RIGHT:
-            self.active = self.remote
-            self.inactive = self.local
-            self.local.win.erase()
+            self.switch(self.remote, self.local)
         elif c in KEY_SPACE:
-            self.inactive.selected.clear()
+            self.inactive.deselect()
             self.active.select()
         elif c in KEY_ENTER:
             self.active.cd()
@@ -100,19 +144,30 @@ class TUI:
 
         return True
 
+    def switch(self, active, inactive):
+        """Focus the working directory active instead of inactive."""
+        self.active = active
+        self.inactive = inactive
+        active.focus(True)
+        inactive.focus(False)
+
     def help(self):
         pass  # TODO
 
     def command(self, cmd):
         if not cmd:
             return
+        pdbox.metadata.reset_memo()
+        args = ""
         try:
             cmd, args = cmd.split(maxsplit=1)
         except ValueError:
             pass
 
-        if cmd in ["search", "find"]:
-            pass  # TODO: Search for args.
+        if cmd in ["search", "find"] and args:
+            # Results are in Dropbox, whichever window is focused.
+            self.switch(self.remote, self.local)
+            self.remote.search(args)
         elif cmd in ["copy", "cp"]:
             pass  # TODO: Copy inactive selection to active window.
         elif cmd in ["move", "mv"]:
@@ -134,7 +189,9 @@ class TUI:
         if not prompt.endswith(" "):
             prompt += " "
         inputbar.addstr(0, 1, prompt)
-        self.refresh(inputbar)
+        self.local.invalidate()
+        self.remote.invalidate()
+        self.display(inputbar)
 
         curses.curs_set(1)
         try:
@@ -146,46 +203,18 @@ class TUI:
         y, x = self.active.win.getmaxyx()
         self.local.win.resize(y + 1, x)
         self.remote.win.resize(y + 1, x)
-
-        # Erase the bottom border of the shortened windows.
-        self.local.win.move(self.local.win.getmaxyx()[0] - 2, 0)
-        self.local.win.deleteln()
-        self.remote.win.move(self.remote.win.getmaxyx()[0] - 2, 0)
-        self.remote.win.deleteln()
-
-        self.refresh()
+        # Redraw over the input bar and the shortened windows' borders.
+        self.local.invalidate()
+        self.remote.invalidate()
         return cmd.lower().strip()
 
-    def borders(self):
-        """Draw borders on the main windows."""
-        self.local.win.border()
-        self.remote.win.border()
-        local = self.local.folder.path.replace(os.path.expanduser("~"), "~")
-        self.local.win.addstr(
-            0,
-            4,
-            " [ %s (%d) ] " % (local, self.local.length),
-        )
-        self.remote.win.addstr(
-            0,
-            4,
-            " [ %s (%d) ] " % (self.remote.folder.uri, self.remote.length),
-        )
-
-    def refresh(self, *wins):
-        """Refresh all windows."""
-        self.borders()
-        self.status.refresh()
-        self.local.win.refresh()
-        self.remote.win.refresh()
-        for win in wins:
-            win.refresh()
-
     def reload(self):
-        """Reload the contents of the working directories."""
+        """Start reloading the contents of the working directories."""
+        pdbox.metadata.reset_memo()  # Pick up changes made by anyone else.
+        self.local.forget()
+        self.remote.forget()
         self.local.reload()
-        self.remote.reload()
-        self.refresh()
+        self.remote.reload(caught_up(self.remote.folder.pages()))
 
     def nselected(self):
         self.status.erase()
@@ -195,21 +224,40 @@ class TUI:
         else:
             self.status.addstr(0, self.status.getmaxyx()[1] - 2 - len(s), s)
 
-    def display(self):
-        """Display the contents of the working directories on screen."""
+    def display(self, *wins):
+        """
+        Display what's changed in the working directories on screen, along
+        with wins, in a single update of the terminal.
+        """
         self.local.display()
         self.remote.display()
-        self.active.highlight()
         # self.nselected()
-        self.refresh()
+        self.status.noutrefresh()
+        for win in wins:
+            win.noutrefresh()
+        curses.doupdate()
 
 
 class WorkingDirectory:
     """A working directory being displayed on screen."""
-    def __init__(self, folder, win):
-        self.folder = folder  # RemoteFolder or LocalFolder.
+    def __init__(self, folder, win, loader, name):
+        self.folder = folder  # RemoteFolder, LocalFolder or Search.
+        self.kind = type(folder)  # Class of the folders shown.
         self.win = win  # ncurses window.
-        self.contents = None  # None until TUI.reload is called.
+        self.loader = loader  # Loader that fetches the contents.
+        self.name = name  # Name of the Loader job for the contents.
+        # None until TUI.reload is called, or if the listing failed.
+        self.contents = None
+        self.loading = False  # Whether more contents are on their way.
+        self.listing = None  # Loader job that the contents come from.
+        self.cache = FolderCache()  # Contents of folders listed before.
+        # Loader jobs listing folders that might be opened next, with the
+        # folder and what's arrived so far, keyed by what they're for.
+        self.prefetches = {}
+        # Folders whose prefetch failed, which aren't tried again until the
+        # next reload or change of directory.
+        self.failed = set()
+        self.history = []  # Folders that cd came from, the latest last.
         self.offset = 0  # Start index of what's on screen.
         self.length = 0  # Number of items in contents.
         self.selected = []  # Indices of currently selected items.
@@ -218,93 +266,205 @@ class WorkingDirectory:
         # but 1-indexed with respect to the folder contents (contents begin
         # on row 1).
         self.cursor = 1
+        self.active = False  # Whether the cursor is shown.
+        # Only what's changed since the last display is drawn again.
+        self.stale = True  # Whether the whole window needs drawing.
+        self.damaged = set()  # Rows that need drawing.
+        self.drawn = None  # Title on the top border.
+
+    def damage(self, *rows):
+        """Mark rows to be drawn again on the next display."""
+        self.damaged.update(rows)
+
+    def invalidate(self):
+        """Mark the whole window to be drawn again on the next display."""
+        self.stale = True
 
     def display(self):
-        """Display the contents of this directory on screen."""
+        """Display what's changed in this directory on screen."""
+        ymax, xmax = self.win.getmaxyx()
+        if self.stale:
+            self.win.erase()
+            self.win.border()
+            self.drawn = None
+            if self.contents is None:
+                self.win.addstr(
+                    2,
+                    2,
+                    "Getting folder contents failed, try refreshing",
+                )
+            elif not self.contents and self.loading:
+                self.win.addstr(2, 2, "Loading...")
+            elif not self.contents:
+                self.win.addstr(2, 2, "No contents")
+            else:
+                self.damage(*range(1, ymax - 1))
+            self.stale = False
+
+        title = self.title()
+        if title != self.drawn:
+            if self.drawn is not None:  # Draw over the old one.
+                self.win.hline(0, 1, curses.ACS_HLINE, xmax - 2)
+            self.win.addnstr(0, 4, title, xmax - 5)
+            self.drawn = title
+
+        if self.contents:
+            for y in sorted(self.damaged):
+                if 1 <= y < ymax - 1:  # Leave the borders alone.
+                    self.draw(y)
+        self.damaged.clear()
+        self.win.noutrefresh()
+
+    def draw(self, y):
+        """Draw the row y of the window, including its side borders."""
+        xmax = self.win.getmaxyx()[1]
+        i = self.offset + y - 1
+        line = ""
+        attr = curses.A_NORMAL
+        if i < self.length:
+            entry = self.contents[i]
+            # Search results could be anywhere in the folder.
+            name = entry.path if self.searching() else entry.name
+            name = "%s/" % name if is_folder(entry) else name
+            line = "[%s] %s" % ("x" if i in self.selected else " ", name)
+            if self.active and y == self.cursor:
+                attr = curses.A_REVERSE
+        self.win.addch(y, 0, curses.ACS_VLINE)
+        self.win.addstr(y, 1, " ")
+        self.win.addnstr(y, 2, line, xmax - 4, attr)
+        self.win.addstr(" " * max(xmax - 3 - len(line), 1))
+        self.win.addch(y, xmax - 1, curses.ACS_VLINE)
+
+    def scroll(self, lines):
+        """
+        Scroll the rows between the borders by lines, up if it's positive.
+        Only the row that's uncovered needs drawing afterwards.
+        """
         ymax = self.win.getmaxyx()[0]
-        if self.contents is None:
-            self.win.addstr(
-                2,
-                2,
-                "Getting folder contents failed, try refreshing",
-            )
-        elif not self.contents:
-            self.win.addstr(2, 2, "No contents")
+        self.win.setscrreg(1, ymax - 2)
+        self.win.scrollok(True)
+        self.win.scroll(lines)
+        self.win.scrollok(False)
+        self.win.setscrreg(0, ymax - 1)  # Borders can be drawn to the end.
+
+    def title(self):
+        """Get the title for the top border."""
+        if self.kind is pdbox.models.LocalFolder:
+            path = self.folder.path.replace(os.path.expanduser("~"), "~")
         else:
-            for i, entry in enumerate(self.contents[self.offset:]):
-                y = i + 1  # Start underneath the border.
-                if y >= ymax - 1:  # Leave a border space at the bottom.
-                    break
-                if is_folder(entry):
-                    display_str = "%s/" % entry.name
-                else:
-                    display_str = entry.name
-                x = "x" if i + self.offset in self.selected else " "
-                self.win.addstr(y, 2, "[%s] %s" % (x, display_str))
+            path = self.folder.uri
+        if self.loading:
+            return " [ %s (%d, loading) ] " % (path, self.length)
+        return " [ %s (%d) ] " % (path, self.length)
 
-    def reload(self):
-        """Reload the contents of this directory."""
-        try:
-            self.contents = self.folder.contents()
-        except Exception as e:
-            pdbox.debug(e)
-            self.contents = None
-            self.length = 0
-        else:
-            self.length = len(self.contents)
-        finally:
-            self.win.erase()
-            self.offset = 0  # Reset to the top of the folder.
-            self.cursor = 1
+    def focus(self, active):
+        """Show or hide the cursor, when this directory is (in)active."""
+        self.active = active
+        self.damage(self.cursor)
 
-    def highlight(self):
+    def reload(self, pages=None):
         """
-        Highlight the ith entry in the window. i is 1-indexed.
-        We'll also redraw the two adjacent entries, since one of them might
-        have been highlighted previously.
+        Start reloading the contents of this directory in the background,
+        from pages if it's given, and otherwise from listing the folder.
+        Any listing that's still going is abandoned.
         """
-        if not self.contents or self.cursor > len(self.contents):
-            return
-        self.win.addstr(
-            self.cursor,
-            2,
-            self.win.instr(self.cursor, 2),
-            curses.A_REVERSE,
+        self.stop()
+        self.listing = self.loader.start(
+            self.name,
+            pages or self.folder.pages(),
         )
+        self.show([], loading=True)
 
-        if self.cursor > 1:
-            self.win.addstr(
-                self.cursor - 1,
-                2,
-                self.win.instr(self.cursor - 1, 2),
-            )
-        if self.cursor < self.win.getmaxyx()[0] - 2:
-            self.win.addstr(
-                self.cursor + 1,
-                2,
-                self.win.instr(self.cursor + 1, 2),
-            )
+    def show(self, contents, loading=False):
+        """
+        Show contents from the top, where loading is whether more are on
+        their way.
+        """
+        self.contents = contents
+        self.length = len(contents)
+        self.loading = loading
+        self.invalidate()
+        self.offset = 0  # Reset to the top of the folder.
+        self.cursor = 1
+
+    def stop(self):
+        """Abandon the listing that the contents come from, if any."""
+        if self.listing is not None:
+            self.loader.cancel(self.listing.name)
+            self.listing = None
+
+    def forget(self):
+        """Forget the contents of every folder, and stop prefetching."""
+        self.cache.clear()
+        self.failed.clear()
+        for job, _, _ in self.prefetches.values():
+            self.loader.cancel(job.name)
+        self.prefetches.clear()
+
+    def key(self, path):
+        """Get the key in the cache of the folder at path."""
+        if self.kind is pdbox.models.LocalFolder:
+            return path
+        return (path or "/").lower()  # Dropbox ignores case.
+
+    def receive(self, job, page, error):
+        """
+        Take a page of contents for the Loader job, if it's one of this
+        directory's. page is None when the job is over, and then error is
+        what went wrong, if anything.
+        """
+        if job is not self.listing:
+            self.prefetched(job, page, error)
+            return
+        if page is None:
+            self.listing = None
+            self.loading = False
+            if error is not None:
+                self.contents = None
+                self.length = 0
+                self.invalidate()
+                return
+            self.cache.put(self.key(self.folder.path), self.contents)
+            if not self.contents:
+                self.invalidate()  # Replace the loading message.
+            return
+        if page and not self.contents:
+            self.invalidate()  # Replace the loading message.
+        start = self.length
+        self.contents.extend(page)
+        self.length = len(self.contents)
+        # Draw the new entries that landed on screen.
+        self.damage(*range(
+            start - self.offset + 1,
+            min(self.length - self.offset, self.win.getmaxyx()[0] - 2) + 1,
+        ))
 
     def moveup(self):
         """Move the cursor up one place, scrolling if necessary."""
         if self.cursor == 1 and not self.offset:
             pass  # Already at the top.
         elif self.cursor == 1:
-            self.win.erase()
             self.offset -= 1  # At the top of the page, scroll up.
+            self.scroll(-1)
+            self.damage(1, 2)
         else:
-            self.cursor -= 1  # Anywhere else.
+            self.damage(self.cursor)  # Anywhere else.
+            self.cursor -= 1
+            self.damage(self.cursor)
 
     def movedown(self):
         """Move the cursor down one place, scrolling if necessary."""
         ymax = self.win.getmaxyx()[0] - 1
-        if self.cursor == ymax or self.offset + self.cursor == self.length:
+        if self.cursor == ymax or self.offset + self.cursor >= self.length:
             pass  # Already at the bottom.
         elif self.cursor == ymax - 1:
-            self.win.erase()
             self.offset += 1  # At the bottom of the page, scroll down.
+            self.scroll(1)
+            self.damage(self.cursor - 1, self.cursor)
         else:
-            self.cursor += 1  # Anywhere else.
+            self.damage(self.cursor)  # Anywhere else.
+            self.cursor += 1
+            self.damage(self.cursor)
 
     def select(self):
         """Mark the item under the cursor as selected."""
@@ -313,26 +473,164 @@ class WorkingDirectory:
             self.selected.remove(i)
         else:
             self.selected.append(i)
+        self.damage(self.cursor)
+
+    def deselect(self):
+        """Unmark all the selected items."""
+        self.damage(*[i - self.offset + 1 for i in self.selected])
+        del self.selected[:]
 
     def cd(self):
         """Change directory to the folder under the cursor."""
-        entry = self.contents[self.cursor - 1]
+        entry = self.entry()
         if is_folder(entry):
-            self.folder = entry
-            self.reload()
-            self.selected.clear()
+            self.history.append(self.folder)
+            self.open(entry)
 
     def back(self):
-        """Go to the parent directory."""
-        self.selected.clear()
-        if not is_folder(self.folder):
+        """
+        Go to the parent directory, or back to the search results that this
+        folder was opened from.
+        """
+        self.deselect()
+        if self.history and isinstance(self.history[-1], Search):
+            self.open(self.history.pop())
             return
-        try:
-            self.folder = type(self.folder)(self.folder.parent)
-        except ValueError as e:
-            pdbox.debug(e)  # TODO: Deal with this.
+        parent = self.parent()
+        if parent is None:
+            if self.key(self.folder.parent) == self.key(self.folder.path):
+                return  # Already at the top.
+            try:
+                parent = self.kind(self.folder.parent)
+            except ValueError as e:
+                pdbox.debug(e)  # TODO: Deal with this.
+                return
+        if parent in self.history:  # Forget where it led.
+            del self.history[self.history.index(parent):]
+        self.open(parent)
+
+    def search(self, query):
+        """
+        Show what Dropbox finds for query inside this folder, as the pages
+        of results arrive, or inside the folder that was searched last if
+        these are search results. Results are cached like contents.
+        """
+        if self.searching():
+            folder = self.folder.folder
         else:
-            self.reload()
+            folder = self.folder
+            self.history.append(folder)
+        self.open(Search(query, folder))
+
+    def searching(self):
+        """Determine whether search results are being shown."""
+        return isinstance(self.folder, Search)
+
+    def open(self, folder):
+        """
+        Show the contents of folder, from the cache or a prefetch if
+        possible, and otherwise by listing it.
+        """
+        self.folder = folder
+        del self.selected[:]
+        self.failed.clear()  # Give them another go from here.
+        key = self.key(folder.path)
+        contents = self.cache.get(key)
+        if contents is not None:
+            self.stop()
+            self.show(contents)
+            return
+        for name, (job, prefetched, entries) in list(self.prefetches.items()):
+            if self.key(prefetched.path) == key:  # It's on its way already.
+                del self.prefetches[name]
+                self.stop()
+                self.listing = job
+                self.show(entries, loading=True)
+                return
+        self.reload()
+
+    def entry(self):
+        """Get the entry under the cursor, or None."""
+        i = self.offset + self.cursor - 1
+        if not self.contents or i >= len(self.contents):
+            return None
+        return self.contents[i]
+
+    def parent(self):
+        """
+        Get the parent folder without looking it up in Dropbox, or None if
+        that's not possible or there's nothing above this folder.
+        """
+        key = self.key(self.folder.parent)
+        if key == self.key(self.folder.path):
+            return None
+        for folder in reversed(self.history):
+            if self.key(folder.path) == key:
+                return folder
+        if self.kind is pdbox.models.LocalFolder or key == "/":
+            try:  # Neither of these needs a request to Dropbox.
+                return self.kind(self.folder.parent or "/")
+            except ValueError as e:
+                pdbox.debug(e)
+        return None
+
+    def prefetch(self):
+        """
+        List the folder under the cursor and the parent folder in the
+        background, unless they're cached, so that opening them is quick.
+        The listing of this folder goes first.
+        """
+        if self.loading:
+            return
+        entry = self.entry()
+        self.start_prefetch("cursor", entry if is_folder(entry) else None)
+        self.start_prefetch("parent", self.parent())
+
+    def start_prefetch(self, name, folder):
+        """
+        Start listing folder in the background, as the prefetch name, in
+        place of whatever that prefetch was listing before.
+        """
+        if folder is None:
+            return
+        key = self.key(folder.path)
+        if key in self.cache or key in self.failed or any(
+            self.key(prefetched.path) == key
+            for _, prefetched, _ in self.prefetches.values()
+        ):
+            return  # It's cached, failed or on its way.
+        if name in self.prefetches:
+            self.loader.cancel(self.prefetches[name][0].name)
+        job = self.loader.start("%s %s" % (self.name, key), folder.pages())
+        self.prefetches[name] = job, folder, []
+
+    def prefetched(self, job, page, error):
+        """
+        Take a page for the Loader job if it's one of this directory's
+        prefetches, and cache the contents once they've all arrived.
+        """
+        for name, (prefetch, folder, entries) in list(self.prefetches.items()):
+            if job is not prefetch:
+                continue
+            if page is not None:
+                entries.extend(page)
+                return
+            del self.prefetches[name]
+            if error is None:
+                self.cache.put(self.key(folder.path), entries)
+            else:
+                self.failed.add(self.key(folder.path))
+
+
+def caught_up(pages):
+    """
+    Catch the metadata snapshot up on remote changes since the last reload
+    if there is one, and then go through pages.
+    """
+    if pdbox.snapshot and pdbox.snapshot.ready():
+        pdbox.cache.refresh(pdbox.snapshot)
+    for page in pages:
+        yield page
 
 
 def is_folder(item):
@@ -1,7 +1,27 @@
 import dropbox
 import os.path
 import pdbox
+import random
+import requests
 import sys
+import threading
+import time
+
+# Seconds to wait before checking on an asynchronous job, which doubles after
+# every check up to POLL_MAX_INTERVAL.
+POLL_INTERVAL = 0.25
+POLL_MAX_INTERVAL = 4.0
+# Seconds to wait before retrying a request, which doubles with every retry
+# up to RETRY_MAX_DELAY. The actual wait is a random fraction of it.
+RETRY_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# Errors that are worth trying a request again after.
+TRANSIENT_ERRORS = (
+    dropbox.exceptions.RateLimitError,
+    dropbox.exceptions.InternalServerError,  # 5xx responses.
+    requests.exceptions.ConnectionError,  # Including connection resets.
+    requests.exceptions.ChunkedEncodingError,
+)
 
 
 class DropboxError(BaseException):
@@ -12,24 +32,174 @@ class DropboxError(BaseException):
 def execute(func, *args, **kwargs):
     """
     Execute a dropbox.Dropbox method and return its output, logging its error
-    if it raises.
+    if it raises. Requests that fail for a transient reason are retried up to
+    retries() times, after however long Dropbox asks for, or otherwise with
+    jittered exponential backoff.
     Raises: DropboxError
     """
-    try:
-        return func(*args, **kwargs)
-    except dropbox.exceptions.ApiError as e:
-        pdbox.debug(
-            "API error:\n  Function: dbx.%s\n  Arguments: %s %s\n  Error: %s" %
-            (func.__name__, args, kwargs, e.error),
-        )
-        raise DropboxError(e.error)
-    except dropbox.exceptions.BadInputError as e:
-        # This is usually an invalid token.
-        pdbox.debug(e)
-        fail(
-            "Your authentication token is invalid, "
-            "delete %s and try again" % pdbox.TOKEN_PATH,
-        )
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except dropbox.exceptions.ApiError as e:
+            pdbox.debug(
+                "API error:\n  Function: dbx.%s\n  Arguments: %s %s\n"
+                "  Error: %s" % (func.__name__, args, kwargs, e.error),
+            )
+            raise DropboxError(e.error)
+        except dropbox.exceptions.BadInputError as e:
+            # This is usually an invalid token.
+            pdbox.debug(e)
+            fail(
+                "Your authentication token is invalid, "
+                "delete %s and try again" % pdbox.TOKEN_PATH,
+            )
+        except TRANSIENT_ERRORS as e:
+            attempt += 1
+            if attempt > retries():
+                pdbox.debug(
+                    "dbx.%s failed after %d attempt(s): %r" %
+                    (func.__name__, attempt, e),
+                )
+                raise DropboxError(e)
+            delay = retry_delay(e, attempt)
+            pdbox.debug(
+                "dbx.%s failed, retrying in %.2fs (%d/%d): %r" %
+                (func.__name__, delay, attempt, retries(), e),
+            )
+            stats = getattr(pdbox.session, "stats", None)
+            if stats is not None:
+                stats.retry()
+            time.sleep(delay)
+
+
+def retries():
+    """Get the number of times to retry a request that fails transiently."""
+    n = pdbox._args.get("retries")
+    return max(pdbox.DEFAULT_RETRIES if n is None else n, 0)
+
+
+def retry_delay(e, attempt):
+    """
+    Get the number of seconds to wait before the attempt'th retry of a
+    request that raised e. Rate limited requests wait as long as Dropbox
+    asks, plus up to a second so that the workers don't all come back at
+    once. Anything else waits a random amount of time, up to a limit that
+    doubles with each attempt ("full jitter").
+    """
+    backoff = getattr(e, "backoff", None)
+    if backoff is not None:
+        return backoff + random.random()
+    limit = min(RETRY_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+    return random.uniform(0, limit)
+
+
+def poll(check, job_id):
+    """
+    Check on an asynchronous job with the dropbox.Dropbox method check until
+    it's no longer in progress, backing off between checks, and return its
+    final status.
+    Raises: DropboxError
+    """
+    delay = POLL_INTERVAL
+    while True:
+        time.sleep(delay)
+        status = execute(check, job_id)
+        if not status.is_in_progress():
+            return status
+        pdbox.debug("Job %s is still in progress" % job_id)
+        delay = min(delay * 2, POLL_MAX_INTERVAL)
+
+
+def workers():
+    """Get the number of worker threads to use for concurrent operations."""
+    return max(pdbox._args.get("workers") or pdbox.DEFAULT_WORKERS, 1)
+
+
+def pool():
+    """Get a thread pool bounded by the configured number of workers."""
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=workers())
+
+
+class ConnectionStats(object):
+    """
+    Counts of the requests made by an HTTP session and of the connections
+    that were opened for them. Every request after the first on a
+    connection reuses it instead of paying for a new TLS handshake.
+    Requests that execute tried again are counted too.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.retries = 0
+
+    def request(self, response, *args, **kwargs):
+        """Count a request, as a requests response hook."""
+        with self.lock:
+            self.requests += 1
+
+    def connection(self):
+        """Count a new connection."""
+        with self.lock:
+            self.connections += 1
+
+    def retry(self):
+        """Count a retried request."""
+        with self.lock:
+            self.retries += 1
+
+
+def session():
+    """
+    Create an HTTP session for dropbox.Dropbox, with a connection pool big
+    enough for every worker and the main thread to keep a connection alive.
+    With a smaller pool, the connections that don't fit are thrown away
+    after each request and every transfer pays for a new TLS handshake.
+    Its ConnectionStats are in its stats attribute.
+    """
+    s = dropbox.create_session(max_connections=workers() + 1)
+    s.stats = ConnectionStats()
+    s.hooks["response"].append(s.stats.request)
+    for adapter in s.adapters.values():
+        manager = getattr(adapter, "poolmanager", None)
+        if manager is not None:
+            manager.pool_classes_by_scheme = dict(
+                (scheme, counting_pool(cls, s.stats))
+                for scheme, cls in manager.pool_classes_by_scheme.items()
+            )
+    return s
+
+
+def counting_pool(cls, stats):
+    """
+    Subclass the urllib3 connection pool class cls to count the connections
+    that it opens in stats.
+    """
+    class CountingPool(cls):
+        def _new_conn(self):
+            stats.connection()
+            return super(CountingPool, self)._new_conn()
+    return CountingPool
+
+
+def connection_stats(session):
+    """
+    Count the requests made by a session from session(), and the
+    connections that they were made on, as a dict with the keys requests,
+    connections, reused and retries.
+    """
+    with session.stats.lock:
+        requests = session.stats.requests
+        connections = session.stats.connections
+        retries = session.stats.retries
+    return {
+        "requests": requests,
+        "connections": connections,
+        "reused": requests - connections,
+        "retries": retries,
+    }
 
 
 def fail(s):
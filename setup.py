@@ -11,6 +11,12 @@ setup(
     keywords="terminal cli dropbox",
     packages=find_packages(),
     scripts=["bin/pdbox"],
-    install_requires=["appdirs", "dropbox", "requests", "tabulate"],
+    install_requires=[
+        "appdirs",
+        "dropbox",
+        "futures; python_version < '3'",
+        "requests",
+        "tabulate",
+    ],
     zip_safe=True,
 )
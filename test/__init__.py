@@ -9,6 +9,9 @@ testfile = ".pdboxtestfile"
 testdir = ".pdboxtestdir"
 tempfile = ".pdboxtempfile"
 tempdir = ".pdboxtempdir"
+hashfile = ".pdboxhashes.db"
+uploadfile = ".pdboxuploads.db"
+chunksizefile = ".pdboxchunksize"
 
 
 if "PDBOX_DEBUG" in os.environ:
@@ -22,6 +25,12 @@ def setup():
     os.mkdir(testdir)  # Guaranteed to always exist and be empty.
     os.mknod(tempfile)  # Guaranteed to always exist, no guaranteed contents.
     os.mkdir(tempdir)  # Guaranteed to always exist, no guaranteed contents.
+    # Don't touch the real hash cache, upload journal or chunk size.
+    pdbox.HASH_CACHE_PATH = hashfile
+    pdbox.hashes = None
+    pdbox.UPLOADS_PATH = uploadfile
+    pdbox.uploads = None
+    pdbox.CHUNKSIZE_PATH = chunksizefile
 
 
 def teardown():
@@ -29,3 +38,12 @@ def teardown():
     os.rmdir(testdir)
     os.remove(tempfile)
     shutil.rmtree(tempdir)
+    for db in [pdbox.hashes, pdbox.uploads]:
+        if db:
+            db.db.close()
+    for name in os.listdir(os.curdir):
+        # Including the write-ahead log.
+        if name.startswith(hashfile) or name.startswith(uploadfile):
+            os.remove(name)
+    if os.path.exists(chunksizefile):
+        os.remove(chunksizefile)
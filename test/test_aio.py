@@ -0,0 +1,109 @@
+import os
+import pdbox.backend as backend
+import shutil
+import sys
+import threading
+import time
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises
+from . import tempdir
+
+
+def test_engine():
+    if sys.version_info < (3, 5):
+        raise SkipTest("pdbox.aio needs Python 3.5")
+    import asyncio
+    import pdbox.aio
+
+    root = os.path.join(tempdir, "aio")
+    dbx = backend.LocalBackend(root)
+    tmp = pdbox.TMP_DOWNLOAD_DIR
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(tempdir, "tmp")
+    src = os.path.join(tempdir, "aiosrc")
+    dest = os.path.join(tempdir, "aiodest")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # Count the metadata requests that are running at once.
+    lock = threading.Lock()
+    running = [0, 0]  # Now, and at most.
+    get_metadata = dbx.files_get_metadata
+
+    def files_get_metadata(path, **kwargs):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return get_metadata(path, **kwargs)
+
+    def run(*coroutines):
+        return loop.run_until_complete(asyncio.gather(*coroutines))
+
+    dbx.files_get_metadata = files_get_metadata
+    engine = pdbox.aio.Engine(dbx, limit=4)
+    try:
+        for sub in ["a", os.path.join("a", "b"), "c"]:
+            os.makedirs(os.path.join(src, sub))
+            for name in ["x", "y", "z"]:
+                with open(os.path.join(src, sub, name), "w") as f:
+                    f.write(sub + name)
+        os.mkdir(os.path.join(src, "empty"))
+
+        folder, = run(engine.upload(src, "dbx://up"))
+        assert folder.path == "/up"
+        names = [e.path for e in run(engine.contents("/up", True))[0]]
+        assert len(names) == 13
+        assert "/up/empty" in names
+
+        # Many lookups at once, but never more requests than the limit.
+        paths = ["/up/a/%s" % name for name in "xyz"] * 10 + ["/nothing"]
+        remotes = run(*[engine.get_remote(path) for path in paths[:-1]])
+        assert [r.name for r in remotes] == list("xyz") * 10
+        assert running[1] == 4
+        assert_raises(ValueError, run, engine.get_remote("/nothing"))
+
+        run(
+            engine.copy("/up/a", "/Copied"),
+            engine.move("/up/c", "/moved"),
+            engine.delete("/up/empty"),
+        )
+        names = [e.name for e in run(engine.contents("/"))[0]]
+        assert sorted(names) == ["Copied", "moved", "up"]
+
+        # Only the last component of path_display has the right case, so
+        # don't split folders up by the case of the others.
+        list_folder = dbx.files_list_folder
+        list_folder_continue = dbx.files_list_folder_continue
+
+        def lower(result):
+            for meta in result.entries:
+                parent = meta.path_lower.rsplit("/", 1)[0]
+                meta.path_display = "%s/%s" % (parent, meta.name)
+            return result
+        dbx.files_list_folder = lambda *args, **kwargs: lower(
+            list_folder(*args, **kwargs),
+        )
+        dbx.files_list_folder_continue = lambda cursor: lower(
+            list_folder_continue(cursor),
+        )
+        run(engine.download("/", dest))
+        assert sorted(os.listdir(dest)) == ["Copied", "moved", "up"]
+        with open(os.path.join(dest, "Copied", "b", "y")) as f:
+            assert f.read() == os.path.join("a", "b") + "y"
+        assert sorted(os.listdir(os.path.join(dest, "up"))) == ["a"]
+        assert_raises(
+            ValueError,
+            run,
+            engine.download("/moved/x", os.path.join(dest, "moved", "x")),
+        )
+    finally:
+        engine.close()
+        loop.close()
+        asyncio.set_event_loop(None)
+        pdbox.TMP_DOWNLOAD_DIR = tmp
+        for path in [root, src, dest, os.path.join(tempdir, "tmp")]:
+            if os.path.exists(path):
+                shutil.rmtree(path)
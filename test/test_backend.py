@@ -0,0 +1,144 @@
+import dropbox
+import os
+import pdbox
+import pdbox.backend as backend
+import pdbox.metadata
+import pdbox.models as models
+import shutil
+
+from nose.tools import assert_raises
+from pdbox.hashing import content_hashes
+from . import tempdir
+
+
+def test_local_backend():
+    root = os.path.join(tempdir, "backend")
+    dbx, pdbox.dbx = pdbox.dbx, backend.LocalBackend(root)
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"chunksize": 1, "workers": 2}
+    tmp = pdbox.TMP_DOWNLOAD_DIR
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(tempdir, "tmp")
+    page, backend.PAGE_SIZE = backend.PAGE_SIZE, 2
+    src = os.path.join(tempdir, "src")
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    try:
+        with open(src, "wb") as f:
+            f.write(data)
+
+        # Chunked uploads go through sessions, and Dropbox's hashes match.
+        folder = models.RemoteFolder.create("dbx://Folder")
+        remote = models.LocalFile(src).upload("dbx://folder/Big")
+        assert remote.path == "/Folder/Big"
+        assert remote.hash == content_hashes([src])[src]
+        assert open(os.path.join(root, "Folder", "Big"), "rb").read() == data
+        assert not os.listdir(os.path.join(root, backend.STATE, "sessions"))
+
+        # Paths are case-insensitive, and the state folder is hidden.
+        assert models.get_remote("dbx://FOLDER/big").rev == remote.rev
+        assert_raises(ValueError, models.get_remote, "dbx://.pdbox/log")
+        assert [e.name for e in models.RemoteFolder("/").contents()] == [
+            "Folder",
+        ]
+
+        # Downloads pick up where they left off, with a range.
+        partial = remote.partial()
+        with open(partial, "wb") as f:
+            f.write(data[:1000])
+        assert open(remote.stage(), "rb").read() == data
+        os.remove(partial)
+
+        # Overwriting a file changes its revision, and old ones are gone.
+        with open(src, "wb") as f:
+            f.write(b"new")
+        new = models.LocalFile(src).upload("dbx://folder/big", overwrite=True)
+        assert new.rev != remote.rev
+        assert_raises(
+            dropbox.exceptions.ApiError,
+            pdbox.dbx.files_download,
+            "/folder/big",
+            rev=remote.rev,
+        )
+
+        # Listings come in pages, and cursors pick up changes from other
+        # instances on the same folder, including deletions.
+        for name in ["a", "b", "c"]:
+            pdbox.dbx.files_upload(name.encode(), "/Folder/%s" % name)
+        result = pdbox.dbx.files_list_folder("/folder", recursive=True)
+        names = [e.name for e in result.entries]
+        while result.has_more:
+            result = pdbox.dbx.files_list_folder_continue(result.cursor)
+            names.extend(e.name for e in result.entries)
+        assert names == ["Folder", "a", "b", "Big", "c"]
+        other = backend.LocalBackend(root)
+        other.files_delete_v2("/folder/a")
+        other.files_move_v2("/folder/b", "/folder/B2")
+        result = pdbox.dbx.files_list_folder_continue(result.cursor)
+        changes = dict(
+            (e.path_display, isinstance(e, dropbox.files.DeletedMetadata))
+            for e in result.entries
+        )
+        assert changes == {
+            "/Folder/a": True,
+            "/Folder/b": True,
+            "/Folder/B2": False,
+        }
+        assert not result.has_more
+
+        # Batches finish straight away.
+        errors = models.relocate_batch([
+            ("/folder/c", "/folder/c2"),
+            ("/folder/nothing", "/folder/d"),
+        ])
+        assert errors[0] is None
+        assert errors[1].get_relocation_error().is_from_lookup()
+        errors = models.delete_batch(["/folder/c2", "/folder/c2"])
+        assert errors[0] is None
+        assert errors[1].get_path_lookup().is_not_found()
+        assert sorted(e.name for e in folder.contents()) == ["B2", "Big", "c"]
+    finally:
+        shutil.rmtree(pdbox.TMP_DOWNLOAD_DIR)
+        pdbox.dbx, pdbox._args = dbx, args
+        pdbox.TMP_DOWNLOAD_DIR = tmp
+        backend.PAGE_SIZE = page
+        shutil.rmtree(root)
+        os.remove(src)
+
+
+def test_local_search():
+    root = os.path.join(tempdir, "search")
+    dbx, pdbox.dbx = pdbox.dbx, backend.LocalBackend(root)
+    pdbox.metadata.reset_memo()
+    try:
+        for path in ["/Notes/todo.txt", "/Notes/Old/TODO list", "/todo"]:
+            pdbox.dbx.files_upload(b"", path)
+
+        # Every word has to be in the name, and results come in pages.
+        folder = models.RemoteFolder("/")
+        pages = list(folder.search("TODO"))
+        assert len(pages) == 1
+        assert sorted(r.path for r in pages[0]) == [
+            "/Notes/Old/TODO list",
+            "/Notes/todo.txt",
+            "/todo",
+        ]
+        options = dropbox.files.SearchOptions(path="/notes", max_results=1)
+        result = pdbox.dbx.files_search_v2("todo", options=options)
+        assert result.matches[0].metadata.get_metadata().name == "todo.txt"
+        assert result.has_more
+        result = pdbox.dbx.files_search_continue_v2(result.cursor)
+        assert [m.metadata.get_metadata().name for m in result.matches] == [
+            "TODO list",
+        ]
+        assert not result.has_more
+        pages = list(models.RemoteFolder("/notes").search("list todo"))
+        assert [r.name for page in pages for r in page] == ["TODO list"]
+        options = dropbox.files.SearchOptions(path="/nothing")
+        assert_raises(
+            dropbox.exceptions.ApiError,
+            pdbox.dbx.files_search_v2,
+            "todo",
+            options=options,
+        )
+    finally:
+        pdbox.dbx = dbx
+        shutil.rmtree(root)
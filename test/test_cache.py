@@ -0,0 +1,181 @@
+import os
+import pdbox
+import pdbox.cache as cache
+import pdbox.metadata
+import pdbox.models as models
+import shutil
+import sqlite3
+import threading
+
+from nose.tools import assert_raises
+from pdbox.fake import FakeDropbox, not_found
+from . import tempdir
+
+
+def test_metadata_cache():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    snapshot, pdbox.snapshot = pdbox.snapshot, None
+    path = os.path.join(tempdir, "metadata.db")
+    try:
+        pdbox.dbx.add_folder("/A")
+        pdbox.dbx.add_folder("/A/B")
+        for f in ["/x", "/A/y", "/A/B/z"]:
+            pdbox.dbx.files_upload(b"data", f)
+
+        # Interrupt the initial listing part way through.
+        list_folder_continue = pdbox.dbx.files_list_folder_continue
+
+        def files_list_folder_continue(cursor):
+            raise not_found()
+        pdbox.dbx.files_list_folder_continue = files_list_folder_continue
+        pdbox.snapshot = cache.MetadataCache(path, "token")
+        assert_raises(models.DropboxError, pdbox.snapshot.refresh)
+        assert not pdbox.snapshot.ready()
+
+        # Reopening the cache picks up from the stored cursor.
+        pdbox.dbx.files_list_folder_continue = list_folder_continue
+        pdbox.snapshot = cache.MetadataCache(path, "token")
+        pdbox.dbx.calls = []
+        pdbox.snapshot.refresh()
+        assert pdbox.snapshot.ready()
+        assert "files_list_folder" not in pdbox.dbx.calls
+
+        # Lookups and listings are served from the cache.
+        pdbox.dbx.calls = []
+        assert models.get_remote("dbx://a/b/Z").size == 4
+        assert_raises(ValueError, models.get_remote, "dbx://nothing")
+        assert len(models.RemoteFolder("dbx://A").contents()) == 2
+        assert len(models.get_remote("/").contents(recursive=True)) == 5
+        assert not pdbox.dbx.calls
+
+        # Changes are caught up on with the cursor.
+        pdbox.dbx.files_delete_v2("/A/B")
+        pdbox.dbx.files_upload(b"new", "/A/new")
+        pdbox.dbx.calls = []
+        pdbox.snapshot.refresh()
+        assert pdbox.dbx.calls == ["files_list_folder_continue"]
+        names = [e.name for e in models.RemoteFolder("/A").contents()]
+        assert sorted(names) == ["new", "y"]
+        assert_raises(ValueError, models.get_remote, "/A/B/z")
+
+        # So are our own changes, without waiting for a refresh.
+        pdbox.dbx.calls = []
+        models.RemoteFolder.create("/C")
+        models.get_remote("/x").delete()
+        assert isinstance(models.get_remote("/C"), models.RemoteFolder)
+        assert_raises(ValueError, models.get_remote, "/x")
+        assert "files_get_metadata" not in pdbox.dbx.calls
+
+        # A different account starts from scratch.
+        pdbox.snapshot = cache.MetadataCache(path, "another token")
+        assert not pdbox.snapshot.ready()
+    finally:
+        pdbox.dbx, pdbox.snapshot = dbx, snapshot
+        os.remove(path)
+
+
+def test_hash_cache():
+    hashes, path = pdbox.hashes, os.path.join(tempdir, "hashes.db")
+    f = os.path.join(tempdir, "hashed")
+    try:
+        pdbox.hashes = cache.HashCache(path, max_entries=2)
+        with open(f, "w") as fd:
+            fd.write("contents")
+        digest = models.LocalFile(f).hash()
+        assert pdbox.hashes.get(os.stat(f)) == digest
+
+        # Hits don't read the file.
+        pdbox.hashes.put(os.stat(f), "cached")
+        assert models.LocalFile(f).hash() == "cached"
+
+        # Changes invalidate the entry.
+        with open(f, "w") as fd:
+            fd.write("different")
+        st = os.stat(f)
+        os.utime(f, (st.st_atime, st.st_mtime + 1))
+        assert pdbox.hashes.get(os.stat(f)) is None
+        assert models.LocalFile(f).hash() != digest
+
+        # A locked database falls back to hashing.
+        def locked(*args):
+            raise sqlite3.OperationalError("database is locked")
+        get, put = pdbox.hashes.get, pdbox.hashes.put
+        pdbox.hashes.get = pdbox.hashes.put = locked
+        assert models.LocalFile(f).hash() != digest
+        pdbox.hashes.get, pdbox.hashes.put = get, put
+
+        # The least recently used entries are evicted.
+        for i in range(3):
+            pdbox.hashes.put(os.stat(f), str(i))
+            os.utime(f, (st.st_atime, st.st_mtime + i + 2))
+        count = pdbox.hashes.db.execute("SELECT COUNT(*) FROM hashes")
+        assert count.fetchone()[0] == 2
+    finally:
+        pdbox.hashes = hashes
+        os.remove(f)
+        for name in os.listdir(tempdir):
+            if name.startswith("hashes.db"):
+                os.remove(os.path.join(tempdir, name))
+
+
+def test_metadata_memo():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"quiet": True}
+    folder = os.path.join(tempdir, "memo")
+    try:
+        pdbox.dbx.add_folder("/A")
+        pdbox.dbx.files_upload(b"data", "/A/x")
+
+        # Each path is looked up once, and concurrent lookups are shared.
+        lookups = []
+        event = threading.Event()
+
+        def lookup(path):
+            lookups.append(path)
+            event.wait()
+            return models.lookup_metadata(path)
+        memo = pdbox.metadata.metadata_memo()
+        threads = [
+            threading.Thread(target=memo.get, args=("/a/X", lookup))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        event.set()
+        for thread in threads:
+            thread.join()
+        assert lookups == ["/a/X"]
+        assert models.get_remote("/A/x").size == 4
+        assert_raises(ValueError, models.get_remote, "/nothing")
+        assert_raises(ValueError, models.get_remote, "/nothing")
+        assert pdbox.dbx.calls.count("files_get_metadata") == 2
+
+        # Our own writes are remembered, including what's in new folders.
+        pdbox.dbx.calls = []
+        os.makedirs(os.path.join(folder, "sub"))
+        with open(os.path.join(folder, "sub", "f"), "w") as f:
+            f.write("f")
+        models.LocalFolder(folder).upload("/A/memo")
+        assert models.get_remote("/a/memo/sub/F").size == 1
+        models.get_remote("/A/x").delete()
+        assert_raises(ValueError, models.get_remote, "/A/x")
+        assert pdbox.dbx.calls.count("files_get_metadata") == 1
+
+        # Listings are remembered, and a new command sees outside changes.
+        assert_raises(ValueError, models.get_remote, "/A/later")
+        pdbox.dbx.files_upload(b"later", "/A/later")
+        assert_raises(ValueError, models.get_remote, "/A/later")
+        names = [e.name for e in models.RemoteFolder("/A").contents()]
+        assert "later" in names
+        pdbox.dbx.calls = []
+        assert models.get_remote("/A/later").size == 5
+        assert_raises(ValueError, models.get_remote, "/A/nothing")
+        assert not pdbox.dbx.calls
+        pdbox.dbx.files_upload(b"new", "/A/new")
+        pdbox.metadata.reset_memo()
+        assert models.get_remote("/A/new").size == 3
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        shutil.rmtree(folder)
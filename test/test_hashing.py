@@ -0,0 +1,41 @@
+import hashlib
+import os
+import pdbox.hashing as hashing
+
+from . import tempdir
+
+
+def reference(path):
+    """Dropbox's content hash, computed one block at a time."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(hashing.BLOCK)
+            if not chunk:
+                break
+            hasher.update(hashlib.sha256(chunk).digest())
+    return hasher.hexdigest()
+
+
+def test_content_hashes():
+    paths = []
+    for size in [0, 1, hashing.BLOCK, 2 * hashing.BLOCK + 5]:
+        path = os.path.join(tempdir, "hash%d" % size)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    try:
+        for workers in [1, 3]:
+            digests = hashing.content_hashes(paths, workers=workers)
+            assert digests == dict((p, reference(p)) for p in paths)
+        assert hashing.hash_files(paths) == digests
+        # Streamed data hashes the same, however it's split up.
+        for path in paths:
+            hasher = hashing.ContentHasher()
+            with open(path, "rb") as f:
+                for data in iter(lambda: f.read(3 * 1024 * 1024), b""):
+                    hasher.update(data)
+            assert hasher.hexdigest() == digests[path]
+    finally:
+        for path in paths:
+            os.remove(path)
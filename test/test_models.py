@@ -1,9 +1,22 @@
 import os
+import pdbox
 import pdbox.models as models
+import pdbox.parsing
+import pdbox.utils as utils
+import sys
 
+from argparse import ArgumentTypeError
+from pdbox.cli import common, cp, ls, mv, rm
+from pdbox.cli.progress import Progress
+from pdbox.fake import FakeDropbox, not_found
 from nose.tools import assert_raises
 from . import nofile, testfile, testdir, tempfile, tempdir
 
+try:
+    from StringIO import StringIO
+except ImportError:  # Python 3.
+    from io import StringIO
+
 
 def test_cli():
     LocalFile = models.LocalFile
@@ -41,3 +54,485 @@ def test_local_folder():
         os.path.join(tempdir, "b"),
         os.path.join(tempdir, "c"),
     ])
+
+
+def test_local_folder_upload():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"workers": 4}
+    try:
+        folder = os.path.join(tempdir, "upload")
+        for sub in ["a", os.path.join("a", "b"), "c"]:
+            os.makedirs(os.path.join(folder, sub))
+            for name in ["x", "y", "z"]:
+                with open(os.path.join(folder, sub, name), "w") as f:
+                    f.write(name)
+
+        remote = models.LocalFolder(folder).upload("dbx://up")
+        assert remote.path == "/up"
+        # The fake refuses to upload files into folders that don't exist,
+        # so every file arriving means its folder was created first.
+        for sub in ["a", "a/b", "c"]:
+            for name in ["x", "y", "z"]:
+                assert pdbox.dbx.entries["/up/%s/%s" % (sub, name)].size == 1
+
+        # One failed file fails the whole upload, but not the other files.
+        upload = pdbox.dbx.files_upload
+
+        def files_upload(f, path, *args, **kwargs):
+            if path == "/up2/a/b/y":
+                raise not_found()
+            return upload(f, path, *args, **kwargs)
+        pdbox.dbx.files_upload = files_upload
+        assert_raises(
+            models.DropboxError,
+            models.LocalFolder(folder).upload,
+            "dbx://up2",
+        )
+        assert "/up2/a/b/y" not in pdbox.dbx.entries
+        assert "/up2/a/b/z" in pdbox.dbx.entries
+
+        # So does a file that can't be read, such as a broken link.
+        pdbox.dbx.files_upload = upload
+        os.symlink(nofile, os.path.join(folder, "a", "broken"))
+        assert_raises(
+            models.DropboxError,
+            models.LocalFolder(folder).upload,
+            "dbx://up3",
+        )
+        assert "/up3/a/broken" not in pdbox.dbx.entries
+        assert "/up3/a/b/y" in pdbox.dbx.entries
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+
+
+def test_local_file_upload():
+    try:
+        import tracemalloc
+    except ImportError:  # Python 2 can't measure memory use.
+        tracemalloc = None
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"chunksize": 1}
+    chunk = 1024 * 1024
+    path = os.path.join(tempdir, "large")
+    try:
+        # A sparse file, so that its size costs neither disk nor memory.
+        with open(path, "wb") as f:
+            f.truncate(64 * chunk)
+            f.seek(chunk * 10)
+            f.write(b"data")
+        local = models.LocalFile(path)
+
+        if tracemalloc:
+            tracemalloc.start()
+        remote = local.upload("dbx://large")
+        if tracemalloc:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            # Memory use depends on the chunk size, not the file size.
+            assert peak < 8 * chunk
+
+        assert remote.size == local.size
+        assert remote.hash == local.hash()
+        assert pdbox.dbx.largest == chunk
+        assert pdbox.dbx.calls.count("files_upload_session_append_v2") == 62
+
+        # Small files are uploaded in one go.
+        remote = models.LocalFile(testfile).upload("dbx://small")
+        assert remote.size == 0
+        assert pdbox.dbx.calls[-1] == "files_upload"
+    finally:
+        if tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        pdbox.dbx, pdbox._args = dbx, args
+
+
+def test_remote_folder_download():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"workers": 4}
+    tmp = pdbox.TMP_DOWNLOAD_DIR
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(tempdir, "tmp")
+    try:
+        os.mkdir(pdbox.TMP_DOWNLOAD_DIR)
+        pdbox.dbx.add_folder("/Down")
+        pdbox.dbx.add_folder("/Down/Sub")
+        pdbox.dbx.add_folder("/down/sub/Deeper")  # path_display is unreliable.
+        for path in ["/Down/a", "/Down/Sub/b", "/Down/Sub/Deeper/c"]:
+            pdbox.dbx.files_upload(path.encode(), path)
+
+        remote = models.get_remote("dbx://down")
+        assert len(remote.contents()) == 2
+        assert len(remote.contents(recursive=True)) == 5
+
+        dest = os.path.join(tempdir, "down")
+        remote.download(dest)
+        for path in ["a", "Sub/b", "Sub/Deeper/c"]:
+            with open(os.path.join(dest, path)) as f:
+                assert f.read() == "/Down/%s" % path
+
+        # Failures are collected, and nothing is moved into place.
+        download = pdbox.dbx.files_download
+
+        def files_download(path, *args, **kwargs):
+            if path == "/Down/Sub/b":
+                raise not_found()
+            return download(path, *args, **kwargs)
+        pdbox.dbx.files_download = files_download
+        dest = os.path.join(tempdir, "down2")
+        assert_raises(models.DropboxError, remote.download, dest)
+        assert not os.path.exists(dest)
+        assert os.path.exists(os.path.join(pdbox.TMP_DOWNLOAD_DIR, "down2"))
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        pdbox.TMP_DOWNLOAD_DIR = tmp
+
+
+def test_resume_download():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {}
+    tmp = pdbox.TMP_DOWNLOAD_DIR
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(tempdir, "tmp")
+    data = os.urandom(5 * 1024 * 1024)
+    dest = os.path.join(tempdir, "resume")
+    download = pdbox.dbx.files_download
+    ranges = []
+
+    def interrupted(path, *args, **kwargs):
+        # The connection drops part way through.
+        meta, response = download(path, *args, **kwargs)
+        response.data = response.data[:len(data) // 2]
+        response.iter_content = lambda n: chunks(response)
+        return meta, response
+
+    def files_download(path, rev=None, extra_headers=None):
+        ranges.append(extra_headers)
+        return download(path, rev=rev, extra_headers=extra_headers)
+
+    def chunks(response):
+        yield response.data
+        raise IOError("connection reset")
+
+    try:
+        pdbox.dbx.files_upload(data, "/resume")
+        remote = models.get_remote("dbx://resume")
+
+        # Trying again carries on from where the first attempt stopped.
+        pdbox.dbx.files_download = interrupted
+        assert_raises(IOError, remote.download, dest)
+        assert not os.path.exists(dest)
+        pdbox.dbx.files_download = files_download
+        remote.download(dest)
+        assert ranges == [{"Range": "bytes=%d-" % (len(data) // 2)}]
+        with open(dest, "rb") as f:
+            assert f.read() == data
+        assert not os.listdir(os.path.join(pdbox.TMP_DOWNLOAD_DIR, "partial"))
+
+        # Corrupted downloads are thrown away instead of moved into place.
+        os.remove(dest)
+        pdbox.dbx.data["/resume"] = b"x" * len(data)
+        assert_raises(models.DropboxError, remote.download, dest)
+        assert not os.path.exists(dest)
+        assert not os.listdir(os.path.join(pdbox.TMP_DOWNLOAD_DIR, "partial"))
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        pdbox.TMP_DOWNLOAD_DIR = tmp
+        if os.path.exists(dest):
+            os.remove(dest)
+
+
+def test_transfer_events():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"chunksize": 1}
+    tmp = pdbox.TMP_DOWNLOAD_DIR
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(tempdir, "tmp")
+    interval, models.PROGRESS_INTERVAL = models.PROGRESS_INTERVAL, 0
+    path = os.path.join(tempdir, "events")
+    events = []
+    models.subscribe(events.append)
+    try:
+        with open(path, "wb") as f:
+            f.write(os.urandom(3 * 1024 * 1024))
+        local = models.LocalFile(path)
+        remote = local.upload("dbx://events")
+        assert [e.kind for e in events] == ["start"] + ["progress"] * 3 + [
+            "finish",
+        ]
+        assert [e.done for e in events] == [0] + [1024 * 1024 * i for i in [
+            1, 2, 3, 3,
+        ]]
+        assert all(e.name == local.path for e in events)
+
+        # Failures are reported along with their errors.
+        del events[:]
+        pdbox.dbx.data["/events"] = b"corrupted"
+        os.remove(path)
+        assert_raises(models.DropboxError, remote.download, path)
+        assert events[0].kind == "start" and events[-1].kind == "finish"
+
+        def files_download(*args, **kwargs):
+            raise not_found()
+        pdbox.dbx.files_download = files_download
+        del events[:]
+        assert_raises(models.DropboxError, remote.download, path)
+        assert [e.kind for e in events] == ["start", "fail"]
+        assert isinstance(events[-1].error, models.DropboxError)
+
+        # The renderer reports each file's throughput.
+        stream = StringIO()
+        progress = Progress(stream)
+        start = models.TransferEvent("start", "a", 0, 2048, 0.0, None)
+        progress(start)
+        progress(start._replace(kind="finish", done=2048, time=1.0))
+        progress(start._replace(name="b", time=1.0))
+        progress(start._replace(name="b", kind="fail", done=1024, time=2.0))
+        progress.close()
+        assert stream.getvalue().splitlines() == [
+            "a: 2.00 KB in 1.0s (0.00 MB/s)",
+            "b: failed after 1.00 KB of 2.00 KB (0.00 MB/s)",
+        ]
+    finally:
+        models.unsubscribe(events.append)
+        models.PROGRESS_INTERVAL = interval
+        pdbox.dbx, pdbox._args = dbx, args
+        pdbox.TMP_DOWNLOAD_DIR = tmp
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_rm():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args = pdbox._args
+    interval, utils.POLL_INTERVAL = utils.POLL_INTERVAL, 0
+    try:
+        pdbox.dbx.add_folder("/Folder")
+        for path in ["/a", "/b", "/Folder/c"]:
+            pdbox.dbx.files_upload(b"data", path)
+
+        # Everything is deleted in a batch, entries that are turned away for
+        # too many writes are tried again, and failures are reported.
+        pdbox._args = {
+            "path": ["dbx://a", "b", "dbx://folder", "dbx://nothing"],
+            "recursive": True,
+        }
+        pdbox.dbx.busy = set(["/b"])
+        assert not rm.rm()
+        assert not pdbox.dbx.entries
+        assert pdbox.dbx.calls.count("files_delete_batch") == 2
+        assert "files_get_metadata" not in pdbox.dbx.calls
+
+        # Without --recursive, folders are checked for first.
+        pdbox.metadata.reset_memo()  # Another command, after outside changes.
+        pdbox.dbx.add_folder("/Folder")
+        pdbox.dbx.files_upload(b"data", "/a")
+        pdbox._args = {
+            "path": ["dbx://a", "dbx://folder"],
+            "recursive": False,
+            "workers": 2,
+        }
+        assert not rm.rm()
+        assert "/folder" in pdbox.dbx.entries
+        assert "/a" not in pdbox.dbx.entries
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        utils.POLL_INTERVAL = interval
+
+
+def test_relocate_inside():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    interval, utils.POLL_INTERVAL = utils.POLL_INTERVAL, 0
+    args = pdbox._args
+    try:
+        pdbox.dbx.add_folder("/Src")
+        pdbox.dbx.add_folder("/Src/folder")
+        pdbox.dbx.add_folder("/Dest")
+        names = ["file%d" % i for i in range(20)]
+        for name in names + ["folder/inner"]:
+            pdbox.dbx.files_upload(name.encode(), "/Src/" + name)
+        pdbox.dbx.files_upload(b"old", "/Dest/file0")
+        pdbox.dbx.files_upload(b"keep", "/Src/keep")
+        pdbox.dbx.add_folder("/Dest/keep")
+        pdbox.dbx.files_upload(b"precious", "/Dest/keep/precious")
+        srcs = ["dbx://src/" + name for name in names]
+        pdbox.dbx.page = 1000
+
+        # The sources are found with a listing and copied in one job.
+        # Files are replaced, but folders are copied into.
+        pdbox._args = {
+            "src": srcs + ["dbx://src/folder", "dbx://src/keep", "dbx://no"],
+            "dst": "dbx://dest",
+            "recursive": True,
+            "quiet": True,
+        }
+        pdbox.dbx.calls = []
+        assert not cp.cp()
+        assert pdbox.dbx.calls.count("files_get_metadata") <= 3
+        assert pdbox.dbx.calls.count("files_copy_batch_v2") == 1
+        for name in names + ["folder/inner"]:
+            assert pdbox.dbx.data["/dest/" + name] == name.encode()
+            assert "/src/" + name in pdbox.dbx.entries
+        assert pdbox.dbx.data["/dest/keep/precious"] == b"precious"
+        assert pdbox.dbx.data["/dest/keep/keep"] == b"keep"
+
+        # Folders are skipped without --recursive, and the rest are moved.
+        pdbox.dbx.add_folder("/Moved")
+        pdbox._args.update({
+            "src": srcs + ["dbx://src/folder"],
+            "dst": "dbx://moved",
+            "recursive": False,
+        })
+        assert not mv.mv()
+        assert pdbox.dbx.calls.count("files_move_batch_v2") == 1
+        for name in names:
+            assert "/moved/" + name in pdbox.dbx.entries
+            assert "/src/" + name not in pdbox.dbx.entries
+        assert "/src/folder/inner" in pdbox.dbx.entries
+
+        # Big folders are only listed for as long as it's worth it.
+        pdbox.dbx.page = 2
+        pdbox.dbx.calls = []
+        paths = ["/moved/file%d" % i for i in range(8)]
+        assert all(models.get_remotes(paths))
+        assert pdbox.dbx.calls.count("files_list_folder") == 1
+        assert "files_list_folder_continue" not in pdbox.dbx.calls
+
+        # A destination that isn't a folder is an error, not a crash.
+        assert not common.relocate_inside(srcs, "dbx://gone", None)
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        utils.POLL_INTERVAL = interval
+
+
+def test_ls():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, stdout = pdbox._args, sys.stdout
+    try:
+        for path in ["/L", "/L/A", "/L/A/B", "/L/A/B/C"]:
+            pdbox.dbx.add_folder(path)
+            for name in ["x", "y"]:
+                pdbox.dbx.files_upload(b"data", "%s/%s" % (path, name))
+
+        # Everything comes from one listing, however many pages it takes.
+        pdbox._args = {
+            "path": ["dbx://l"],
+            "recursive": True,
+            "maxdepth": -1,
+            "human_readable": False,
+            "summarize": False,
+        }
+        pdbox.dbx.calls = []
+        sys.stdout = StringIO()
+        assert ls.ls()
+        out = sys.stdout.getvalue()
+        assert pdbox.dbx.calls.count("files_list_folder") == 1
+        assert pdbox.dbx.calls.count("files_list_folder_continue") == 5
+        for path in ["L", "L/A", "L/A/B", "L/A/B/C"]:
+            assert "dbx://%s " % path in out
+
+        # --maxdepth trims the output.
+        pdbox._args["maxdepth"] = 2
+        sys.stdout = StringIO()
+        assert ls.ls()
+        out = sys.stdout.getvalue()
+        assert "dbx://L/A " in out
+        assert "dbx://L/A/B " not in out
+    finally:
+        pdbox.dbx, pdbox._args, sys.stdout = dbx, args, stdout
+
+
+def test_resume_upload():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"chunksize": 1}
+    chunk = 1024 * 1024
+    path = os.path.join(tempdir, "resume")
+    append = pdbox.dbx.files_upload_session_append_v2
+
+    def interrupted(dest):
+        # The connection drops part way through.
+        def files_upload_session_append_v2(f, cursor, *args, **kwargs):
+            if cursor.offset == 5 * chunk:
+                raise IOError("connection reset")
+            return append(f, cursor, *args, **kwargs)
+        pdbox.dbx.files_upload_session_append_v2 = \
+            files_upload_session_append_v2
+        assert_raises(IOError, models.LocalFile(path).upload, dest)
+        pdbox.dbx.files_upload_session_append_v2 = append
+        pdbox.dbx.calls = []
+
+    try:
+        with open(path, "wb") as f:
+            f.write(os.urandom(8 * chunk))
+        local = models.LocalFile(path)
+
+        # Trying again carries on from the last chunk that was received.
+        interrupted("dbx://resume")
+        assert local.upload("dbx://resume").hash == local.hash()
+        assert "files_upload_session_start" not in pdbox.dbx.calls
+        assert pdbox.dbx.calls.count("files_upload_session_append_v2") == 2
+
+        # Expired sessions start over.
+        interrupted("dbx://expired")
+        pdbox.dbx.sessions.clear()
+        assert local.upload("dbx://expired").hash == local.hash()
+        assert pdbox.dbx.calls.count("files_upload_session_start") == 1
+
+        # So do changed files.
+        interrupted("dbx://changed")
+        with open(path, "r+b") as f:
+            f.write(b"changed")
+        local = models.LocalFile(path)
+        assert local.upload("dbx://changed").hash == local.hash()
+        assert pdbox.dbx.calls.count("files_upload_session_start") == 1
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        os.remove(path)
+
+
+def test_adaptive_chunks():
+    mb = 1024 * 1024
+    assert pdbox.parsing.chunksize("auto") == "auto"
+    assert pdbox.parsing.chunksize("2.5") == 2.5
+    assert_raises(ArgumentTypeError, pdbox.parsing.chunksize, "big")
+
+    # Chunks grow and shrink towards CHUNK_SECONDS, within limits.
+    sizer = models.ChunkSizer(16 * mb, adaptive=True)
+    sizer.measure(16 * mb, 1.0)
+    assert sizer.size == 32 * mb
+    sizer.measure(32 * mb, 60.0)
+    assert sizer.size == 16 * mb
+    sizer.measure(mb, 60.0)  # The last chunk of a file says little.
+    assert sizer.size == 16 * mb
+    for _ in range(10):
+        sizer.measure(sizer.size, 0.1)
+    assert sizer.size == models.CHUNK_MAX
+    fixed = models.ChunkSizer(mb)
+    fixed.measure(mb, 60.0)
+    assert fixed.size == mb
+
+    # The last size is where the next upload starts.
+    sizer.resize(models.CHUNK_MIN)
+    sizer.save()
+    assert models.ChunkSizer.tuned().size == models.CHUNK_MIN
+
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"chunksize": "auto"}
+    path = os.path.join(tempdir, "adaptive")
+    try:
+        with open(path, "wb") as f:
+            f.write(os.urandom(5 * models.CHUNK_MIN))
+        local = models.LocalFile(path)
+        assert local.upload("dbx://adaptive").hash == local.hash()
+        # Fake uploads are fast, so the chunks grew.
+        assert pdbox.dbx.largest > models.CHUNK_MIN
+        assert models.ChunkSizer.tuned().size > models.CHUNK_MIN
+    finally:
+        pdbox.dbx, pdbox._args = dbx, args
+        os.remove(path)
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+from nose.plugins.skip import SkipTest
+from . import tempdir
+
+# Most microseconds that importing what's needed to parse arguments may take.
+BUDGET = 100000
+# Modules that aren't needed until a command runs.
+HEAVY = ["dropbox", "requests", "sqlite3", "curses", "tabulate"]
+
+
+def importtime(statement, env=None):
+    """
+    Run statement in a new interpreter with -X importtime, and get the
+    cumulative import time in microseconds of each module that it imported.
+    """
+    if sys.version_info < (3, 7):
+        raise SkipTest("-X importtime needs Python 3.7")
+    env = dict(env or os.environ, PYTHONPATH=os.getcwd())
+    output = subprocess.check_output(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.STDOUT,
+        env=env,
+    ).decode()
+    times = {}
+    for line in output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[12:].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_parsing_is_light():
+    home = os.path.abspath(os.path.join(tempdir, "home"))
+    env = dict(os.environ, HOME=home, XDG_DATA_HOME=home)
+    times = importtime("import pdbox.parsing", env=env)
+    assert "pdbox.parsing" in times
+    for name in HEAVY + ["concurrent.futures", "pdbox.models", "pdbox.cli"]:
+        assert name not in times, "%s was imported" % name
+    assert times["pdbox.parsing"] < BUDGET, times["pdbox.parsing"]
+    assert not os.path.exists(home)  # Nothing is created on import.
+
+
+def test_commands_are_light():
+    # A command needs dropbox, but not the other commands, or anything that
+    # only they use.
+    times = importtime("import pdbox.cli.ls")
+    assert "pdbox.cli.ls" in times
+    others = ["cp", "mkdir", "mv", "progress", "rm", "rmdir", "sync"]
+    for name in ["pdbox.cli.%s" % other for other in others] + [
+        "sqlite3",
+        "curses",
+        "tabulate",
+        "pdbox.sync",
+        "pdbox.tui",
+    ]:
+        assert name not in times, "%s was imported" % name
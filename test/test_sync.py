@@ -0,0 +1,121 @@
+import os
+import pdbox
+import pdbox.hashing as hashing
+import pdbox.models as models
+import pdbox.sync as sync
+import shutil
+import time
+
+from pdbox.fake import FakeDropbox
+from . import tempdir
+
+
+def write(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(data)
+
+
+def test_sync():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    args, pdbox._args = pdbox._args, {"workers": 4}
+    tmp = pdbox.TMP_DOWNLOAD_DIR
+    pdbox.TMP_DOWNLOAD_DIR = os.path.join(tempdir, "synctmp")
+    folder = os.path.join(tempdir, "sync")
+    real = hashing.content_hashes
+    try:
+        os.mkdir(pdbox.TMP_DOWNLOAD_DIR)
+        for path in ["a", "b/c", "b/d/e", "f g/h"]:
+            write(os.path.join(folder, *path.split("/")), path)
+        local = models.LocalFolder(folder)
+
+        # Everything is uploaded into a new folder.
+        assert local.sync("dbx://Sync")
+        remote = models.RemoteFolder("/Sync")
+        for path in ["a", "b/c", "b/d/e", "f g/h"]:
+            assert pdbox.dbx.entries["/sync/" + path].size == len(path)
+
+        # Nothing changed, so nothing is uploaded or hashed twice.
+        hashed = []
+
+        def content_hashes(paths, **kwargs):
+            hashed.extend(paths)
+            return real(paths, **kwargs)
+        hashing.content_hashes = content_hashes
+        assert not sync.diff(local, remote)
+        assert len(hashed) == 4
+        assert not sync.diff(local, remote)
+        assert len(hashed) == 4
+        pdbox._args["trust_mtime"] = True
+        write(os.path.join(folder, "a"), "a")  # Rewrite without changes.
+        assert not sync.diff(local, remote)
+        assert len(hashed) == 4
+        del pdbox._args["trust_mtime"]
+        hashing.content_hashes = real
+
+        # Only the changes are planned.
+        write(os.path.join(folder, "b", "c"), "changed")
+        write(os.path.join(folder, "b", "new"), "new")
+        shutil.rmtree(os.path.join(folder, "b", "d"))
+        plan = sync.diff(local, remote, delete=True)
+        assert sorted(rel for rel, _ in plan.transfers) == ["b/c", "b/new"]
+        assert [e.path for e in plan.deletes] == ["/Sync/b/d"]
+        assert not plan.mkdirs
+        assert sync.run(plan)
+        assert "/sync/b/d/e" not in pdbox.dbx.entries
+        assert not sync.diff(local, remote, delete=True)
+
+        # Same size and a different modification time means hashing.
+        write(os.path.join(folder, "a"), "a")
+        past = time.time() - 1000
+        os.utime(os.path.join(folder, "a"), (past, past))
+        assert not sync.diff(local, remote)
+        write(os.path.join(folder, "a"), "z")
+        os.utime(os.path.join(folder, "a"), (past, past))
+        assert [rel for rel, _ in sync.diff(local, remote).transfers] == ["a"]
+
+        # A same-size change within the same second is still found.
+        write(os.path.join(folder, "a"), "y")
+        os.utime(os.path.join(folder, "a"), (past, past))
+        assert [rel for rel, _ in sync.diff(local, remote).transfers] == ["a"]
+        write(os.path.join(folder, "a"), "a")
+
+        # Remote hashes are compared without hashing anything.
+        assert remote.sync_remote("dbx://Copy")  # It's created.
+        copy = models.RemoteFolder("/Copy")
+        pdbox.dbx.entries["/copy/a"].content_hash = "0" * 64
+        hashing.content_hashes = content_hashes
+        assert [rel for rel, _ in sync.diff(remote, copy).transfers] == ["a"]
+        assert len(hashed) == 4
+        hashing.content_hashes = real
+
+        # A folder in place of a file is left alone, along with its contents.
+        shutil.rmtree(os.path.join(folder, "f g"))
+        write(os.path.join(folder, "f g"), "file")
+        write(os.path.join(folder, "b", "X"), "x")
+        plan = sync.diff(remote, local, delete=True)
+        assert plan.conflicts == ["f g"]
+        assert not [rel for rel, _ in plan.transfers if rel.startswith("f g")]
+        os.remove(os.path.join(folder, "f g"))
+
+        # So are paths that Dropbox can't tell apart.
+        write(os.path.join(folder, "b", "x"), "x")
+        plan = sync.diff(local, remote, delete=True)
+        assert plan.conflicts == ["b/X"]
+        assert not [rel for rel, _ in plan.transfers if "x" in rel.lower()]
+        os.remove(os.path.join(folder, "b", "X"))
+        os.remove(os.path.join(folder, "b", "x"))
+
+        # Downloads keep their modification times, so they compare equal.
+        down = os.path.join(tempdir, "syncdown")
+        assert remote.sync(down)
+        plan = sync.diff(remote, models.LocalFolder(down))
+        assert not plan
+        with open(os.path.join(down, "b", "new")) as f:
+            assert f.read() == "new"
+    finally:
+        hashing.content_hashes = real
+        pdbox.dbx, pdbox._args = dbx, args
+        pdbox.TMP_DOWNLOAD_DIR = tmp
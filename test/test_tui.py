@@ -0,0 +1,151 @@
+import os
+import shutil
+import threading
+import time
+
+import pdbox
+import pdbox.metadata
+from pdbox.fake import FakeDropbox
+from pdbox.models import LocalFolder, RemoteFolder
+from pdbox.tui.folders import FolderCache, Search
+from pdbox.tui.loader import Loader
+from pdbox.tui.tui import WorkingDirectory
+from . import tempdir
+
+
+def poll(loader, name):
+    """Poll loader until the job name is over, and get what arrived."""
+    received = []
+    while True:
+        for job, page, error in loader.poll():
+            received.append((job.name, page, error))
+        if not loader.busy(name):
+            return received
+        time.sleep(0.01)
+
+
+def test_loader():
+    loader = Loader()
+    loader.start("a", iter([[1, 2], [3]]))
+    assert poll(loader, "a") == [("a", [1, 2], None), ("a", [3], None), (
+        "a", None, None,
+    )]
+
+    # Starting another job with the same name abandons the first one.
+    release = threading.Event()
+
+    def slow():
+        yield [1]
+        release.wait()
+        yield [2]
+
+    loader.start("a", slow())
+    loader.start("a", iter([["new"]]))
+    release.set()
+    assert poll(loader, "a") == [("a", ["new"], None), ("a", None, None)]
+
+    # Errors end a job.
+    def broken():
+        yield [1]
+        raise ValueError("nope")
+
+    loader.start("b", broken())
+    received = poll(loader, "b")
+    assert received[0] == ("b", [1], None)
+    assert received[1][1] is None
+    assert isinstance(received[1][2], ValueError)
+
+
+def test_folder_cache():
+    cache = FolderCache(size=2)
+    contents = [1, 2]
+    cache.put("/a", contents)
+    contents.append(3)  # What's cached doesn't change with the listing.
+    assert cache.get("/a") == [1, 2]
+    assert cache.get("/nothing") is None
+
+    # The least recently used folder is forgotten first.
+    cache.put("/b", [])
+    cache.get("/a")
+    cache.put("/c", [3])
+    assert "/b" not in cache
+    assert "/a" in cache and cache.get("/c") == [3]
+
+    # Out of date contents aren't used.
+    cache.ttl = -1
+    assert "/a" not in cache
+    assert cache.get("/a") is None
+    cache.ttl = 60
+    assert cache.get("/a") is None
+    assert cache.get("/c") == [3]
+
+
+class Window(object):
+    """Just enough of a curses window for a WorkingDirectory."""
+    def getmaxyx(self):
+        return 10, 40
+
+
+def test_failed_prefetch():
+    root = os.path.join(tempdir, "tui")
+    listed = []
+
+    class Broken(LocalFolder):
+        def pages(self):  # A generator, like the real ones.
+            listed.append(self.path)
+            raise OSError("nope")
+            yield
+
+    loader = Loader()
+    try:
+        os.makedirs(os.path.join(root, "broken"))
+        wd = WorkingDirectory(LocalFolder(root), Window(), loader, "local")
+        wd.show([Broken(os.path.join(root, "broken"))])
+
+        def tick():
+            wd.prefetch()
+            while loader.jobs:
+                for job, page, error in loader.poll():
+                    wd.receive(job, page, error)
+                time.sleep(0.01)
+
+        # A folder that can't be listed isn't tried on every tick.
+        for _ in range(5):
+            tick()
+        assert len(listed) == 1
+        assert os.path.abspath(tempdir) in wd.cache  # The parent's fine.
+
+        # Reloading tries again.
+        wd.forget()
+        tick()
+        assert len(listed) == 2
+    finally:
+        shutil.rmtree(root)
+
+
+def test_back_to_search():
+    dbx, pdbox.dbx = pdbox.dbx, FakeDropbox()
+    pdbox.metadata.reset_memo()
+    try:
+        pdbox.dbx.add_folder("/X")
+        pdbox.dbx.add_folder("/X/Y")
+        pdbox.dbx.add_folder("/X/Y/Z")
+        root = RemoteFolder("/")
+        wd = WorkingDirectory(root, Window(), Loader(), "remote")
+        found = RemoteFolder(None, meta=pdbox.dbx.files_get_metadata("/X/Y/Z"))
+        wd.cache.put(wd.key(Search("z", root).path), [found])
+        wd.cache.put(wd.key(found.path), [])
+        del pdbox.dbx.calls[:]  # Only the root is listed from here.
+
+        # A folder opened from search results goes back to them, rather than
+        # to its parent, without looking the parent up.
+        wd.search("z")
+        wd.cd()
+        assert wd.folder.path == "/X/Y/Z"
+        wd.back()
+        assert wd.searching()
+        wd.back()
+        assert wd.folder is root
+        assert "files_get_metadata" not in pdbox.dbx.calls
+    finally:
+        pdbox.dbx = dbx
@@ -1,5 +1,12 @@
+import dropbox
 import os
+import pdbox
 import pdbox.utils as utils
+import requests
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from nose.tools import assert_raises
 from . import nofile, testfile
@@ -29,8 +36,98 @@ def test_execute():
     assert isinstance(execute(os.stat, testfile), os.stat_result)
 
 
+def test_execute_retries():
+    exceptions = dropbox.exceptions
+    session, pdbox.session = pdbox.session, utils.session()
+    args, pdbox._args = pdbox._args, {"retries": 3}
+    sleep = time.sleep
+    delays = []
+    time.sleep = delays.append
+    errors = []
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    try:
+        # Rate limited requests wait as long as they're told to.
+        errors[:] = [
+            exceptions.RateLimitError("id", backoff=10),
+            exceptions.InternalServerError("id", 503, ""),
+            requests.exceptions.ConnectionError("connection reset"),
+        ]
+        assert utils.execute(flaky) == "ok"
+        assert 10 <= delays[0] <= 11
+        assert 0 <= delays[1] <= 2 * utils.RETRY_DELAY
+        assert 0 <= delays[2] <= 4 * utils.RETRY_DELAY
+        assert utils.connection_stats(pdbox.session)["retries"] == 3
+
+        # Requests give up once the retries run out.
+        errors[:] = [exceptions.InternalServerError("id", 500, "")] * 4
+        assert_raises(utils.DropboxError, utils.execute, flaky)
+        assert not errors
+        assert utils.connection_stats(pdbox.session)["retries"] == 6
+
+        # Anything else isn't retried.
+        errors[:] = [ValueError("not transient"), ValueError()]
+        assert_raises(ValueError, utils.execute, flaky)
+        assert len(errors) == 1
+    finally:
+        time.sleep = sleep
+        pdbox.session, pdbox._args = session, args
+
+
 def test_dbx_uri():
     dbx_uri = utils.dbx_uri
     assert dbx_uri("") == "dbx://"
     assert dbx_uri("/") == "dbx://"
     assert dbx_uri(os.path.join("hello", "world")) == "dbx://hello/world"
+
+
+def test_session():
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+    except ImportError:  # Python 2.
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+        from SocketServer import ThreadingMixIn
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep connections alive.
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    args, pdbox._args = pdbox._args, {"workers": 4}
+    try:
+        session = utils.session()
+        url = "http://127.0.0.1:%d/" % server.server_address[1]
+        # Four threads need at most four connections between them.
+        with ThreadPoolExecutor(max_workers=4) as p:
+            assert all(r.ok for r in p.map(session.get, [url] * 40))
+        stats = utils.connection_stats(session)
+        assert stats["requests"] == 40
+        assert stats["connections"] <= 4
+        assert stats["reused"] == 40 - stats["connections"]
+
+        # Counts survive the pools being evicted.
+        session.adapters["http://"].poolmanager.clear()
+        assert utils.connection_stats(session) == stats
+    finally:
+        pdbox._args = args
+        server.shutdown()
+        server.server_close()